@@ -0,0 +1,75 @@
+"""Партии закупок для расчета себестоимости проданного товара.
+
+Каждая закупка добавляет партию [количество, цена за единицу, id закупки]
+в очередь (deque) своего товара. Продажа и списание забирают товар из
+партий по методу FIFO - с начала очереди, поэтому каждая исчерпанная
+партия снимается за O(1). Метод "average" (средневзвешенная цена)
+держит на товар одну партию с пересчитываемой ценой.
+
+Очереди хранятся прямо в данных базы (ключ - id товара строкой, как
+в JSON) и сохраняются в файл вместе с ними.
+"""
+from collections import deque
+
+COST_METHODS = ("fifo", "average")
+
+
+class CostLots:
+    def __init__(self, lots, method="fifo"):
+        self.lots = lots
+        self.method = method if method in COST_METHODS else "fifo"
+        self.last_cost = {}  # товар -> цена последней партии (для товара сверх учтенных партий)
+        self.on_change = None  # callback(товар, копия очереди до изменения или None) - для отмены
+        for key, product_lots in lots.items():
+            lots[key] = deque(list(lot) for lot in product_lots)
+            if lots[key]:
+                self.last_cost[key] = lots[key][-1][1]
+
+    def _queue(self, product_id):
+        key = str(product_id)
+        if self.on_change is not None:
+            queue = self.lots.get(key)
+            self.on_change(key, deque(list(lot) for lot in queue) if queue is not None else None)
+        return self.lots.setdefault(key, deque())
+
+    def add(self, product_id, quantity, unit_cost, purchase_id=None):
+        """Новая партия товара"""
+        if quantity <= 0:
+            return
+        queue = self._queue(product_id)
+        if self.method == "average" and queue:
+            lot = queue[0]
+            total = lot[0] + quantity
+            lot[1] = (lot[0] * lot[1] + quantity * unit_cost) / total
+            lot[0] = total
+            lot[2] = purchase_id
+        else:
+            queue.append([quantity, unit_cost, purchase_id])
+        self.last_cost[str(product_id)] = queue[-1][1]
+
+    def consume(self, product_id, quantity):
+        """Списать товар из партий, вернуть себестоимость списанного количества"""
+        queue = self._queue(product_id)
+        cost = 0
+        remaining = quantity
+        while remaining > 0 and queue:
+            lot = queue[0]
+            taken = min(lot[0], remaining)
+            cost += taken * lot[1]
+            remaining -= taken
+            lot[0] -= taken
+            if lot[0] == 0:
+                queue.popleft()
+        if remaining > 0:
+            # Товар без учтенной партии (остатки до начала учета, ручные правки)
+            cost += remaining * self.last_cost.get(str(product_id), 0)
+        return cost
+
+    def replace(self, key, queue):
+        """Заменить очередь товара (None - убрать), вернуть прежнюю очередь"""
+        previous = self.lots.pop(key, None)
+        if queue is not None:
+            self.lots[key] = queue
+            if queue:
+                self.last_cost[key] = queue[-1][1]
+        return previous
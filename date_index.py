@@ -0,0 +1,63 @@
+"""Индекс записей журнала по времени.
+
+Записи хранятся упорядоченными по метке времени (секунды эпохи) в
+параллельных массивах, поэтому запрос за период (день, месяц,
+последние N секунд) выполняется двоичным поиском: O(log n + k).
+"""
+import bisect
+from array import array
+from datetime import datetime, date
+
+
+def to_timestamp(value):
+    """Метка времени из ISO-строки, date или datetime (None - если не разобрать)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day).timestamp()
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class DateIndex:
+    def __init__(self, entries=()):
+        self.timestamps = array('d')
+        self.entries = []
+        self.add_many(entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        """Добавить запись; новые записи обычно попадают в конец - O(1)"""
+        timestamp = to_timestamp(entry.get("date"))
+        if timestamp is None:
+            return
+        if not self.timestamps or timestamp >= self.timestamps[-1]:
+            self.timestamps.append(timestamp)
+            self.entries.append(entry)
+        else:
+            position = bisect.bisect_right(self.timestamps, timestamp)
+            self.timestamps.insert(position, timestamp)
+            self.entries.insert(position, entry)
+
+    def add_many(self, entries):
+        pairs = [(to_timestamp(entry.get("date")), entry) for entry in entries]
+        pairs = [pair for pair in pairs if pair[0] is not None]
+        if not pairs:
+            return
+        if self.entries:
+            pairs.extend(zip(self.timestamps, self.entries))
+        pairs.sort(key=lambda pair: pair[0])
+        self.timestamps = array('d', (timestamp for timestamp, _ in pairs))
+        self.entries = [entry for _, entry in pairs]
+
+    def range(self, start=None, end=None):
+        """Записи с меткой времени в [start, end) (None - без ограничения)"""
+        low = 0 if start is None else bisect.bisect_left(self.timestamps, to_timestamp(start))
+        high = len(self.timestamps) if end is None else bisect.bisect_left(self.timestamps, to_timestamp(end))
+        return self.entries[low:high]
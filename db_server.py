@@ -0,0 +1,404 @@
+"""Сервер базы данных для работы нескольких касс с одним складом.
+
+Сервер единолично владеет файлом базы данных: запросы всех касс
+выполняются по очереди, изменения записываются на диск пакетами,
+а подключенные клиенты получают уведомления об изменениях.
+
+Запуск сервера:
+    python db_server.py --host 0.0.0.0 --port 8765 --file database.json
+
+Подключение кассы:
+    python main.py --server 192.168.1.10:8765
+
+Протокол - JSON-сообщения, по одному на строку:
+    запрос:      {"id": 1, "method": "add_sale", "params": [{...}]}
+    ответ:       {"id": 1, "result": true, "params": [{...}]}
+    уведомление: {"event": "changed", "version": 42, "changes": [{...}]}
+"""
+import sys
+import json
+import socket
+import argparse
+import threading
+import socketserver
+
+from undo_history import UndoHistory
+
+DEFAULT_PORT = 8765
+
+# Методы DatabaseManager, доступные клиентам
+READ_METHODS = {
+    "get_products", "get_product", "find_by_code", "is_code_available",
+    "get_sales", "get_purchases", "get_sales_since", "get_purchases_since",
+    "get_sales_for_day", "get_purchases_for_day", "get_recent_sales", "get_recent_purchases",
+    "get_last_sale_id", "get_receipt", "get_returnable", "get_product_names", "get_write_off_reasons",
+    "get_product_movements", "get_last_purchase_price", "get_expiring", "stock_as_of",
+    "get_suppliers", "find_suppliers", "get_locations", "stock_at", "get_location_stock", "get_transfers",
+    "search_products", "filter_by_category", "can_undo", "can_redo", "history_label",
+}
+WRITE_METHODS = {
+    "add_product", "add_sale", "add_receipt", "add_return", "add_purchase", "receive_purchase_order",
+    "update_product", "bulk_update", "adjust_quantity", "delete_product", "add_write_off_reason",
+    "add_location", "transfer", "undo", "redo",
+}
+
+
+def encode(message):
+    """Сообщение протокола: JSON-строка с переводом строки"""
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class DatabaseServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, db, commit_interval=0.5):
+        super().__init__(address, DatabaseRequestHandler)
+        self.db = db
+        self.db.autosave = False  # Запись на диск выполняет поток commit_loop
+        self.db.add_listener(self._on_change)
+        self.lock = threading.Lock()
+        self.commit_interval = commit_interval
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+        self._changes = []
+        self._stopped = threading.Event()
+        self._committer = threading.Thread(target=self._commit_loop, daemon=True)
+        self._committer.start()
+
+    def _on_change(self, event):
+        """Накопление изменений текущего запроса для рассылки клиентам"""
+        self._changes.append(event)
+
+    def _commit_loop(self):
+        """Пакетная запись изменений на диск
+
+        Изменения файла другими программами сливаются в данные и без
+        записи (проверка - по времени изменения и размеру файла), их
+        события рассылаются всем клиентам.
+        """
+        while not self._stopped.wait(self.commit_interval):
+            with self.lock:
+                self._changes = []
+                self.db.check_external_changes()
+                self.db.commit()
+                changes = self._changes
+                self._changes = []
+                version = self.db.version
+            if changes:
+                self.broadcast({"event": "changed", "version": version, "changes": changes})
+
+    def execute(self, origin, request):
+        """Выполнить запрос клиента (все запросы выполняются последовательно)
+
+        Ответ сериализуется под блокировкой, пока данные не изменил
+        запрос другого клиента. У каждого клиента своя история отмены:
+        undo отменяет последнюю операцию этой кассы, а не чужую.
+        """
+        method = request["method"]
+        params = request.get("params", [])
+        with self.lock:
+            self.db.history = origin.history
+            self._changes = []
+            if method == "batch":
+                result = self._execute_batch(params[0])
+            elif method == "commit":
+                result = self.db.commit()
+            elif method in READ_METHODS or method in WRITE_METHODS:
+                result = getattr(self.db, method)(*params)
+            else:
+                raise ValueError(f"Неизвестный метод: {method}")
+            changes = self._changes
+            self._changes = []
+            version = self.db.version
+            response = encode({"id": request.get("id"), "result": result, "params": params,
+                               "changes": changes})
+
+        # История отмены - своя у каждого клиента, ее изменения остальным не рассылаются
+        changes = [change for change in changes if change["collection"] != "history"]
+        if changes:
+            self.broadcast({"event": "changed", "version": version, "changes": changes}, exclude=origin)
+        return response
+
+    def _execute_batch(self, calls):
+        """Выполнить несколько изменений одной транзакцией"""
+        results = []
+        with self.db.transaction() as tx:
+            for method, params in calls:
+                if method not in WRITE_METHODS:
+                    raise ValueError(f"Метод {method} недоступен в транзакции")
+                result = getattr(self.db, method)(*params)
+                results.append(result)
+                if not result:
+                    tx.rollback()
+                    break
+        return {"ok": tx.ok, "results": results, "params": [params for _, params in calls]}
+
+    def broadcast(self, message, exclude=None):
+        """Разослать уведомление подключенным клиентам"""
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            if client is not exclude:
+                client.send(message)
+
+    def shutdown(self):
+        self._stopped.set()
+        super().shutdown()
+        with self.lock:
+            self.db.commit()
+
+
+class DatabaseRequestHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.send_lock = threading.Lock()
+        self.history = UndoHistory()  # Отмена операций этого клиента
+        with self.server.clients_lock:
+            self.server.clients.add(self)
+
+    def finish(self):
+        with self.server.clients_lock:
+            self.server.clients.discard(self)
+        super().finish()
+
+    def send(self, message):
+        data = message if isinstance(message, bytes) else encode(message)
+        try:
+            with self.send_lock:
+                self.wfile.write(data)
+                self.wfile.flush()
+        except OSError:
+            pass
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            request = {}
+            try:
+                request = json.loads(line)
+                self.send(self.server.execute(self, request))
+            except Exception as e:
+                print(f"Ошибка выполнения запроса: {e}")
+                self.send({"id": request.get("id"), "error": str(e)})
+
+
+class RemoteDatabaseManager:
+    """Клиент сервера базы данных с тем же интерфейсом, что и DatabaseManager
+
+    Результаты чтения кэшируются и сбрасываются при уведомлении
+    сервера об изменениях.
+    """
+
+    def __init__(self, host, port=DEFAULT_PORT, timeout=10):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.version = 0
+        self._sock = socket.create_connection(self.address, timeout=timeout)
+        self._sock.settimeout(None)
+        self._rfile = self._sock.makefile("rb")
+        self._send_lock = threading.Lock()
+        self._next_id = 0
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._listeners = []
+        self._batch = None
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+        print(f"Подключено к серверу {host}:{port}")
+
+    def _read_loop(self):
+        """Прием ответов и уведомлений сервера"""
+        for line in self._rfile:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if "event" in message:
+                self._on_event(message)
+                continue
+            with self._pending_lock:
+                waiter = self._pending.pop(message.get("id"), None)
+            if waiter is not None:
+                waiter["response"] = message
+                waiter["done"].set()
+        # Соединение закрыто - будим все ожидающие запросы
+        with self._pending_lock:
+            waiters = list(self._pending.values())
+            self._pending.clear()
+        for waiter in waiters:
+            waiter["done"].set()
+
+    def _on_event(self, message):
+        """Уведомление сервера: сбрасываем кэш и оповещаем подписчиков"""
+        self.clear_cache()
+        self._dispatch(message.get("changes", []), external=True)
+
+    def _dispatch(self, changes, external=False):
+        for change in changes:
+            self.version = max(self.version, change.get("version", 0))
+            event = dict(change, external=True) if external else change
+            for callback in list(self._listeners):
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"Ошибка обработчика изменений: {e}")
+
+    def _call(self, method, params):
+        with self._pending_lock:
+            self._next_id += 1
+            request_id = self._next_id
+            waiter = {"done": threading.Event(), "response": None}
+            self._pending[request_id] = waiter
+        with self._send_lock:
+            self._sock.sendall(encode({"id": request_id, "method": method, "params": params}))
+        if not waiter["done"].wait(self.timeout) or waiter["response"] is None:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            raise ConnectionError(f"Сервер {self.address[0]}:{self.address[1]} не отвечает")
+        response = waiter["response"]
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    @staticmethod
+    def _copy_back(params, server_params):
+        """Перенос изменений аргументов (id, date...) обратно в объекты вызывающего кода"""
+        for local, remote in zip(params, server_params):
+            if isinstance(local, dict) and isinstance(remote, dict):
+                local.update(remote)
+
+    def _read(self, method, *params):
+        key = (method, json.dumps(params, ensure_ascii=False))
+        with self._cache_lock:
+            if key in self._cache:
+                return self._cache[key]
+        result = self._call(method, list(params))["result"]
+        with self._cache_lock:
+            self._cache[key] = result
+        return result
+
+    def _write(self, method, *params):
+        if self._batch is not None:
+            self._batch.append((method, list(params)))
+            return True
+        try:
+            response = self._call(method, list(params))
+        except (OSError, RuntimeError) as e:
+            print(f"Ошибка сервера: {e}")
+            return False
+        self._copy_back(params, response.get("params", []))
+        self.clear_cache()
+        self._dispatch(response.get("changes", []))
+        return response["result"]
+
+    def __getattr__(self, name):
+        if name in READ_METHODS:
+            return lambda *params: self._read(name, *params)
+        if name in WRITE_METHODS:
+            return lambda *params: self._write(name, *params)
+        raise AttributeError(name)
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    def transaction(self):
+        """Изменения внутри блока отправляются на сервер одним пакетом"""
+        return RemoteTransaction(self)
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def save_data(self):
+        """Попросить сервер записать накопленные изменения"""
+        try:
+            return self._call("commit", [])["result"]
+        except (OSError, RuntimeError) as e:
+            print(f"Ошибка сервера: {e}")
+            return False
+
+    def close(self):
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+
+
+class RemoteTransaction:
+    """Транзакция RemoteDatabaseManager: пакет изменений выполняется сервером атомарно"""
+
+    def __init__(self, db):
+        self.db = db
+        self.ok = True
+        self._outer = None
+
+    def rollback(self):
+        self.ok = False
+
+    def __enter__(self):
+        self._outer = self.db._batch
+        if self._outer is None:
+            self.db._batch = []
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._outer is not None:
+            # Вложенная транзакция - изменения уходят в пакет внешней
+            return False
+        calls = self.db._batch
+        self.db._batch = None
+        if exc_type is not None or not self.ok:
+            self.ok = False
+            return False
+        if not calls:
+            return False
+        try:
+            response = self.db._call("batch", [calls])
+        except (OSError, RuntimeError) as e:
+            print(f"Ошибка сервера: {e}")
+            self.ok = False
+            return False
+        result = response["result"]
+        for (_, params), server_params in zip(calls, result["params"]):
+            self.db._copy_back(params, server_params)
+        self.db.clear_cache()
+        self.db._dispatch(response.get("changes", []))
+        self.ok = result["ok"]
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сервер базы данных склада")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--file", default="database.json")
+    parser.add_argument("--commit-interval", type=float, default=0.5,
+                        help="Интервал пакетной записи на диск, сек.")
+    args = parser.parse_args()
+
+    from main import DatabaseManager
+
+    db = DatabaseManager(args.file)
+    server = DatabaseServer((args.host, args.port), db, args.commit_interval)
+    print(f"Сервер базы данных запущен на {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        print("Сервер остановлен")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
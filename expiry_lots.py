@@ -0,0 +1,125 @@
+"""Партии товара со сроком годности.
+
+Закупка со сроком годности добавляет партию [количество, срок, id закупки]
+в список партий своего товара, упорядоченный по сроку ('2026-10-19').
+Продажа и списание забирают товар по методу FEFO - сначала из партий с
+ближайшим сроком, то есть с начала списка; списание выбранных партий
+забирает товар именно из них.
+
+Сроки партий всех товаров собраны в min-heap (срок, товар, id закупки):
+истекающие партии читаются с вершины кучи, без просмотра всех партий.
+Исчерпанные партии удаляются из кучи лениво - когда до них доходит
+чтение.
+
+Партии хранятся прямо в данных базы (ключ - id товара строкой, как в
+JSON) и сохраняются в файл вместе с ними.
+"""
+import heapq
+import bisect
+
+EXPIRY_WARNING_DAYS = 7  # За сколько дней партия считается истекающей
+
+
+class ExpiryLots:
+    def __init__(self, lots):
+        self.lots = lots
+        self.on_change = None  # callback(товар, копия партий до изменения или None) - для отмены
+        for product_lots in lots.values():
+            product_lots.sort(key=lambda lot: lot[1])
+        self._heap = [(lot[1], key, lot[2]) for key, product_lots in lots.items() for lot in product_lots]
+        heapq.heapify(self._heap)
+
+    def _lots(self, key):
+        if self.on_change is not None:
+            lots = self.lots.get(key)
+            self.on_change(key, [list(lot) for lot in lots] if lots is not None else None)
+        return self.lots.setdefault(key, [])
+
+    def add(self, product_id, quantity, expiry, purchase_id):
+        """Партия со сроком годности expiry (повторно - пополнение той же партии при возврате)"""
+        if quantity <= 0 or not expiry:
+            return
+        key = str(product_id)
+        lots = self._lots(key)
+        for lot in lots:
+            if lot[1] == expiry and lot[2] == purchase_id:
+                lot[0] += quantity
+                return
+        position = bisect.bisect_right([lot[1] for lot in lots], expiry)
+        lots.insert(position, [quantity, expiry, purchase_id])
+        heapq.heappush(self._heap, (expiry, key, purchase_id))
+
+    def allocate(self, product_id, quantity):
+        """Забрать товар из партий по FEFO: [[id закупки, срок, количество], ...]
+
+        Количество сверх партий со сроком (товар без срока годности) не
+        распределяется.
+        """
+        key = str(product_id)
+        if not self.lots.get(key):
+            return []
+        lots = self._lots(key)
+        allocation = []
+        while quantity > 0 and lots:
+            lot = lots[0]
+            taken = min(lot[0], quantity)
+            allocation.append([lot[2], lot[1], taken])
+            lot[0] -= taken
+            quantity -= taken
+            if lot[0] == 0:
+                lots.pop(0)
+        if not lots:
+            del self.lots[key]
+        return allocation
+
+    def take(self, product_id, requested):
+        """Забрать товар из указанных партий [[id закупки, срок, количество], ...]
+
+        Возвращает распределение в том же виде - сколько товара в этих
+        партиях действительно было.
+        """
+        key = str(product_id)
+        if not requested or not self.lots.get(key):
+            return []
+        lots = self._lots(key)
+        allocation = []
+        for purchase_id, expiry, quantity in requested:
+            for position, lot in enumerate(lots):
+                if lot[1] == expiry and lot[2] == purchase_id:
+                    taken = min(lot[0], quantity)
+                    if taken > 0:
+                        allocation.append([purchase_id, expiry, taken])
+                        lot[0] -= taken
+                    if lot[0] == 0:
+                        del lots[position]
+                    break
+        if not lots:
+            del self.lots[key]
+        return allocation
+
+    def replace(self, key, lots):
+        """Заменить партии товара (None - убрать), вернуть прежние партии"""
+        previous = self.lots.pop(key, None)
+        if lots:
+            self.lots[key] = lots
+            for lot in lots:
+                heapq.heappush(self._heap, (lot[1], key, lot[2]))
+        return previous
+
+    def expiring(self, until):
+        """Партии со сроком не позже until: [(id товара, партия), ...] по возрастанию срока"""
+        result = []
+        valid = set()
+        while self._heap and self._heap[0][0] <= until:
+            entry = heapq.heappop(self._heap)
+            if entry in valid:
+                continue  # Партия попала в кучу повторно (откат, возврат)
+            expiry, key, purchase_id = entry
+            lot = next((lot for lot in self.lots.get(key, ()) if lot[1] == expiry and lot[2] == purchase_id), None)
+            if lot is None:
+                continue  # Партия исчерпана - запись кучи больше не нужна
+            valid.add(entry)
+            result.append((int(key), lot))
+        for entry in valid:
+            heapq.heappush(self._heap, entry)
+        return result
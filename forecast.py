@@ -0,0 +1,114 @@
+"""Прогноз спроса и точки заказа для закупок.
+
+Продажи за последние window_days дней раскладываются в матрицу
+«товар × день» (плоский массив array('d')), после чего все показатели
+считаются сразу по всем товарам проходом по дням:
+    - скорость продаж (среднее в день),
+    - экспоненциальное сглаживание дневных продаж (прогноз на день),
+    - разброс дневных продаж (для страхового запаса).
+Точка заказа = прогноз × срок поставки + страховой запас.
+
+Результат кэшируется до появления новых продаж (или до смены дня).
+"""
+import math
+from array import array
+from datetime import date, timedelta
+
+WINDOW_DAYS = 28
+SMOOTHING = 0.3  # Коэффициент экспоненциального сглаживания
+LEAD_TIME_DAYS = 7  # Срок поставки
+REVIEW_DAYS = 7  # Через сколько дней следующая закупка
+SERVICE_FACTOR = 1.65  # ~95% дней без дефицита
+
+
+class DemandForecast:
+    def __init__(self, db, window_days=WINDOW_DAYS, smoothing=SMOOTHING,
+                 lead_time_days=LEAD_TIME_DAYS, review_days=REVIEW_DAYS, service_factor=SERVICE_FACTOR):
+        self.db = db
+        self.window_days = window_days
+        self.smoothing = smoothing
+        self.lead_time_days = lead_time_days
+        self.review_days = review_days
+        self.service_factor = service_factor
+        self._cache_key = None
+        self._forecast = {}
+
+    def forecast(self):
+        """Показатели спроса по товарам: id -> {velocity, daily, deviation}"""
+        key = (self.db.get_last_sale_id(), date.today())
+        if key != self._cache_key:
+            self._forecast = self._compute()
+            self._cache_key = key
+        return self._forecast
+
+    def _compute(self):
+        days = self.window_days
+        first_day = date.today() - timedelta(days=days - 1)
+        sales = self.db.get_sales(first_day.isoformat())
+
+        # Матрица продаж: строка - товар, столбец - день
+        rows = {}
+        matrix = array('d')
+        zero_row = array('d', [0.0]) * days
+        for sale in sales:
+            if sale.get('type', 'Продажа') != 'Продажа':
+                continue  # Списания - не спрос
+            day = (date.fromisoformat(sale['date'][:10]) - first_day).days
+            if not 0 <= day < days:
+                continue
+            row = rows.get(sale['product_id'])
+            if row is None:
+                row = rows[sale['product_id']] = len(rows)
+                matrix.extend(zero_row)
+            matrix[row * days + day] += sale['quantity']
+
+        count = len(rows)
+        columns = [matrix[day::days] for day in range(days)]  # Продажи всех товаров за день
+        totals = [0.0] * count
+        squares = [0.0] * count
+        for column in columns:
+            totals = [total + value for total, value in zip(totals, column)]
+            squares = [square + value * value for square, value in zip(squares, column)]
+        means = [total / days for total in totals]
+
+        # Сглаживание стартует со среднего, последние дни весят больше
+        levels = means
+        alpha = self.smoothing
+        for column in columns:
+            levels = [alpha * value + (1 - alpha) * level for level, value in zip(levels, column)]
+
+        result = {}
+        for product_id, row in rows.items():
+            variance = max(squares[row] / days - means[row] * means[row], 0.0)
+            result[product_id] = {
+                "velocity": means[row],
+                "daily": levels[row],
+                "deviation": math.sqrt(variance),
+            }
+        return result
+
+    def suggestions(self, products):
+        """Рекомендуемые закупки: товары, остаток которых ниже точки заказа"""
+        forecast = self.forecast()
+        result = []
+        for product in products:
+            demand = forecast.get(product['id'])
+            if demand is None:
+                continue
+            safety_stock = self.service_factor * demand["deviation"] * math.sqrt(self.lead_time_days)
+            reorder_point = demand["daily"] * self.lead_time_days + safety_stock
+            if product['quantity'] > reorder_point:
+                continue
+            target = reorder_point + demand["daily"] * self.review_days
+            quantity = math.ceil(target - product['quantity'])
+            if quantity > 0:
+                result.append({
+                    "product_id": product['id'],
+                    "name": product['name'],
+                    "quantity": product['quantity'],
+                    "velocity": demand["velocity"],
+                    "reorder_point": math.ceil(reorder_point),
+                    "suggested": quantity,
+                })
+        result.sort(key=lambda item: item["quantity"] - item["reorder_point"])
+        return result
@@ -0,0 +1,192 @@
+"""Архив журналов продаж и закупок, разбитый по месяцам.
+
+Записи прошлых месяцев переносятся из основного файла базы в отдельные
+файлы архива (<база>_archive/sales-2025-11.json и т.п.). Манифест
+manifest.json хранит для каждого месяца число записей, диапазоны id и
+дат, списки товаров и чеков - по нему запросы пропускают месяцы, которые
+им не нужны. Файлы месяцев читаются только при первом обращении и затем
+кэшируются.
+"""
+import os
+import json
+import threading
+
+from date_index import DateIndex
+
+LEDGERS = ("sales", "purchases")
+MANIFEST_FILE = "manifest.json"
+
+
+def month_of(entry):
+    """Месяц записи журнала ('2025-11') по ее дате"""
+    date = entry.get("date") or ""
+    return date[:7] if len(date) >= 7 else None
+
+
+class LedgerArchive:
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest = {collection: {} for collection in LEDGERS}
+        self._loaded = {}  # (коллекция, месяц) -> записи
+        self._indexes = {}  # (коллекция, месяц) -> DateIndex
+        self._product_indexes = {}  # (коллекция, месяц) -> {id товара: записи}
+        self._receipt_indexes = {}  # (коллекция, месяц) -> {id чека: записи}
+        self._lock = threading.Lock()
+        self.load_manifest()
+
+    def load_manifest(self):
+        """Чтение манифеста архива (сами месяцы не загружаются)"""
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        try:
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Ошибка чтения манифеста архива: {e}")
+            return
+        for collection in LEDGERS:
+            self.manifest[collection] = manifest.get(collection, {})
+        with self._lock:
+            self._loaded.clear()
+            self._indexes.clear()
+            self._product_indexes.clear()
+            self._receipt_indexes.clear()
+
+    def months(self, collection, date_from=None, date_to=None):
+        """Месяцы архива, записи которых могут попасть в диапазон [date_from, date_to)"""
+        result = []
+        for month, info in sorted(self.manifest[collection].items()):
+            if date_from and info["last_date"] < date_from:
+                continue
+            if date_to and info["first_date"] >= date_to:
+                continue
+            result.append(month)
+        return result
+
+    def last_id(self, collection):
+        """Наибольший id записи в архиве"""
+        return max((info["last_id"] for info in self.manifest[collection].values()), default=0)
+
+    def is_empty(self, collection):
+        return not self.manifest[collection]
+
+    def load(self, collection, month):
+        """Записи одного месяца (файл читается при первом обращении)"""
+        key = (collection, month)
+        with self._lock:
+            if key not in self._loaded:
+                info = self.manifest[collection].get(month)
+                entries = self._read_entries(info["file"]) if info is not None else []
+                self._loaded[key] = entries
+                print(f"Загружен архив {collection} за {month}: {len(entries)} записей")
+            return self._loaded[key]
+
+    def index(self, collection, month):
+        """Индекс записей месяца по времени (строится при первом обращении)"""
+        key = (collection, month)
+        entries = self.load(collection, month)
+        with self._lock:
+            if key not in self._indexes:
+                self._indexes[key] = DateIndex(entries)
+            return self._indexes[key]
+
+    def product_months(self, collection, product_id):
+        """Месяцы архива, в которых есть записи по товару"""
+        return [month for month, info in sorted(self.manifest[collection].items())
+                if "products" not in info or product_id in info["products"]]
+
+    def product_entries(self, collection, month, product_id):
+        """Записи месяца по одному товару (индекс строится при первом обращении)"""
+        key = (collection, month)
+        entries = self.load(collection, month)
+        with self._lock:
+            if key not in self._product_indexes:
+                index = {}
+                for entry in entries:
+                    index.setdefault(entry.get("product_id"), []).append(entry)
+                self._product_indexes[key] = index
+            return self._product_indexes[key].get(product_id, [])
+
+    def receipt_months(self, collection, receipt_id, since=None):
+        """Месяцы архива (не раньше since), в которых есть строки чека"""
+        return [month for month, info in sorted(self.manifest[collection].items())
+                if (since is None or month >= since) and ("receipts" not in info or receipt_id in info["receipts"])]
+
+    def receipt_entries(self, collection, month, receipt_id):
+        """Строки чека в записях месяца (индекс строится при первом обращении)"""
+        key = (collection, month)
+        entries = self.load(collection, month)
+        with self._lock:
+            if key not in self._receipt_indexes:
+                index = {}
+                for entry in entries:
+                    if "receipt_id" in entry:
+                        index.setdefault(entry["receipt_id"], []).append(entry)
+                self._receipt_indexes[key] = index
+            return self._receipt_indexes[key].get(receipt_id, [])
+
+    def _read_entries(self, filename):
+        path = os.path.join(self.directory, filename)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            print(f"Ошибка чтения архива {path}: {e}")
+            return []
+
+    def entries(self, collection, date_from=None, date_to=None):
+        """Записи архива из месяцев, пересекающихся с диапазоном дат (по возрастанию id)"""
+        result = []
+        for month in self.months(collection, date_from, date_to):
+            result.extend(self.load(collection, month))
+        result.sort(key=lambda entry: entry.get("id", 0))
+        return result
+
+    def archive(self, collection, entries):
+        """Перенести записи в файлы их месяцев
+
+        Записи объединяются с уже заархивированными по id, поэтому
+        повторный перенос тех же записей ничего не дублирует. Манифест и
+        файлы месяцев перечитываются с диска - архив мог пополнить другой
+        процесс, работающий с той же базой.
+        """
+        by_month = {}
+        for entry in entries:
+            by_month.setdefault(month_of(entry), []).append(entry)
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.load_manifest()
+        for month, month_entries in by_month.items():
+            filename = f"{collection}-{month}.json"
+            existing = {entry["id"]: entry for entry in self._read_entries(filename)}
+            for entry in month_entries:
+                existing[entry["id"]] = entry
+            merged = sorted(existing.values(), key=lambda entry: entry["id"])
+            self._write_json(filename, merged)
+            with self._lock:
+                self._loaded[(collection, month)] = merged
+                self._indexes.pop((collection, month), None)
+                self._product_indexes.pop((collection, month), None)
+                self._receipt_indexes.pop((collection, month), None)
+            self.manifest[collection][month] = {
+                "file": filename,
+                "count": len(merged),
+                "first_id": merged[0]["id"],
+                "last_id": merged[-1]["id"],
+                "first_date": min(entry["date"] for entry in merged),
+                "last_date": max(entry["date"] for entry in merged),
+                "products": sorted({entry["product_id"] for entry in merged if "product_id" in entry}),
+                "receipts": sorted({entry["receipt_id"] for entry in merged if "receipt_id" in entry}),
+            }
+        self._write_json(MANIFEST_FILE, self.manifest)
+
+    def _write_json(self, filename, value):
+        """Атомарная запись файла архива через временный файл"""
+        path = os.path.join(self.directory, filename)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
@@ -1,17 +1,68 @@
 import sys
 import json
 import os
-from datetime import datetime
+import time
+import bisect
+import hashlib
+import functools
+import math
+from datetime import datetime, date, timedelta
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QMessageBox,
                              QInputDialog, QVBoxLayout, QHeaderView,
                              QAbstractItemView, QDialog, QTabWidget,
                              QWidget, QHBoxLayout, QPushButton, QStackedWidget,
                              QTableView, QSpinBox, QLineEdit, QLabel, QGroupBox,
-                             QFormLayout, QDateEdit, QComboBox)
-from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QDate
-from PyQt6.QtGui import QColor, QPalette, QStandardItemModel, QStandardItem
+                             QFormLayout, QDateEdit, QComboBox, QCompleter)
+from PyQt6.QtCore import (Qt, QAbstractTableModel, QModelIndex, QDate, pyqtSignal,
+                          QFileSystemWatcher, QTimer, QObject, QRunnable, QThreadPool,
+                          QSortFilterProxyModel, QStringListModel)
+from PyQt6.QtGui import QColor, QStandardItemModel, QStandardItem, QShortcut, QKeySequence
 from PyQt6 import uic
 from interface import Ui_MainWindow
+from search_index import ProductSearchIndex, MIN_QUERY_LENGTH
+from theme import apply_theme, styled, set_style_property
+from notifications import NotificationCenter
+from ledger_archive import LedgerArchive, LEDGERS, month_of
+from date_index import DateIndex, to_timestamp
+from stock_checkpoints import StockCheckpoints
+from cost_lots import CostLots
+from expiry_lots import ExpiryLots, EXPIRY_WARNING_DAYS
+from suppliers import SupplierTrie, supplier_key, SUPPLIER_TOTALS, PRICE_HISTORY
+from stock_locations import LocationStock, DEFAULT_LOCATION_ID, DEFAULT_LOCATIONS
+from forecast import DemandForecast
+from undo_history import UndoHistory, MISSING
+
+
+# Поля товара, по которым товар находится сканером
+CODE_FIELDS = ("sku", "barcode")
+
+# Поля товара, доступные для массового изменения, и операции над ними
+BULK_OPERATIONS = {"price": ("set", "percent", "round"), "category": ("set",), "description": ("set",)}
+BULK_TEXT_FIELDS = ("category", "description")  # Остальные поля массового изменения - числовые
+
+# Начальный справочник причин списания (код -> название); справочник хранится в data["write_off_reasons"],
+# записи списаний хранят только код причины
+WRITE_OFF_REASONS = {"damage": "Порча", "expired": "Истек срок годности", "defect": "Брак",
+                     "shortage": "Недостача", "other": "Другое"}
+
+# Версия формата записей архива продаж: архив старой версии переводится один раз при загрузке
+# (2 - в манифесте месяцев есть списки чеков, 3 - причины списания - коды справочника)
+ARCHIVE_FORMAT = 3
+
+
+def undoable(label):
+    """Изменение данных, отменяемое одним шагом истории (вложенные вызовы входят в шаг внешнего)"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            opened = self._begin_step(label)
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                if opened:
+                    self._end_step()
+        return wrapper
+    return decorator
 
 
 class DatabaseManager:
@@ -19,51 +70,1126 @@ class DatabaseManager:
         self.filename = filename
         self.data = {"products": [], "sales": [], "purchases": [], "last_id": 0, "last_sale_id": 0,
                      "last_purchase_id": 0}
+        self.autosave = True  # False - запись только через commit() (режим сервера)
+        self.version = 0  # Счетчик изменений данных
+        self._listeners = []
+        self._tx_depth = 0
+        self._tx_rollback = False
+        self._dirty = False
+        self.history = UndoHistory()  # Отмена и повтор операций
+        self._step = None  # Дельты текущей операции (None - вне операции)
+        self._step_label = None
+        self._product_index = {}  # id -> товар
+        self._code_index = {}  # артикул/штрихкод -> id товара
+        self._date_indexes = {}  # журнал -> DateIndex текущих (не архивных) записей
+        self._movement_index = {}  # журнал -> {id товара: текущие записи журнала по товару}
+        self._receipt_index = {}  # id чека -> заголовок чека
+        self._receipt_lines = {}  # id чека -> текущие (не архивные) строки продаж чека
+        self._returns_index = {}  # id чека продажи -> id чеков возврата по нему
+        self._supplier_index = {}  # id поставщика -> поставщик
+        self._supplier_keys = {}  # ключ названия поставщика -> id
+        self._supplier_trie = SupplierTrie()
+        # Несохраненные локальные изменения: (коллекция, id) -> отпечаток записи до изменения
+        self._pending = {}
+        self._file_signature = None  # (mtime, размер) файла после последней синхронизации
+        self._file_hash = None
+        self.last_conflicts = []
+        # Записи журналов за прошлые месяцы хранятся в архиве и читаются по требованию
+        self.archive = LedgerArchive(os.path.splitext(filename)[0] + "_archive")
+        self.checkpoints = StockCheckpoints(self.archive.directory)
         self.load_data()
 
     def load_data(self):
         """Загрузка данных из файла"""
         try:
             if os.path.exists(self.filename):
-                with open(self.filename, 'r', encoding='utf-8') as f:
-                    self.data = json.load(f)
+                with open(self.filename, 'rb') as f:
+                    raw = f.read()
+                self.data = json.loads(raw.decode('utf-8'))
+                self._pending.clear()
+                self.history.clear()
+                self._remember_file(hashlib.sha1(raw).hexdigest())
                 print(f"Данные загружены из {self.filename}")
+                migrated = self._migrate_ledger() | self._migrate_suppliers()
+                if migrated or self._needs_archiving():
+                    self._write_data()  # Перенос прошлых месяцев в архив
             else:
                 self.save_data()  # Создаем файл с начальными данными
                 print(f"Создан новый файл {self.filename}")
         except Exception as e:
             print(f"Ошибка загрузки данных: {e}")
             self.save_data()
+        self._rebuild_indexes()
+        self._notify("*", "reload")
+
+    def _rebuild_indexes(self):
+        """Перестроение индексов после загрузки данных"""
+        self._product_index = {p["id"]: p for p in self.data["products"]}
+        self._code_index = {}
+        for product in self.data["products"]:
+            self._index_codes(product)
+        self._index_receipts()
+        self._index_suppliers()
+        for collection in LEDGERS:
+            self._rebuild_ledger_indexes(collection)
+        self._init_cost_lots()
+        self._init_expiry_lots()
+        self._init_locations()
+
+    def _migrate_ledger(self):
+        """Перевод продаж старого формата - в основном файле и в архиве месяцев
+
+        Архив переводится один раз (версия - data["archive_format"]): все
+        месяцы продаж проходят те же миграции, что и основной файл, и
+        перезаписываются вместе с манифестом.
+        Возвращает True, если данные изменены.
+        """
+        archived = []
+        upgrade = self.data.get("archive_format", 0) < ARCHIVE_FORMAT
+        if upgrade and not self.archive.is_empty("sales"):
+            archived = self.archive.entries("sales")
+        sales = archived + self.data.get("sales", [])
+        migrated = self._migrate_sales(sales) | self._migrate_write_offs(sales)
+        if archived:
+            self.archive.archive("sales", archived)
+            print(f"Архив продаж переведен в текущий формат: {len(archived)} записей")
+        if upgrade:
+            self.data["archive_format"] = ARCHIVE_FORMAT
+        return migrated or upgrade
+
+    def _migrate_sales(self, sales):
+        """Перевод продаж старого формата в чеки: заголовок + компактные строки
+
+        Раньше каждая позиция корзины была отдельной продажей с названием
+        товара и типом. Позиции одного чека шли подряд, с одним типом и
+        почти одним временем - по этому признаку они объединяются в чек.
+        Название товара переносится в общий справочник product_names.
+        sales - продажи архива и основного файла по возрастанию id.
+        Возвращает True, если данные изменены.
+        """
+        old = [sale for sale in sales if "receipt_id" not in sale]
+        if not old:
+            return False
+        receipts = self.data.setdefault("receipts", [])
+        names = self.data.setdefault("product_names", {})
+        receipt = None
+        previous = None
+        for sale in old:
+            sale_type = sale.get("type", "Продажа")
+            if (receipt is None or sale_type != receipt["type"]
+                    or abs((to_timestamp(sale.get("date")) or 0) - (to_timestamp(previous.get("date")) or 0)) > 2):
+                receipt = {"id": self.get_next_receipt_id(), "date": sale.get("date", ""), "type": sale_type,
+                           "total": 0}
+                receipts.append(receipt)
+            sale["receipt_id"] = receipt["id"]
+            receipt["total"] += sale["quantity"] * sale["price"]
+            self._compact_sale(sale, names)
+            previous = sale
+        print(f"Продажи переведены в чеки: {len(old)} строк, {len(receipts)} чеков")
+        return True
+
+    def _migrate_write_offs(self, sales):
+        """Причины списания старого формата ("Списание: текст" в каждой записи) - в коды справочника
+
+        sales - продажи архива и основного файла, чеки берутся из основного.
+        Незнакомый текст причины добавляется в справочник новой причиной.
+        Возвращает True, если данные изменены.
+        """
+        prefix = "Списание: "
+        changed = False
+        for record in self.data.get("receipts", []) + sales:
+            record_type = record.get("type", "")
+            if record_type.startswith(prefix):
+                record["type"] = "Списание"
+                record["reason_code"] = self._reason_code(record_type[len(prefix):])
+                changed = True
+        return changed
+
+    def _reason_code(self, title):
+        """Код причины списания по названию (новая причина добавляется в справочник)"""
+        reasons = self.data.setdefault("write_off_reasons", dict(WRITE_OFF_REASONS))
+        for code, existing in reasons.items():
+            if existing.casefold() == title.casefold():
+                return code
+        number = len(reasons) + 1
+        while f"reason{number}" in reasons:
+            number += 1
+        code = f"reason{number}"
+        reasons[code] = title
+        self._record(("reason", code, MISSING))
+        return code
+
+    def _migrate_suppliers(self):
+        """Справочник поставщиков из названий в закупках (включая архив)
+
+        Написания одного поставщика объединяются по ключу названия,
+        основным становится самое частое. Показатели поставщиков
+        считаются по всем закупкам один раз, дальше - с каждой закупкой.
+        Возвращает True, если данные изменены.
+        """
+        if "suppliers" in self.data:
+            return False
+        self.data["suppliers"] = []
+        purchases = self.archive.entries("purchases") + self.data.get("purchases", [])
+        spellings = {}
+        for purchase in purchases:
+            key = supplier_key(purchase.get("supplier"))
+            if key:
+                names = spellings.setdefault(key, {})
+                names[purchase["supplier"].strip()] = names.get(purchase["supplier"].strip(), 0) + 1
+        self._index_suppliers()
+        for names in spellings.values():
+            self._supplier_for(max(names, key=names.get))
+        for purchase in purchases:
+            supplier = self._supplier_for(purchase.get("supplier"))
+            if supplier is not None:
+                purchase["supplier_id"] = supplier["id"]  # Архивные записи остаются без изменений
+                self._count_purchase(supplier, purchase)
+        print(f"Справочник поставщиков: {len(self.data['suppliers'])} из {len(purchases)} закупок")
+        return True
+
+    def _index_suppliers(self):
+        self._supplier_index = {}
+        self._supplier_keys = {}
+        self._supplier_trie = SupplierTrie()
+        for supplier in self.data.get("suppliers", []):
+            self._index_supplier(supplier)
+
+    def _index_supplier(self, supplier):
+        key = supplier_key(supplier["name"])
+        self._supplier_index[supplier["id"]] = supplier
+        self._supplier_keys[key] = supplier["id"]
+        self._supplier_trie.add(key, supplier["id"])
+
+    @staticmethod
+    def _compact_sale(sale, names):
+        """Строка чека без повторяющихся строк: название - в справочник, тип по умолчанию не хранится"""
+        name = sale.pop("product_name", None)
+        if name is not None:
+            names[str(sale.get("product_id"))] = name
+        if sale.get("type") == "Продажа":
+            del sale["type"]
+
+    def _init_cost_lots(self):
+        """Партии закупок для расчета себестоимости (метод - data["cost_method"]: fifo/average)"""
+        if "cost_lots" not in self.data:
+            self.data["cost_lots"] = self._opening_lots()
+        self.cost_lots = CostLots(self.data["cost_lots"], self.data.get("cost_method", "fifo"))
+        self.cost_lots.on_change = lambda key, queue: self._changed("cost_lots", key, queue, ("lots", key, queue))
+
+    def _init_expiry_lots(self):
+        """Партии со сроком годности (только товары, закупленные с указанием срока)"""
+        self.expiry_lots = ExpiryLots(self.data.setdefault("expiry_lots", {}))
+        self.expiry_lots.on_change = lambda key, lots: self._changed("expiry_lots", key, lots, ("expiry", key, lots))
+
+    def _init_locations(self):
+        """Места хранения и остатки на них, кроме основного места (склада)"""
+        self.data.setdefault("locations", [dict(location) for location in DEFAULT_LOCATIONS])
+        self.location_stock = LocationStock(self.data.setdefault("location_stock", {}))
+        self.location_stock.on_change = lambda product_id, location_id, quantity: self._changed(
+            "location_stock", (str(product_id), str(location_id)), quantity or None,
+            ("stock", product_id, location_id, quantity))
+
+    def _opening_lots(self):
+        """Начальные партии: текущие остатки по цене последней закупки товара"""
+        last_price = {}
+        for purchase in self._ledger("purchases"):
+            last_price[purchase.get("product_id")] = purchase["purchase_price"]
+        return {str(p["id"]): [[p["quantity"], last_price.get(p["id"], 0), None]]
+                for p in self.data["products"] if p.get("quantity", 0) > 0}
+
+    def _index_receipts(self):
+        self._receipt_index = {}
+        self._returns_index = {}
+        for receipt in self.data.get("receipts", []):
+            self._index_receipt(receipt)
+
+    def _index_receipt(self, receipt):
+        self._receipt_index[receipt["id"]] = receipt
+        if "return_of" in receipt:
+            self._returns_index.setdefault(receipt["return_of"], []).append(receipt["id"])
+
+    def _rebuild_ledger_indexes(self, collection):
+        entries = self.data.get(collection, [])
+        self._date_indexes[collection] = DateIndex(entries)
+        self._movement_index[collection] = {}
+        if collection == "sales":
+            self._receipt_lines = {}
+        for entry in entries:
+            self._index_movement(collection, entry)
+
+    def _index_movement(self, collection, entry):
+        self._movement_index[collection].setdefault(entry.get("product_id"), []).append(entry)
+        if collection == "sales" and "receipt_id" in entry:
+            self._receipt_lines.setdefault(entry["receipt_id"], []).append(entry)
+
+    @staticmethod
+    def normalize_code(code):
+        """Артикулы и штрихкоды сравниваются без учета регистра и пробелов по краям"""
+        return str(code or "").strip().upper()
+
+    def _index_codes(self, product):
+        for field in CODE_FIELDS:
+            code = self.normalize_code(product.get(field))
+            if code:
+                self._code_index[code] = product["id"]
+
+    def _unindex_codes(self, product):
+        for field in CODE_FIELDS:
+            code = self.normalize_code(product.get(field))
+            if code and self._code_index.get(code) == product["id"]:
+                del self._code_index[code]
 
     def save_data(self):
-        """Сохранение данных в файл"""
+        """Сохранение данных в файл
+
+        Внутри транзакции и при отключенном autosave запись откладывается
+        до commit().
+        """
+        if self._tx_depth or not self.autosave:
+            self._dirty = True
+            return True
+        return self._write_data()
+
+    def commit(self):
+        """Записать отложенные изменения в файл"""
+        if not self._dirty:
+            return True
+        return self._write_data()
+
+    def _write_data(self):
+        """Атомарная запись файла через временный файл"""
         try:
-            with open(self.filename, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            # Сначала забираем изменения, сделанные в файле другим процессом
+            self.check_external_changes()
+            self._archive_old_entries()
+            self._take_checkpoint()
+            # default=list - очереди партий (deque) сохраняются списками
+            raw = json.dumps(self.data, ensure_ascii=False, indent=2, default=list).encode('utf-8')
+            tmp_filename = self.filename + ".tmp"
+            with open(tmp_filename, 'wb') as f:
+                f.write(raw)
+            os.replace(tmp_filename, self.filename)
+            self._remember_file(hashlib.sha1(raw).hexdigest())
+            self._pending.clear()
+            self._dirty = False
             print(f"Данные сохранены в {self.filename}")
             return True
         except Exception as e:
             print(f"Ошибка сохранения данных: {e}")
-            QMessageBox.critical(None, "Ошибка", f"Не удалось сохранить данные: {e}")
+            if QApplication.instance() is not None:
+                QMessageBox.critical(None, "Ошибка", f"Не удалось сохранить данные: {e}")
+            return False
+
+    def _needs_archiving(self):
+        """В основном файле есть записи журналов за прошлые месяцы"""
+        current_month = datetime.now().strftime("%Y-%m")
+        for collection in LEDGERS:
+            entries = self.data.get(collection, [])
+            # Журнал упорядочен по id, самые старые записи - в начале
+            if entries and (month_of(entries[0]) or current_month) < current_month:
+                return True
+        return False
+
+    def _archive_old_entries(self):
+        """Перенос записей журналов за прошлые месяцы в архив
+
+        Архив записывается до основного файла: при сбое между записями
+        запись окажется в обоих местах и при чтении будет учтена один раз.
+        """
+        if not self._needs_archiving():
+            return
+        current_month = datetime.now().strftime("%Y-%m")
+        for collection in LEDGERS:
+            entries = self.data.get(collection, [])
+            old = [entry for entry in entries if (month_of(entry) or current_month) < current_month]
+            if old:
+                self.archive.archive(collection, old)
+                entries[:] = [entry for entry in entries if (month_of(entry) or current_month) >= current_month]
+                self._rebuild_ledger_indexes(collection)
+                print(f"Перенесено в архив ({collection}): {len(old)} записей")
+
+    def _take_checkpoint(self):
+        """Ежедневный снимок остатков (при первой записи за день)"""
+        now = datetime.now()
+        if not self.checkpoints.has(now.date().isoformat()):
+            try:
+                self.checkpoints.take(now, self.data["products"])
+            except OSError as e:
+                print(f"Не удалось сохранить снимок остатков: {e}")
+
+    def _read_file_signature(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _remember_file(self, digest):
+        """Запомнить состояние файла, с которым синхронизированы данные в памяти"""
+        self._file_signature = self._read_file_signature()
+        self._file_hash = digest
+
+    def check_external_changes(self):
+        """Слияние изменений файла, сделанных другим процессом
+
+        Изменение определяется по времени модификации и размеру файла,
+        затем подтверждается хешем содержимого. Внешние изменения
+        применяются к данным в памяти по отдельным записям; записи,
+        измененные и здесь, и в файле, остаются локальными и
+        возвращаются как конфликты.
+        """
+        signature = self._read_file_signature()
+        if signature is None or signature == self._file_signature:
+            return []
+        try:
+            with open(self.filename, 'rb') as f:
+                raw = f.read()
+            digest = hashlib.sha1(raw).hexdigest()
+            if digest == self._file_hash:
+                self._file_signature = signature
+                return []
+            disk_data = json.loads(raw.decode('utf-8'))
+        except (OSError, ValueError) as e:
+            # Файл может быть в процессе записи - проверим при следующем событии
+            print(f"Не удалось прочитать изменения файла: {e}")
+            return []
+
+        conflicts = self._merge_external(disk_data)
+        self.archive.load_manifest()  # Архив мог пополнить тот же процесс, что изменил файл
+        self._file_signature = signature
+        self._file_hash = digest
+        self.last_conflicts = conflicts
+        if conflicts:
+            print(f"Конфликты при слиянии изменений файла: {conflicts}")
+        print(f"Применены внешние изменения {self.filename}")
+        return conflicts
+
+    @staticmethod
+    def _fingerprint(record):
+        return json.dumps(record, sort_keys=True, ensure_ascii=False, default=list)
+
+    def _touch(self, collection, record_id, record=None):
+        """Отметить запись как измененную локально (до сохранения в файл)"""
+        key = (collection, record_id)
+        if key not in self._pending:
+            self._pending[key] = self._fingerprint(record) if record is not None else None
+
+    def _merge_external(self, disk_data):
+        """Слияние данных файла с данными в памяти, возвращает список конфликтов"""
+        conflicts = []
+        rebuild = set()  # Коллекции, обертки которых надо построить заново
+        for key, disk_value in disk_data.items():
+            local_value = self.data.get(key)
+            if key == "products":
+                conflicts.extend(self._merge_products(disk_value))
+            elif key == "suppliers" and isinstance(local_value, list):
+                conflicts.extend(self._merge_suppliers(disk_value))
+            elif isinstance(disk_value, list) and isinstance(local_value, list):
+                conflicts.extend(self._merge_ledger(key, disk_value))
+            elif isinstance(disk_value, int) and isinstance(local_value, int):
+                self.data[key] = max(local_value, disk_value)
+            elif key in ("cost_lots", "expiry_lots") and isinstance(local_value, dict):
+                merge_conflicts, updates = self._merge_records(key, local_value, disk_value)
+                conflicts.extend(merge_conflicts)
+                for product_key, lots in updates.items():
+                    if lots is None:
+                        del local_value[product_key]
+                    else:
+                        local_value[product_key] = lots
+                if updates:
+                    rebuild.add(key)
+            elif key == "location_stock" and isinstance(local_value, dict):
+                # Остатки сливаются по паре (товар, место)
+                merge_conflicts, updates = self._merge_records(
+                    key, self._flat_stock(local_value), self._flat_stock(disk_value))
+                conflicts.extend(merge_conflicts)
+                for (product_key, location), quantity in updates.items():
+                    places = local_value.setdefault(product_key, {})
+                    if quantity is None:
+                        places.pop(location, None)
+                    else:
+                        places[location] = quantity
+                    if not places:
+                        del local_value[product_key]
+                if updates:
+                    rebuild.add(key)
+            elif key in ("product_names", "write_off_reasons") and isinstance(local_value, dict):
+                for product_id, name in disk_value.items():
+                    local_value.setdefault(product_id, name)
+            elif key not in self.data:
+                self.data[key] = disk_value
+        self._index_receipts()
+        self._index_suppliers()
+        if "cost_lots" in rebuild:
+            last_cost = self.cost_lots.last_cost
+            self._init_cost_lots()
+            # Цена последней партии нужна и для товаров, партии которых исчерпаны
+            for product_key, cost in last_cost.items():
+                self.cost_lots.last_cost.setdefault(product_key, cost)
+        if "expiry_lots" in rebuild:
+            self._init_expiry_lots()
+        if "location_stock" in rebuild:
+            self._init_locations()
+        return conflicts
+
+    @staticmethod
+    def _flat_stock(stock):
+        """Остатки по местам {товар: {место: количество}} -> {(товар, место): количество}"""
+        return {(product_key, location): quantity
+                for product_key, places in stock.items() for location, quantity in places.items()}
+
+    def _merge_records(self, collection, local, disk):
+        """Слияние записей, хранимых по ключам (партии товаров), по правилу товаров
+
+        Ключ без несохраненных локальных изменений получает значение из файла,
+        измененный локально остается локальным (если его изменили и в файле -
+        конфликт). Возвращает (конфликты, {ключ: значение из файла или None -
+        убрать}).
+        """
+        conflicts = []
+        updates = {}
+        for key in set(local) | set(disk):
+            local_fingerprint = self._fingerprint(local[key]) if key in local else None
+            disk_fingerprint = self._fingerprint(disk[key]) if key in disk else None
+            pending = (collection, key)
+            if pending in self._pending and self._pending[pending] == local_fingerprint:
+                # Локально запись фактически не изменилась
+                del self._pending[pending]
+            elif pending in self._pending:
+                if disk_fingerprint not in (self._pending[pending], local_fingerprint):
+                    conflicts.append({"collection": collection, "id": key,
+                                      "reason": "изменен и локально, и в файле"})
+                continue
+            if local_fingerprint != disk_fingerprint:
+                updates[key] = disk.get(key)
+        return conflicts, updates
+
+    def _merge_products(self, disk_products):
+        conflicts = []
+        disk_ids = set()
+        for disk_product in disk_products:
+            product_id = disk_product["id"]
+            disk_ids.add(product_id)
+            local = self._product_index.get(product_id)
+            key = ("products", product_id)
+            base = self._pending.get(key)
+            if key in self._pending and local is not None and base is None:
+                # Обе стороны создали товар с одним id - локальный получает новый id
+                self.data["last_id"] = max(self.data["last_id"], product_id)
+                local["id"] = self.get_next_id()
+                self._product_index[local["id"]] = local
+                self._index_codes(local)
+                self._pending[("products", local["id"])] = self._pending.pop(key)
+                self._insert_external_product(disk_product)
+                conflicts.append({"collection": "products", "id": product_id,
+                                  "reason": f"id занят, локальный товар получил id {local['id']}"})
+                continue
+            if key in self._pending and (local is None and base is None or
+                                         local is not None and self._fingerprint(local) == base):
+                # Локально запись фактически не изменилась (или добавлена и удалена до сохранения)
+                del self._pending[key]
+            elif key in self._pending:
+                disk_fingerprint = self._fingerprint(disk_product)
+                changed_on_disk = base is not None and disk_fingerprint != base
+                if changed_on_disk and (local is None or disk_fingerprint != self._fingerprint(local)):
+                    conflicts.append({"collection": "products", "id": product_id,
+                                      "reason": "изменен и локально, и в файле"})
+                # Локальное изменение (или удаление) сохраняется
+                continue
+
+            if local is None:
+                self._insert_external_product(disk_product)
+            elif self._fingerprint(local) != self._fingerprint(disk_product):
+                # Обновляем на месте, чтобы ссылки на товар оставались действительными
+                self._unindex_codes(local)
+                local.clear()
+                local.update(disk_product)
+                self._index_codes(local)
+                self._notify("products", "update", product_id, external=True)
+
+        for product in list(self.data["products"]):
+            product_id = product["id"]
+            if product_id in disk_ids:
+                continue
+            key = ("products", product_id)
+            if key not in self._pending:
+                self.data["products"].remove(product)
+                del self._product_index[product_id]
+                self._unindex_codes(product)
+                self._notify("products", "delete", product_id, external=True)
+            elif self._pending[key] is not None:
+                conflicts.append({"collection": "products", "id": product_id,
+                                  "reason": "удален в файле, но изменен локально"})
+        return conflicts
+
+    def _merge_suppliers(self, disk_suppliers):
+        """Слияние справочника поставщиков, возвращает список конфликтов
+
+        Поставщик без несохраненных локальных изменений берется из файла.
+        Если его показатели изменены и локально, и в файле, к показателям
+        файла прибавляются локальные приращения, к истории цен - локальные
+        цены, так что учитываются закупки обоих процессов. Поставщик,
+        добавленный локально, объединяется с поставщиком того же названия из
+        файла, а при занятом id получает новый; несохраненные закупки и
+        заказы переходят на итоговый id.
+        """
+        conflicts = []
+        suppliers = self.data["suppliers"]
+        previous = {supplier["id"]: self._fingerprint(supplier) for supplier in suppliers}
+        merged = {supplier["id"]: supplier for supplier in disk_suppliers}
+        disk_keys = {supplier_key(supplier["name"]): supplier["id"] for supplier in disk_suppliers}
+        remap = {}  # id локального поставщика -> итоговый id
+        # Отметки снимаются заранее: итоговые id могут совпасть с id других локальных поставщиков
+        changed = {local["id"]: self._pending.pop(("suppliers", local["id"])) for local in suppliers
+                   if ("suppliers", local["id"]) in self._pending}
+        for local in suppliers:
+            key = ("suppliers", local["id"])
+            if local["id"] not in changed:
+                continue
+            base = changed[local["id"]]
+            if base is None:
+                target = merged.get(disk_keys.get(supplier_key(local["name"])))
+                if target is None:
+                    if local["id"] in merged:
+                        # Другой процесс занял тот же id - локальный поставщик получает новый
+                        self.data["last_supplier_id"] = max(self.data.get("last_supplier_id", 0), max(merged)) + 1
+                        remap[local["id"]] = self.data["last_supplier_id"]
+                        conflicts.append({"collection": "suppliers", "id": local["id"],
+                                          "reason": f"id занят, локальный поставщик получил id {remap[local['id']]}"})
+                        local["id"] = remap[local["id"]]
+                    merged[local["id"]] = local
+                    self._pending[("suppliers", local["id"])] = None
+                    continue
+                if target["id"] != local["id"]:
+                    remap[local["id"]] = target["id"]
+                base_record = {}
+            else:
+                target = merged.get(local["id"])
+                if self._fingerprint(local) == base:
+                    # Локально поставщик фактически не изменился
+                    continue
+                if target is None or self._fingerprint(target) == base:
+                    if target is None:
+                        conflicts.append({"collection": "suppliers", "id": local["id"],
+                                          "reason": "удален в файле, но изменен локально"})
+                    merged[local["id"]] = local
+                    self._pending[key] = base
+                    continue
+                base_record = json.loads(base)
+            merged[target["id"]] = self._combine_supplier(target, local, base_record)
+            # Основа следующего слияния - поставщик в том виде, в каком он в файле
+            self._pending[("suppliers", target["id"])] = self._fingerprint(target)
+
+        suppliers[:] = sorted(merged.values(), key=lambda supplier: supplier["id"])
+        if remap:
+            for collection in ("purchases", "purchase_orders"):
+                for entry in self.data.get(collection, []):
+                    if entry.get("supplier_id") in remap and (collection, entry.get("id")) in self._pending:
+                        entry["supplier_id"] = remap[entry["supplier_id"]]
+        for supplier in suppliers:
+            if supplier["id"] not in previous:
+                self._notify("suppliers", "add", supplier["id"], external=True)
+            elif previous[supplier["id"]] != self._fingerprint(supplier):
+                self._notify("suppliers", "update", supplier["id"], external=True)
+        for supplier_id in set(previous) - set(merged):
+            self._notify("suppliers", "delete", supplier_id, external=True)
+        return conflicts
+
+    @staticmethod
+    def _combine_supplier(disk, local, base):
+        """Поставщик из файла с локальными приращениями показателей относительно base"""
+        combined = dict(disk, prices={product_key: list(history) for product_key, history in disk["prices"].items()})
+        for field in SUPPLIER_TOTALS:
+            if field == "last_date":
+                combined[field] = max(disk.get(field) or "", local.get(field) or "") or None
+            else:
+                combined[field] = disk.get(field, 0) + local.get(field, 0) - base.get(field, 0)
+        base_prices = base.get("prices", {})
+        for product_key, history in local["prices"].items():
+            # Локальные цены - хвост истории после той ее части, что была в base
+            known = base_prices.get(product_key, [])
+            added = len(history)
+            for count in range(len(history) + 1):
+                kept = history[:len(history) - count]
+                if len(kept) <= len(known) and kept == known[len(known) - len(kept):]:
+                    added = count
+                    break
+            if added:
+                merged_history = combined["prices"].get(product_key, []) + history[-added:]
+                combined["prices"][product_key] = merged_history[-PRICE_HISTORY:]
+        return combined
+
+    def _insert_external_product(self, product):
+        self.data["products"].append(product)
+        self._product_index[product["id"]] = product
+        self._index_codes(product)
+        self._notify("products", "add", product["id"], external=True)
+
+    def _merge_ledger(self, collection, disk_entries):
+        """Слияние журнала (продажи, закупки), который только дополняется"""
+        conflicts = []
+        entries = self.data[collection]
+        # Записи, добавленные локально и еще не сохраненные, могли получить те же id
+        local_new = [entry for entry in entries if (collection, entry.get("id")) in self._pending]
+        local_new_fingerprints = {entry["id"]: self._fingerprint(entry) for entry in local_new}
+        saved_ids = {entry["id"] for entry in entries
+                     if isinstance(entry, dict) and "id" in entry and entry["id"] not in local_new_fingerprints}
+        new_entries = [entry for entry in disk_entries
+                       if isinstance(entry, dict) and "id" in entry and entry["id"] not in saved_ids
+                       and local_new_fingerprints.get(entry["id"]) != self._fingerprint(entry)]
+        if not new_entries:
+            return conflicts
+
+        counter = {"sales": "last_sale_id", "purchases": "last_purchase_id",
+                   "purchase_orders": "last_purchase_order_id", "receipts": "last_receipt_id",
+                   "locations": "last_location_id",
+                   "transfers": "last_transfer_id"}.get(collection)
+        # Строки заголовков (чеков, заказов) ссылаются на их id
+        lines, reference = {"purchase_orders": ("purchases", "order_id"),
+                            "receipts": ("sales", "receipt_id")}.get(collection, (None, None))
+        new_ids = {entry["id"] for entry in new_entries}
+        taken_ids = saved_ids | new_ids | set(local_new_fingerprints)
+        renumbered = False
+        for entry in local_new:
+            if entry["id"] not in new_ids:
+                continue
+            # Другой процесс занял тот же id - локальная запись получает новый
+            old_id = entry["id"]
+            if counter:
+                self.data[counter] = max(self.data.get(counter, 0), max(taken_ids))
+                self.data[counter] += 1
+                entry["id"] = self.data[counter]
+            else:
+                entry["id"] = max(taken_ids) + 1
+            taken_ids.add(entry["id"])
+            renumbered = True
+            if lines:
+                for line in self.data.get(lines, []):
+                    if line.get(reference) == old_id and (lines, line.get("id")) in self._pending:
+                        line[reference] = entry["id"]
+            # Возвраты ссылаются на исходный чек (строку продажи) той же коллекции
+            if collection in ("receipts", "sales"):
+                for other in local_new:
+                    if other.get("return_of") == old_id:
+                        other["return_of"] = entry["id"]
+            self._pending[(collection, entry["id"])] = self._pending.pop((collection, old_id))
+            conflicts.append({"collection": collection, "id": old_id,
+                              "reason": f"id занят, локальная запись получила id {entry['id']}"})
+
+        if renumbered and lines in LEDGERS:
+            # Индекс строк по id чека (заказа) построен по прежним id
+            self._rebuild_ledger_indexes(lines)
+        entries.extend(new_entries)
+        entries.sort(key=lambda entry: entry.get("id", 0))
+        if collection in self._date_indexes:
+            self._date_indexes[collection].add_many(new_entries)
+            for entry in new_entries:
+                self._index_movement(collection, entry)
+        for entry in new_entries:
+            self._notify(collection, "add", entry["id"], external=True)
+        return conflicts
+
+    def transaction(self):
+        """Группировка нескольких изменений в одну запись файла
+
+        Использование:
+            with db.transaction() as tx:
+                db.adjust_quantity(product_id, -1)
+                db.add_sale(sale_data)
+            if not tx.ok:
+                ...
+        """
+        return Transaction(self)
+
+    def _begin_step(self, label=None):
+        """Начать шаг истории отмены; False - шаг уже начат внешней операцией"""
+        if self._step is not None:
+            self._step_label = self._step_label or label
+            return False
+        self._step = []
+        self._step_label = label
+        return True
+
+    def _end_step(self):
+        step, self._step = self._step, None
+        if self.history.push(self._step_label or "Изменение", step):
+            self._notify("history", "update")
+
+    def _record(self, delta):
+        """Запомнить дельту изменения в текущем шаге"""
+        if self._step is not None:
+            self._step.append(delta)
+
+    def _changed(self, collection, record_id, record, delta):
+        """Изменение записи обертки (партий, остатков): отметка для слияния и дельта отмены"""
+        self._touch(collection, record_id, record)
+        self._record(delta)
+
+    def _insert(self, collection, record):
+        """Добавить запись в конец коллекции"""
+        entries = self.data.setdefault(collection, [])
+        self._record(("insert", collection, len(entries), record))
+        entries.append(record)
+
+    def _set_field(self, product, field, value):
+        """Изменить поле товара"""
+        old = product.get(field, MISSING)
+        if old != value:
+            self._record(("field", product["id"], field, old, value))
+            product[field] = value
+
+    def _rollback(self, mark, dirty):
+        """Откат изменений текущего шага, сделанных после позиции mark"""
+        self._revert(self._step[mark:])
+        del self._step[mark:]
+        self._dirty = dirty
+
+    def _revert(self, step, undo=False):
+        """Откат дельт шага в обратном порядке
+
+        Возвращает шаг, откатывающий сам откат (для повтора), или None,
+        если запись изменилась после операции - тогда данные остаются
+        как были. Индексы журналов перестраиваются один раз, подписчики
+        получают по событию на запись.
+        """
+        inverse = []
+        events = {}
+        for delta in reversed(step):
+            reverted = self._revert_delta(delta)
+            if reverted is None:
+                self._revert(inverse)
+                return None
+            inverse.append(reverted[0])
+            if reverted[1] is not None:
+                events[reverted[1]] = None
+        collections = {collection for collection, _, _ in events}
+        for collection in collections & set(LEDGERS):
+            self._rebuild_ledger_indexes(collection)
+        if "receipts" in collections:
+            self._index_receipts()
+        if "suppliers" in collections:
+            self._index_suppliers()  # Ключи названий и trie
+        for collection, action, record_id in events:
+            self._notify(collection, action, record_id, undo=undo)
+        return inverse
+
+    def _revert_delta(self, delta):
+        """Откат одной дельты: (обратная дельта, событие) или None при конфликте"""
+        kind = delta[0]
+        if kind == "field":
+            _, product_id, field, old, new = delta
+            product = self._product_index.get(product_id)
+            if product is None or product.get(field, MISSING) != new:
+                return None
+            self._touch("products", product_id, product)
+            self._unindex_codes(product)
+            if old is MISSING:
+                del product[field]
+            else:
+                product[field] = old
+            self._index_codes(product)
+            return ("field", product_id, field, new, old), ("products", "update", product_id)
+
+        if kind == "lots":
+            _, key, queue = delta
+            self._touch("cost_lots", key, self.cost_lots.lots.get(key))
+            return ("lots", key, self.cost_lots.replace(key, queue)), None
+        if kind == "expiry":
+            _, key, lots = delta
+            self._touch("expiry_lots", key, self.expiry_lots.lots.get(key))
+            return ("expiry", key, self.expiry_lots.replace(key, lots)), None
+        if kind == "stock":
+            _, product_id, location_id, quantity = delta
+            self._touch("location_stock", (str(product_id), str(location_id)),
+                        self.location_stock.at(product_id, location_id) or None)
+            previous = self.location_stock.replace(product_id, location_id, quantity)
+            return ("stock", product_id, location_id, previous), ("products", "update", product_id)
+        if kind == "reason":
+            _, code, title = delta
+            reasons = self.data["write_off_reasons"]
+            current = reasons.pop(code, MISSING)
+            if title is not MISSING:
+                reasons[code] = title
+            return ("reason", code, current), ("write_off_reasons", "update", code)
+        if kind == "supplier":
+            _, supplier_id, totals, product_key, history = delta
+            supplier = self._supplier_index.get(supplier_id)
+            if supplier is None:
+                return None
+            self._touch("suppliers", supplier_id, supplier)
+            current = {field: supplier.get(field) for field in SUPPLIER_TOTALS}
+            supplier.update(totals)
+            current_history = None
+            if product_key is not None:
+                current_history = supplier["prices"].pop(product_key, None)
+                if history is not None:
+                    supplier["prices"][product_key] = history
+            return ("supplier", supplier_id, current, product_key, current_history), ("suppliers", "update", supplier_id)
+
+        _, collection, position, record = delta
+        entries = self.data.setdefault(collection, [])
+        if kind == "insert":
+            position = self._find_record(entries, position, record)
+            if position is None:
+                return None  # Запись уже перенесена в архив или удалена
+            self._touch(collection, record.get("id"), record)
+            del entries[position]
+            if collection == "products":
+                self._product_index.pop(record["id"], None)
+                self._unindex_codes(record)
+            elif collection == "suppliers":
+                self._supplier_index.pop(record["id"], None)
+            return ("remove", collection, position, record), (collection, "delete", record.get("id"))
+
+        if collection == "products" and record["id"] in self._product_index:
+            return None
+        self._touch(collection, record.get("id"))
+        entries.insert(min(position, len(entries)), record)
+        if collection == "products":
+            self._product_index[record["id"]] = record
+            self._index_codes(record)
+        elif collection == "suppliers":
+            self._supplier_index[record["id"]] = record
+        return ("insert", collection, position, record), (collection, "add", record.get("id"))
+
+    @staticmethod
+    def _find_record(entries, position, record):
+        """Позиция записи в коллекции (обычно там же, где она была добавлена)"""
+        if position < len(entries) and entries[position] is record:
+            return position
+        for index in range(len(entries) - 1, -1, -1):
+            if entries[index] is record:
+                return index
+        return None
+
+    def undo(self):
+        """Отменить последнюю операцию; False - отменять нечего или запись изменилась"""
+        return self._undo_step(redo=False)
+
+    def redo(self):
+        """Повторить последнюю отмененную операцию"""
+        return self._undo_step(redo=True)
+
+    def can_undo(self):
+        return self.history.label() is not None
+
+    def can_redo(self):
+        return self.history.label(redo=True) is not None
+
+    def history_label(self, redo=False):
+        """Название шага, который будет отменен (повторен), или None"""
+        return self.history.label(redo)
+
+    def _undo_step(self, redo):
+        if self._tx_depth or self._step is not None:
             return False
+        entry = self.history.pop(redo)
+        if entry is None:
+            return False
+        label, step = entry
+        inverse = self._revert(step, undo=True)
+        if inverse is None:
+            # Более ранние шаги тоже опираются на измененные записи
+            print(f"Операцию «{label}» нельзя {'повторить' if redo else 'отменить'}: данные изменены позже")
+            self.history.clear()
+            self._notify("history", "update")
+            return False
+        self.history.put(label, inverse, redo=not redo)
+        self._notify("history", "update")
+        return self.save_data()
+
+    def add_listener(self, callback):
+        """Подписаться на изменения данных: callback(event)"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """Отписаться от изменений данных"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, collection, action, record_id=None, external=False, undo=False):
+        """Оповещение подписчиков об изменении данных"""
+        self.version += 1
+        event = {"collection": collection, "action": action, "id": record_id, "version": self.version}
+        if external:
+            event["external"] = True
+        if undo:
+            event["undo"] = True
+        for callback in list(self._listeners):
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Ошибка обработчика изменений: {e}")
 
     def get_products(self):
         """Получить список товаров"""
         return self.data["products"]
 
-    def get_sales(self):
-        """Получить список продаж"""
-        return self.data.get("sales", [])
+    def get_product(self, product_id):
+        """Получить товар по ID"""
+        return self._product_index.get(product_id)
+
+    def find_by_code(self, code):
+        """Найти товар по артикулу или штрихкоду"""
+        product_id = self._code_index.get(self.normalize_code(code))
+        return self._product_index.get(product_id) if product_id is not None else None
+
+    def is_code_available(self, code, product_id=None):
+        """Артикул/штрихкод свободен (или принадлежит товару product_id)"""
+        owner = self._code_index.get(self.normalize_code(code))
+        return owner is None or owner == product_id
+
+    def get_sales(self, date_from=None, date_to=None):
+        """Получить список продаж (за период [date_from, date_to) - ISO-строки дат)"""
+        return self._ledger("sales", date_from, date_to)
+
+    def get_purchases(self, date_from=None, date_to=None):
+        """Получить список закупок (за период [date_from, date_to) - ISO-строки дат)"""
+        return self._ledger("purchases", date_from, date_to)
+
+    def get_sales_for_day(self, day):
+        """Продажи за день ('2025-11-13')"""
+        return self._ledger("sales", *self._day_range(day))
+
+    def get_purchases_for_day(self, day):
+        """Закупки за день ('2025-11-13')"""
+        return self._ledger("purchases", *self._day_range(day))
+
+    def get_recent_sales(self, seconds):
+        """Продажи за последние seconds секунд"""
+        return self._ledger("sales", (datetime.now() - timedelta(seconds=seconds)).isoformat())
+
+    def get_recent_purchases(self, seconds):
+        """Закупки за последние seconds секунд"""
+        return self._ledger("purchases", (datetime.now() - timedelta(seconds=seconds)).isoformat())
+
+    @staticmethod
+    def _day_range(day):
+        start = date.fromisoformat(day[:10])
+        return start.isoformat(), (start + timedelta(days=1)).isoformat()
+
+    def _ledger(self, collection, date_from=None, date_to=None):
+        """Журнал: архив прошлых месяцев (только нужные месяцы) и текущие записи
+
+        Без периода записи возвращаются по возрастанию id, за период -
+        по времени, через индексы дат (двоичный поиск в каждом месяце).
+        """
+        current = self.data.get(collection, [])
+        if date_from or date_to:
+            archived = []
+            for month in self.archive.months(collection, date_from, date_to):
+                archived.extend(self.archive.index(collection, month).range(date_from, date_to))
+            current = self._date_indexes[collection].range(date_from, date_to)
+        elif self.archive.is_empty(collection):
+            return current
+        else:
+            archived = self.archive.entries(collection)
+
+        if archived and current and current[0].get("id", 0) <= self.archive.last_id(collection):
+            # Запись уже в архиве, но еще не удалена из основного файла
+            archived_ids = {entry["id"] for entry in archived}
+            current = [entry for entry in current if entry.get("id") not in archived_ids]
+        return archived + current
+
+    def get_sales_since(self, last_id):
+        """Продажи с id больше last_id"""
+        return self._entries_since("sales", last_id)
+
+    def get_purchases_since(self, last_id):
+        """Закупки с id больше last_id"""
+        return self._entries_since("purchases", last_id)
+
+    def _entries_since(self, collection, last_id):
+        # Журнал упорядочен по id (новые записи получают следующий id, слияние сортирует)
+        entries = self.data.get(collection, [])
+        if last_id < self.archive.last_id(collection):
+            entries = self._ledger(collection)
+        start = bisect.bisect_right(entries, last_id, key=lambda entry: entry.get("id", 0))
+        return entries[start:]
+
+    def get_product_movements(self, product_id):
+        """Движение товара: закупки, продажи и списания по времени
+
+        Берутся из индекса товар -> записи журнала; из архива читаются
+        только месяцы, в которых товар встречается (по манифесту).
+        """
+        movements = []
+        for collection in LEDGERS:
+            entries = []
+            for month in self.archive.product_months(collection, product_id):
+                entries.extend(self.archive.product_entries(collection, month, product_id))
+            archived_ids = {entry["id"] for entry in entries}
+            entries.extend(entry for entry in self._movement_index[collection].get(product_id, [])
+                           if entry.get("id") not in archived_ids)
+            for entry in entries:
+                if collection == "purchases":
+                    movements.append({"collection": collection, "id": entry["id"], "date": entry.get("date", ""),
+                                      "type": "Закупка", "quantity": entry["quantity"],
+                                      "price": entry["purchase_price"], "details": entry.get("supplier", "")})
+                else:
+                    movements.append({"collection": collection, "id": entry["id"], "date": entry.get("date", ""),
+                                      "type": entry.get("type", "Продажа"), "quantity": -entry["quantity"],
+                                      "price": entry["price"], "details": self.reason_title(entry)})
+        movements.sort(key=lambda movement: movement["date"])
+        return movements
+
+    def get_last_purchase_price(self, product_id):
+        """Цена последней закупки товара (None - товар не закупался)"""
+        entries = self._movement_index["purchases"].get(product_id)
+        if entries:
+            return entries[-1]["purchase_price"]
+        for month in reversed(self.archive.product_months("purchases", product_id)):
+            entries = self.archive.product_entries("purchases", month, product_id)
+            if entries:
+                return entries[-1]["purchase_price"]
+        return None
 
-    def get_purchases(self):
-        """Получить список закупок"""
-        return self.data.get("purchases", [])
+    def stock_as_of(self, when):
+        """Остатки товаров на момент when (ISO-строка даты или даты-времени)
+
+        Берется ближайший к дате снимок остатков (или текущие остатки) и
+        к нему применяются операции журнала между снимком и датой: вперед
+        от более раннего снимка или назад от более позднего.
+        Возвращает список {"product_id", "name", "quantity"}.
+        """
+        target = when.isoformat() if isinstance(when, (date, datetime)) else str(when)
+        now = datetime.now().isoformat()
+        base_time, base = now, {p["id"]: p["quantity"] for p in self.data["products"]}
+        checkpoint = self.checkpoints.nearest(target)
+        if checkpoint is not None and target < now:
+            target_timestamp = to_timestamp(target)
+            if abs(to_timestamp(checkpoint[0]) - target_timestamp) < abs(to_timestamp(now) - target_timestamp):
+                base_time, base = checkpoint
+
+        stock = dict(base)
+        forward = base_time <= target
+        start, end = (base_time, target) if forward else (target, base_time)
+        names = {int(product_id): name for product_id, name in self.data.get("product_names", {}).items()}
+        for collection, sign in (("purchases", 1), ("sales", -1)):
+            for entry in self._ledger(collection, start, end):
+                product_id = entry.get("product_id")
+                delta = sign * entry["quantity"] if forward else -sign * entry["quantity"]
+                stock[product_id] = stock.get(product_id, 0) + delta
+                if "product_name" in entry:
+                    names.setdefault(product_id, entry["product_name"])
+
+        result = []
+        for product_id, quantity in sorted(stock.items(), key=lambda item: item[0] or 0):
+            product = self._product_index.get(product_id)
+            name = product["name"] if product else names.get(product_id, "")
+            result.append({"product_id": product_id, "name": name, "quantity": quantity})
+        return result
 
     def get_next_id(self):
         """Получить следующий ID товара"""
         self.data["last_id"] += 1
         return self.data["last_id"]
 
+    def get_last_sale_id(self):
+        """Последний выданный ID продажи"""
+        return self.data.get("last_sale_id", 0)
+
     def get_next_sale_id(self):
         """Получить следующий ID продажи"""
         if "last_sale_id" not in self.data:
@@ -78,41 +1204,659 @@ class DatabaseManager:
         self.data["last_purchase_id"] += 1
         return self.data["last_purchase_id"]
 
+    def get_next_receipt_id(self):
+        """Получить следующий ID чека"""
+        if "last_receipt_id" not in self.data:
+            self.data["last_receipt_id"] = 0
+        self.data["last_receipt_id"] += 1
+        return self.data["last_receipt_id"]
+
+    def get_next_supplier_id(self):
+        """Получить следующий ID поставщика"""
+        if "last_supplier_id" not in self.data:
+            self.data["last_supplier_id"] = 0
+        self.data["last_supplier_id"] += 1
+        return self.data["last_supplier_id"]
+
+    def get_next_transfer_id(self):
+        """Получить следующий ID перемещения"""
+        if "last_transfer_id" not in self.data:
+            self.data["last_transfer_id"] = 0
+        self.data["last_transfer_id"] += 1
+        return self.data["last_transfer_id"]
+
+    def get_next_location_id(self):
+        """Получить следующий ID места хранения"""
+        if "last_location_id" not in self.data:
+            self.data["last_location_id"] = max(location["id"] for location in self.get_locations())
+        self.data["last_location_id"] += 1
+        return self.data["last_location_id"]
+
+    def get_next_purchase_order_id(self):
+        """Получить следующий ID заказа поставщику"""
+        if "last_purchase_order_id" not in self.data:
+            self.data["last_purchase_order_id"] = 0
+        self.data["last_purchase_order_id"] += 1
+        return self.data["last_purchase_order_id"]
+
+    @undoable("Добавление товара")
     def add_product(self, product):
         """Добавить товар"""
+        if not all(self.is_code_available(product.get(field)) for field in CODE_FIELDS if product.get(field)):
+            print("Артикул или штрихкод уже используется другим товаром")
+            return False
         product["id"] = self.get_next_id()
-        self.data["products"].append(product)
+        self._insert("products", product)
+        self._product_index[product["id"]] = product
+        self._index_codes(product)
+        self._touch("products", product["id"])
+        self._notify("products", "add", product["id"])
         return self.save_data()
 
+    @undoable("Продажа")
     def add_sale(self, sale_data):
         """Добавить продажу"""
         sale_data["id"] = self.get_next_sale_id()
         sale_data["date"] = datetime.now().isoformat()
-        if "sales" not in self.data:
-            self.data["sales"] = []
-        self.data["sales"].append(sale_data)
+        # Себестоимость проданного (списанного) товара по партиям закупок;
+        # у возврата (отрицательное количество) она уже посчитана по исходной продаже
+        if sale_data["quantity"] > 0:
+            sale_data["cogs"] = self.cost_lots.consume(sale_data["product_id"], sale_data["quantity"])
+            # Товар со сроком годности отпускается из указанных в строке партий (списание
+            # выбранных партий), остальное - из партий с ближайшим сроком (FEFO)
+            allocation = self.expiry_lots.take(sale_data["product_id"], sale_data.pop("lots", None))
+            remaining = sale_data["quantity"] - sum(lot[2] for lot in allocation)
+            if remaining > 0:
+                allocation += self.expiry_lots.allocate(sale_data["product_id"], remaining)
+            if allocation:
+                sale_data["lots"] = allocation
+        self._compact_sale(sale_data, self.data.setdefault("product_names", {}))
+        self._insert("sales", sale_data)
+        self._date_indexes["sales"].add(sale_data)
+        self._index_movement("sales", sale_data)
+        self._touch("sales", sale_data["id"])
+        self._notify("sales", "add", sale_data["id"])
         return self.save_data()
 
+    @undoable("Закупка")
     def add_purchase(self, purchase_data):
         """Добавить закупку"""
         purchase_data["id"] = self.get_next_purchase_id()
         purchase_data["date"] = datetime.now().isoformat()
-        if "purchases" not in self.data:
-            self.data["purchases"] = []
-        self.data["purchases"].append(purchase_data)
+        # Поставщик из справочника (по любому написанию названия), его показатели - с каждой закупкой
+        supplier = self._supplier_for(purchase_data.get("supplier"))
+        if supplier is not None:
+            purchase_data["supplier"] = supplier["name"]
+            purchase_data["supplier_id"] = supplier["id"]
+            self._count_purchase(supplier, purchase_data)
+        self.cost_lots.add(purchase_data["product_id"], purchase_data["quantity"],
+                           purchase_data["purchase_price"], purchase_data["id"])
+        if purchase_data.get("expiry"):
+            self.expiry_lots.add(purchase_data["product_id"], purchase_data["quantity"],
+                                 purchase_data["expiry"], purchase_data["id"])
+        self._insert("purchases", purchase_data)
+        self._date_indexes["purchases"].add(purchase_data)
+        self._index_movement("purchases", purchase_data)
+        self._touch("purchases", purchase_data["id"])
+        self._notify("purchases", "add", purchase_data["id"])
         return self.save_data()
 
+    @undoable("Чек")
+    def add_receipt(self, receipt):
+        """Оформить чек: заголовок и строки продаж одной транзакцией
+
+        receipt - {"type": "Продажа", "lines": [{"product_id", "quantity", "price", "lots"}, ...]}
+        (lots - необязательные партии со сроком годности [[id закупки, срок, количество], ...],
+        из которых забирается товар строки);
+        у списания - еще "reason_code" из справочника причин, он же
+        записывается в строки, или "reason_title" - название причины (новая
+        причина добавляется в справочник той же транзакцией, что и чек, и
+        откатывается вместе с ним); "location_id" - место хранения, с которого
+        отпускается товар (по умолчанию - склад), записывается в строки.
+        Остатки уменьшаются на количество строк; если хотя бы одну строку
+        провести нельзя (нет товара, не хватает остатка), не сохраняется
+        ничего. Чек получает id, дату и сумму, строки - id продаж.
+        """
+        lines = receipt.get("lines") or []
+        if not lines:
+            return False
+        header = {"type": receipt.get("type", "Продажа"), "total": 0}
+        reason_title = (receipt.get("reason_title") or "").strip()
+        if not reason_title and receipt.get("reason_code") is not None:
+            if receipt["reason_code"] not in self.get_write_off_reasons():
+                print(f"Неизвестная причина списания: {receipt['reason_code']}")
+                return False
+            header["reason_code"] = receipt["reason_code"]
+        location_id = receipt.get("location_id")
+        if location_id == DEFAULT_LOCATION_ID:
+            location_id = None
+        with self.transaction() as tx:
+            if reason_title:
+                header["reason_code"] = self._reason_code(reason_title)
+            header["id"] = self.get_next_receipt_id()
+            header["date"] = datetime.now().isoformat()
+            for line in lines:
+                product = self._product_index.get(line["product_id"])
+                if (product is None or line["quantity"] <= 0
+                        or not self.adjust_quantity(product["id"], -line["quantity"], location_id)):
+                    tx.rollback()
+                    break
+                sale_data = {
+                    'receipt_id': header['id'],
+                    'product_id': product['id'],
+                    'product_name': product['name'],
+                    'quantity': line['quantity'],
+                    'price': line['price'],
+                    'type': header['type']
+                }
+                if "reason_code" in header:
+                    sale_data['reason_code'] = header['reason_code']
+                if location_id is not None:
+                    sale_data['location_id'] = location_id
+                if line.get('lots'):
+                    sale_data['lots'] = line['lots']
+                self.add_sale(sale_data)
+                line["id"] = sale_data["id"]
+                line["cogs"] = sale_data["cogs"]
+                header["total"] += line['quantity'] * line['price']
+            else:
+                self._insert("receipts", header)
+                self._index_receipt(header)
+                self._touch("receipts", header["id"])
+                self._notify("receipts", "add", header["id"])
+        if tx.ok:
+            receipt.update(header)
+        return tx.ok
+
+    def get_receipt(self, receipt_id):
+        """Чек с его строками: {"id", "date", "type", "total", "lines"} или None
+
+        Заголовок и текущие строки берутся из индексов по id чека; строки,
+        уже перенесенные в архив, - из месяцев, в которых манифест архива
+        отмечает этот чек (начиная с месяца чека), по индексу чеков месяца.
+        """
+        header = self._receipt_index.get(receipt_id)
+        if header is None:
+            return None
+        lines = []
+        for month in self.archive.receipt_months("sales", receipt_id, month_of(header)):
+            lines.extend(self.archive.receipt_entries("sales", month, receipt_id))
+        # Запись может быть уже в архиве, но еще не удалена из основного файла
+        archived_ids = {line["id"] for line in lines}
+        lines.extend(line for line in self._receipt_lines.get(receipt_id, []) if line["id"] not in archived_ids)
+        lines.sort(key=lambda line: line["id"])
+        return dict(header, lines=lines)
+
+    def get_returnable(self, receipt_id):
+        """Чек продажи для возврата: у строк добавлены returned и returnable
+
+        Уже возвращенное количество берется из чеков возврата этого чека
+        (индекс по id исходного чека). Для чеков не-продаж - None.
+        """
+        receipt = self.get_receipt(receipt_id)
+        if receipt is None or receipt["type"] != "Продажа":
+            return None
+        returned = {}
+        for return_id in self._returns_index.get(receipt_id, []):
+            for line in self.get_receipt(return_id)["lines"]:
+                returned[line["return_of"]] = returned.get(line["return_of"], 0) - line["quantity"]
+        receipt["lines"] = [dict(line, returned=returned.get(line["id"], 0),
+                                 returnable=line["quantity"] - returned.get(line["id"], 0))
+                            for line in receipt["lines"]]
+        return receipt
+
+    @undoable("Возврат")
+    def add_return(self, refund):
+        """Возврат по чеку продажи: товар на склад, возврат денег - одной транзакцией
+
+        refund - {"receipt_id": id чека продажи, "reason": ...,
+                  "lines": [{"sale_id": id строки продажи, "quantity": ...}, ...]}.
+        Возврат записывается чеком типа "Возврат" со строками с
+        отрицательным количеством и себестоимостью исходной продажи, поэтому
+        суммы и маржа журнала продаж остаются верными без пересчета.
+        Количество не может превышать проданное за вычетом прежних возвратов.
+        """
+        receipt = self.get_returnable(refund.get("receipt_id"))
+        if receipt is None:
+            print("Чек продажи для возврата не найден")
+            return False
+        sold = {line["id"]: line for line in receipt["lines"]}
+        lines = [line for line in refund.get("lines") or [] if line.get("quantity", 0) > 0]
+        if not lines:
+            return False
+        requested = {}
+        for line in lines:
+            requested[line["sale_id"]] = requested.get(line["sale_id"], 0) + line["quantity"]
+        for sale_id, quantity in requested.items():
+            if sale_id not in sold or quantity > sold[sale_id]["returnable"]:
+                print(f"Нельзя вернуть {quantity} шт. по строке {sale_id} чека {receipt['id']}")
+                return False
+
+        header = {"type": "Возврат", "return_of": receipt["id"], "reason": refund.get("reason", ""), "total": 0}
+        returned = {sale_id: sale["returned"] for sale_id, sale in sold.items()}
+        with self.transaction() as tx:
+            header["id"] = self.get_next_receipt_id()
+            header["date"] = datetime.now().isoformat()
+            for line in lines:
+                sale = sold[line["sale_id"]]
+                # Товар возвращается на место хранения, с которого был продан
+                location_id = sale.get("location_id")
+                if self._location(location_id) is None:
+                    location_id = None
+                if not self.adjust_quantity(sale["product_id"], line["quantity"], location_id):
+                    tx.rollback()
+                    break
+                # Товар возвращается в партии по себестоимости проданного
+                if "cogs" in sale:
+                    unit_cost = sale["cogs"] / sale["quantity"]
+                else:
+                    unit_cost = self.cost_lots.last_cost.get(str(sale["product_id"]), 0)
+                self.cost_lots.add(sale["product_id"], line["quantity"], unit_cost)
+                self._return_expiry_lots(sale, returned[sale["id"]], line["quantity"])
+                returned[sale["id"]] += line["quantity"]
+                return_data = {
+                    'receipt_id': header['id'],
+                    'return_of': sale['id'],
+                    'product_id': sale['product_id'],
+                    'quantity': -line['quantity'],
+                    'price': sale['price'],
+                    'cogs': -unit_cost * line['quantity'],
+                    'type': 'Возврат'
+                }
+                if location_id is not None:
+                    return_data['location_id'] = location_id
+                self.add_sale(return_data)
+                line["id"] = return_data["id"]
+                header["total"] -= line['quantity'] * sale['price']
+            else:
+                self._insert("receipts", header)
+                self._index_receipt(header)
+                self._touch("receipts", header["id"])
+                self._notify("receipts", "add", header["id"])
+        if tx.ok:
+            refund.update(header)
+        return tx.ok
+
+    def _return_expiry_lots(self, sale, skip, quantity):
+        """Возвращенный товар - обратно в партии со сроком, из которых он был продан
+
+        Первые skip единиц строки продажи уже возвращены прежними возвратами.
+        """
+        for purchase_id, expiry, allocated in sale.get("lots", []):
+            if quantity <= 0:
+                break
+            if skip >= allocated:
+                skip -= allocated
+                continue
+            back = min(allocated - skip, quantity)
+            skip = 0
+            self.expiry_lots.add(sale["product_id"], back, expiry, purchase_id)
+            quantity -= back
+
+    def get_expiring(self, days=EXPIRY_WARNING_DAYS):
+        """Партии, срок годности которых истекает в ближайшие days дней (и уже истекшие)
+
+        Партии читаются с вершины кучи сроков. Остаток товара мог
+        уменьшиться вручную, поэтому партии товара показываются не
+        больше остатка - начиная с ближайшего срока.
+        """
+        today = date.today()
+        stock = {}
+        result = []
+        for product_id, lot in self.expiry_lots.expiring((today + timedelta(days=days)).isoformat()):
+            product = self._product_index.get(product_id)
+            if product is None:
+                continue
+            remaining = stock.get(product_id, product["quantity"])
+            quantity = min(lot[0], remaining)
+            stock[product_id] = remaining - quantity
+            if quantity > 0:
+                result.append({"product_id": product_id, "name": product["name"], "quantity": quantity,
+                               "expiry": lot[1], "purchase_id": lot[2],
+                               "days_left": (date.fromisoformat(lot[1]) - today).days})
+        return result
+
+    def _supplier_for(self, name):
+        """Поставщик по названию в любом написании (новый добавляется в справочник)"""
+        key = supplier_key(name)
+        if not key:
+            return None
+        supplier = self._supplier_index.get(self._supplier_keys.get(key))
+        if supplier is None:
+            supplier = {"id": self.get_next_supplier_id(), "name": name.strip(), "spend": 0, "purchases": 0,
+                        "orders": 0, "lead_days": 0, "lead_orders": 0, "last_date": None, "prices": {}}
+            self._insert("suppliers", supplier)
+            self._index_supplier(supplier)
+            self._touch("suppliers", supplier["id"])
+            self._notify("suppliers", "add", supplier["id"])
+        return supplier
+
+    def _change_supplier(self, supplier, product_key=None):
+        """Запомнить показатели поставщика (и историю цен товара) до изменения"""
+        history = supplier["prices"].get(product_key) if product_key is not None else None
+        self._touch("suppliers", supplier["id"], supplier)
+        self._record(("supplier", supplier["id"], {field: supplier.get(field) for field in SUPPLIER_TOTALS},
+                      product_key, list(history) if history is not None else None))
+
+    def _count_purchase(self, supplier, purchase):
+        """Учесть закупку в показателях поставщика: сумма, число закупок, история цен"""
+        product_key = str(purchase["product_id"])
+        self._change_supplier(supplier, product_key)
+        supplier["spend"] += purchase["quantity"] * purchase["purchase_price"]
+        supplier["purchases"] += 1
+        supplier["last_date"] = max(supplier["last_date"] or "", purchase.get("date", ""))
+        history = supplier["prices"].setdefault(product_key, [])
+        history.append([purchase.get("date", "")[:10], purchase["purchase_price"]])
+        del history[:-PRICE_HISTORY]
+
+    def _count_order(self, supplier, ordered):
+        """Учесть заказ в показателях поставщика; срок поставки - от даты заказа до приемки"""
+        self._change_supplier(supplier)
+        supplier["orders"] += 1
+        if ordered:
+            supplier["lead_days"] += max((date.today() - date.fromisoformat(ordered)).days, 0)
+            supplier["lead_orders"] += 1
+
+    def get_suppliers(self):
+        """Справочник поставщиков с показателями"""
+        return self.data.get("suppliers", [])
+
+    def find_suppliers(self, prefix, limit=10):
+        """Подсказка названия поставщика: [{"id", "name"}, ...]"""
+        return [{"id": supplier_id, "name": self._supplier_index[supplier_id]["name"]}
+                for supplier_id in self._supplier_trie.complete(prefix, limit)]
+
+    def get_product_names(self):
+        """Справочник названий товаров из журнала продаж: {str(id товара): название}"""
+        return self.data.get("product_names", {})
+
+    def get_write_off_reasons(self):
+        """Справочник причин списания: {код: название}"""
+        return self.data.get("write_off_reasons", WRITE_OFF_REASONS)
+
+    def add_write_off_reason(self, title):
+        """Добавить причину списания в справочник, вернуть ее код (у известной причины - прежний)"""
+        title = (title or "").strip()
+        if not title:
+            return None
+        known = dict(self.get_write_off_reasons())
+        code = self._reason_code(title)
+        if code not in known:
+            self.save_data()
+        return code
+
+    def reason_title(self, record):
+        """Название причины списания записи или чека ("" - причины нет)"""
+        code = record.get("reason_code")
+        return self.get_write_off_reasons().get(code, code) if code else ""
+
+    def get_locations(self):
+        """Места хранения: [{"id", "name"}, ...] (первое - основное, склад)"""
+        return self.data.get("locations", DEFAULT_LOCATIONS)
+
+    def _location(self, location_id):
+        return next((location for location in self.get_locations() if location["id"] == location_id), None)
+
+    @undoable("Добавление места хранения")
+    def add_location(self, name):
+        """Добавить место хранения, вернуть его id (у места с таким названием - прежний)"""
+        name = (name or "").strip()
+        if not name:
+            return None
+        for location in self.get_locations():
+            if location["name"].casefold() == name.casefold():
+                return location["id"]
+        location = {"id": self.get_next_location_id(), "name": name}
+        self._insert("locations", location)
+        self._touch("locations", location["id"])
+        self._notify("locations", "add", location["id"])
+        self.save_data()
+        return location["id"]
+
+    def stock_at(self, product_id, location_id=DEFAULT_LOCATION_ID):
+        """Остаток товара на месте хранения (из индексов, без просмотра данных)"""
+        product = self._product_index.get(product_id)
+        if product is None:
+            return 0
+        if location_id == DEFAULT_LOCATION_ID:
+            return product["quantity"] - self.location_stock.located(product_id)
+        return self.location_stock.at(product_id, location_id)
+
+    def get_location_stock(self, location_id=DEFAULT_LOCATION_ID):
+        """Остатки места хранения: {str(id товара): количество} - только товары в наличии
+
+        Остатки неосновного места берутся из индекса места как есть,
+        остаток склада - общий остаток за вычетом индекса разложенного
+        по другим местам. Отдельного индекса склада нет: на складе лежит
+        почти весь ассортимент, так что перебор товаров сравним по длине с
+        самим ответом, а индекс пришлось бы править при каждом изменении остатка.
+        """
+        if location_id != DEFAULT_LOCATION_ID:
+            return {str(product_id): quantity
+                    for product_id, quantity in self.location_stock.products_at(location_id).items()}
+        stock = {}
+        for product in self.data["products"]:
+            quantity = product["quantity"] - self.location_stock.located(product["id"])
+            if quantity > 0:
+                stock[str(product["id"])] = quantity
+        return stock
+
+    def get_transfers(self):
+        """Журнал перемещений между местами хранения"""
+        return self.data.get("transfers", [])
+
+    @undoable("Перемещение")
+    def transfer(self, transfer):
+        """Переместить товары между местами хранения одной записью журнала перемещений
+
+        transfer - {"from": id места, "to": id места,
+                    "lines": [{"product_id", "quantity"}, ...]}.
+        Общий остаток товаров не меняется. Если хотя бы одну строку
+        переместить нельзя (нет товара, на месте не хватает остатка), не
+        сохраняется ничего. Запись получает id и дату.
+        """
+        source, target = transfer.get("from"), transfer.get("to")
+        lines = [line for line in transfer.get("lines") or [] if line.get("quantity", 0) > 0]
+        if not lines or source == target or self._location(source) is None or self._location(target) is None:
+            print("Перемещение: неверные места хранения или нет товаров")
+            return False
+        entry = {"from": source, "to": target, "lines": []}
+        with self.transaction() as tx:
+            entry["id"] = self.get_next_transfer_id()
+            entry["date"] = datetime.now().isoformat()
+            for line in lines:
+                product_id = line["product_id"]
+                if self.stock_at(product_id, source) < line["quantity"]:
+                    print(f"Перемещение: не хватает товара {product_id} на месте {source}")
+                    tx.rollback()
+                    break
+                # Остаток склада - вычисляемый, меняются только остатки других мест
+                for location_id, delta in ((source, -line["quantity"]), (target, line["quantity"])):
+                    if location_id != DEFAULT_LOCATION_ID:
+                        self.location_stock.change(product_id, location_id, delta)
+                entry["lines"].append({"product_id": product_id, "quantity": line["quantity"]})
+                self._notify("products", "update", product_id)
+            else:
+                self._insert("transfers", entry)
+                self._touch("transfers", entry["id"])
+                self._notify("transfers", "add", entry["id"])
+                self.save_data()
+        if tx.ok:
+            transfer.update(entry)
+        return tx.ok
+
+    @undoable("Приемка заказа")
+    def receive_purchase_order(self, order):
+        """Оприходовать заказ поставщику: все строки одной транзакцией
+
+        order - {"supplier": ..., "ordered": "2026-10-12",
+                 "lines": [{"product_id", "quantity", "purchase_price", "expiry"}, ...]}
+        (ordered - дата заказа для срока поставки, expiry - срок годности
+        партии; оба необязательны).
+        Каждая строка становится закупкой с order_id заказа, в журнал
+        заказов попадает заголовок (поставщик, дата, сумма). Если
+        хотя бы одну строку оприходовать нельзя, не сохраняется ничего.
+        """
+        lines = order.get("lines") or []
+        if not lines:
+            return False
+        header = {"supplier": order.get("supplier", ""), "total": 0}
+        with self.transaction() as tx:
+            header["id"] = self.get_next_purchase_order_id()
+            header["date"] = datetime.now().isoformat()
+            supplier = self._supplier_for(header["supplier"])
+            if supplier is not None:
+                header["supplier"] = supplier["name"]
+                header["supplier_id"] = supplier["id"]
+                self._count_order(supplier, order.get("ordered"))
+            for line in lines:
+                product = self._product_index.get(line["product_id"])
+                if (product is None or line["quantity"] <= 0
+                        or not self.adjust_quantity(product["id"], line["quantity"])):
+                    tx.rollback()
+                    break
+                purchase_data = {
+                    'product_id': product['id'],
+                    'product_name': product['name'],
+                    'quantity': line['quantity'],
+                    'purchase_price': line['purchase_price'],
+                    'supplier': header['supplier'],
+                    'order_id': header['id']
+                }
+                if line.get('expiry'):
+                    purchase_data['expiry'] = line['expiry']
+                self.add_purchase(purchase_data)
+                header["total"] += line['quantity'] * line['purchase_price']
+            else:
+                self._insert("purchase_orders", header)
+                self._touch("purchase_orders", header["id"])
+                self._notify("purchase_orders", "add", header["id"])
+        if tx.ok:
+            order.update(header)
+        return tx.ok
+
+    @undoable("Изменение товара")
     def update_product(self, product_id, updated_data):
         """Обновить товар"""
-        for product in self.data["products"]:
-            if product["id"] == product_id:
-                product.update(updated_data)
-                return self.save_data()
-        return False
+        product = self._product_index.get(product_id)
+        if product is None:
+            return False
+        if not all(self.is_code_available(updated_data.get(field), product_id)
+                   for field in CODE_FIELDS if updated_data.get(field)):
+            print("Артикул или штрихкод уже используется другим товаром")
+            return False
+        if updated_data.get("quantity", product["quantity"]) < self.location_stock.located(product_id):
+            print("Остаток товара меньше количества, разложенного по местам хранения")
+            return False
+        self._touch("products", product_id, product)
+        self._unindex_codes(product)
+        for field, value in updated_data.items():
+            self._set_field(product, field, value)
+        self._index_codes(product)
+        self._notify("products", "update", product_id)
+        return self.save_data()
+
+    @undoable("Массовое изменение")
+    def bulk_update(self, update):
+        """Массовое изменение поля у выбранных товаров одной транзакцией
+
+        update - {"field": "price", "operation": "set" | "percent" | "round", "value": ...,
+                  "product_ids": [...] или "category": ...} (без них - все товары).
+        Новые значения считаются сразу для всех выбранных товаров. После
+        выполнения update["changed"] - id измененных товаров; отменяется
+        изменение, как и остальные операции, шагом истории (undo).
+        """
+        field = update.get("field")
+        operation = update.get("operation")
+        if operation not in BULK_OPERATIONS.get(field, ()):
+            print(f"Операция {operation} недоступна для поля {field}")
+            return False
+        if update.get("product_ids") is not None:
+            products = [self._product_index.get(product_id) for product_id in update["product_ids"]]
+        elif update.get("category"):
+            products = self.filter_by_category(update["category"])
+        else:
+            products = self.data["products"]
+        products = [product for product in products if product is not None]
+        values = self._bulk_values(field, operation, [product.get(field, "") for product in products],
+                                   update.get("value"))
+        if values is None:
+            return False
+        changed = [(product, value) for product, value in zip(products, values) if product.get(field) != value]
+
+        with self.transaction() as tx:
+            for product, value in changed:
+                self._touch("products", product["id"], product)
+                self._set_field(product, field, value)
+                self._notify("products", "update", product["id"])
+            if changed:
+                self.save_data()
+        if tx.ok:
+            update["changed"] = [product["id"] for product, _ in changed]
+        return tx.ok
+
+    @staticmethod
+    def _bulk_values(field, operation, values, argument):
+        """Новые значения поля для всех товаров сразу (None - недопустимый аргумент)
+
+        Текстовое поле принимает только строку, числовое - только число
+        (для "set" - неотрицательное).
+        """
+        if field in BULK_TEXT_FIELDS:
+            if operation == "set" and isinstance(argument, str):
+                return [argument] * len(values)
+            return None
+        if isinstance(argument, bool) or not isinstance(argument, (int, float)) or not math.isfinite(argument):
+            return None
+        argument = float(argument)
+        if operation == "set":
+            return [int(argument)] * len(values) if argument >= 0 else None
+        if operation == "percent":
+            factor = 1 + argument / 100
+            return [max(int(round(value * factor)), 0) for value in values]
+        if operation == "round" and argument > 0:
+            return [int(round(value / argument) * argument) for value in values]
+        return None
+
+    @undoable("Изменение остатка")
+    def adjust_quantity(self, product_id, delta, location_id=None):
+        """Изменить остаток товара на delta (не допускает отрицательного остатка)
+
+        location_id - место хранения, на котором меняется остаток (по
+        умолчанию - склад); остаток места тоже не может стать отрицательным.
+        """
+        product = self._product_index.get(product_id)
+        if product is None:
+            return False
+        new_quantity = product["quantity"] + delta
+        if location_id is None or location_id == DEFAULT_LOCATION_ID:
+            location_id = None
+            available = new_quantity - self.location_stock.located(product_id)
+        elif self._location(location_id) is not None:
+            available = self.location_stock.at(product_id, location_id) + delta
+        else:
+            return False
+        if new_quantity < 0 or available < 0:
+            return False
+        self._touch("products", product_id, product)
+        if location_id is not None:
+            self.location_stock.change(product_id, location_id, delta)
+        self._set_field(product, "quantity", new_quantity)
+        self._notify("products", "update", product_id)
+        return self.save_data()
 
+    @undoable("Удаление товара")
     def delete_product(self, product_id):
         """Удалить товар"""
-        self.data["products"] = [p for p in self.data["products"] if p["id"] != product_id]
+        product = self._product_index.pop(product_id, None)
+        if product is not None:
+            self._touch("products", product_id, product)
+            self._unindex_codes(product)
+            self.location_stock.clear_product(product_id)
+            position = self._find_record(self.data["products"], 0, product)
+            self._record(("remove", "products", position, product))
+            del self.data["products"][position]
+        self._notify("products", "delete", product_id)
         return self.save_data()
 
     def search_products(self, search_text):
@@ -130,11 +1874,69 @@ class DatabaseManager:
         return [p for p in self.data["products"] if p["category"] == category]
 
 
+class Transaction:
+    """Транзакция DatabaseManager: все изменения записываются одним сохранением и отменяются одним шагом"""
+
+    def __init__(self, db):
+        self.db = db
+        self.ok = True
+        self._mark = 0  # С какой дельты шага истории начались изменения транзакции
+        self._opened_step = False
+        self._dirty = False
+
+    def rollback(self):
+        """Отменить транзакцию (изменения будут отброшены при выходе из блока)"""
+        self.ok = False
+        self.db._tx_rollback = True
+
+    def __enter__(self):
+        if self.db._tx_depth == 0:
+            self._opened_step = self.db._begin_step()
+            self._mark = len(self.db._step)
+            self._dirty = self.db._dirty
+        self.db._tx_depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db._tx_depth -= 1
+        if exc_type is not None:
+            self.rollback()
+        if self.db._tx_depth == 0:
+            rollback = self.db._tx_rollback
+            self.db._tx_rollback = False
+            if rollback:
+                self.ok = False
+                self.db._rollback(self._mark, self._dirty)
+            elif self.db.autosave:
+                self.ok = self.db.commit()
+            if self._opened_step:
+                self.db._end_step()
+        return False
+
+
 class ProductTableModel(QAbstractTableModel):
+    """Таблица товаров склада с правкой ячеек
+
+    В режиме правки (editable) изменения ячеек не пишутся в базу сразу, а
+    копятся в pending (id товара -> измененные поля) и сохраняются одной
+    транзакцией. Новые товары до сохранения - черновики с отрицательными id.
+    """
+    # Колонка -> поле товара, которое можно править в таблице
+    EDITABLE_FIELDS = {1: 'name', 2: 'category', 3: 'quantity', 4: 'price', 6: 'description', 7: 'sku'}
+    DIRTY_COLOR = QColor(207, 226, 255)  # Светло-синий - несохраненные правки
+
+    pending_changed = pyqtSignal(int)  # число товаров с несохраненными правками
+    validation_failed = pyqtSignal(str)
+
     def __init__(self, data=None):
         super().__init__()
         self.products = data if data else []
-        self.headers = ['ID', 'Название', 'Категория', 'Количество', 'Цена', 'Сумма', 'Описание']
+        self.headers = ['ID', 'Название', 'Категория', 'Количество', 'Цена', 'Сумма', 'Описание', 'Артикул']
+        self.editable = False
+        self.pending = {}  # id товара -> {поле: новое значение}
+        self.drafts = []  # новые товары, еще не сохраненные в базе
+        self._last_draft_id = 0
+        self.location_stock = None  # {str(id товара): количество} выбранного места хранения, None - общий остаток
 
     def rowCount(self, parent=QModelIndex()):
         return len(self.products)
@@ -149,23 +1951,44 @@ class ProductTableModel(QAbstractTableModel):
         row = index.row()
         col = index.column()
         product = self.products[row]
+        changes = self.pending.get(product['id'])
+        if changes:
+            product = dict(product, **changes)  # Показываем товар с несохраненными правками
 
         if role == Qt.ItemDataRole.DisplayRole:
             if col == 0:  # ID
-                return str(product['id'])
+                return str(product['id']) if product['id'] > 0 else "новый"
             elif col == 1:  # Название
                 return product['name']
             elif col == 2:  # Категория
                 return product['category']
             elif col == 3:  # Количество
-                return str(product['quantity'])
+                return str(self.shown_quantity(product))
             elif col == 4:  # Цена
                 return f"{product['price']:,.0f} ₽"
             elif col == 5:  # Сумма
-                total = product['quantity'] * product['price']
+                total = self.shown_quantity(product) * product['price']
                 return f"{total:,.0f} ₽"
             elif col == 6:  # Описание
                 return product.get('description', '')
+            elif col == 7:  # Артикул
+                return product.get('sku', '')
+
+        elif role == Qt.ItemDataRole.EditRole:
+            field = self.EDITABLE_FIELDS.get(col)
+            if field is not None:
+                return product.get(field, '')
+
+        elif role == Qt.ItemDataRole.UserRole:
+            # Значения для сортировки
+            if col == 0:
+                return product['id']
+            elif col == 3:
+                return self.shown_quantity(product)
+            elif col == 4:
+                return product['price']
+            elif col == 5:
+                return self.shown_quantity(product) * product['price']
 
         elif role == Qt.ItemDataRole.TextAlignmentRole:
             if col in [3, 4, 5]:  # Числовые колонки выравниваем по правому краю
@@ -174,6 +1997,9 @@ class ProductTableModel(QAbstractTableModel):
                 return Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter
 
         elif role == Qt.ItemDataRole.BackgroundRole:
+            # Подсветка строк с несохраненными правками
+            if changes or product['id'] < 0:
+                return self.DIRTY_COLOR
             # Подсветка товаров с малым количеством
             if product['quantity'] < 5:
                 return QColor(255, 243, 205)  # Светло-желтый
@@ -184,26 +2010,169 @@ class ProductTableModel(QAbstractTableModel):
         elif role == Qt.ItemDataRole.ToolTipRole:
             # Всплывающая подсказка с полной информацией
             desc = product.get('description', 'Нет описания')
-            return f"{product['name']}\nКатегория: {product['category']}\nОписание: {desc}"
+            tooltip = f"{product['name']}\nКатегория: {product['category']}\nОписание: {desc}"
+            if product.get('barcode'):
+                tooltip += f"\nШтрихкод: {product['barcode']}"
+            return tooltip
 
         return None
 
     def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
         if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            if section == 3 and self.location_stock is not None:
+                return "На месте"
             return self.headers[section]
         return None
 
+    def flags(self, index):
+        flags = super().flags(index)
+        # Общий остаток не правится, пока показаны остатки одного места хранения
+        if (self.editable and index.column() in self.EDITABLE_FIELDS
+                and not (index.column() == 3 and self.location_stock is not None)):
+            flags |= Qt.ItemFlag.ItemIsEditable
+        return flags
+
+    def shown_quantity(self, product):
+        """Остаток в таблице: на выбранном месте хранения или общий"""
+        if self.location_stock is None:
+            return product['quantity']
+        return self.location_stock.get(str(product['id']), 0)
+
+    def set_location_stock(self, stock):
+        """Показать остатки места хранения (None - общие остатки)"""
+        self.location_stock = stock
+        self.headerDataChanged.emit(Qt.Orientation.Horizontal, 3, 3)
+        if self.products:
+            self.dataChanged.emit(self.index(0, 3), self.index(len(self.products) - 1, 5))
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        """Правка ячейки: значение проверяется и откладывается в pending"""
+        field = self.EDITABLE_FIELDS.get(index.column())
+        if not index.isValid() or role != Qt.ItemDataRole.EditRole or field is None:
+            return False
+        product = self.products[index.row()]
+        value, error = self.validate(product, field, value)
+        if error:
+            self.validation_failed.emit(error)
+            return False
+
+        changes = self.pending.setdefault(product['id'], {})
+        if value == product.get(field, ''):
+            changes.pop(field, None)  # Вернули исходное значение
+        else:
+            changes[field] = value
+        if not changes:
+            del self.pending[product['id']]
+        row = index.row()
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+        self.pending_changed.emit(self.pending_count())
+        return True
+
+    def validate(self, product, field, value):
+        """Проверка значения ячейки: (приведенное значение, текст ошибки или None)"""
+        if field in ('quantity', 'price'):
+            limit = 10000 if field == 'quantity' else 1000000
+            try:
+                number = int(str(value).replace('₽', '').replace(',', '').replace(' ', ''))
+            except ValueError:
+                return value, "Введите целое число"
+            if not 0 <= number <= limit:
+                return value, f"Значение должно быть от 0 до {limit:,}"
+            return number, None
+
+        value = str(value).strip() if field != 'description' else str(value)
+        if field in ('name', 'category') and not value:
+            return value, "Название и категория не могут быть пустыми"
+        if field == 'sku' and value:
+            code = DatabaseManager.normalize_code(value)
+            for other in self.products:
+                other_sku = self.pending.get(other['id'], {}).get('sku', other.get('sku'))
+                if other['id'] != product['id'] and DatabaseManager.normalize_code(other_sku) == code:
+                    return value, f"Артикул '{value}' уже используется товаром '{other['name']}'"
+        return value, None
+
+    def pending_count(self):
+        """Число товаров с несохраненными правками (включая новые)"""
+        return len(set(self.pending) | {draft['id'] for draft in self.drafts})
+
+    def add_draft(self):
+        """Новая строка товара (сохраняется вместе с остальными правками)"""
+        self._last_draft_id -= 1
+        draft = {"id": self._last_draft_id, "name": "", "category": "", "quantity": 0, "price": 0,
+                 "description": "", "sku": "", "barcode": ""}
+        row = len(self.products)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.products.append(draft)
+        self.drafts.append(draft)
+        self.endInsertRows()
+        self.pending_changed.emit(self.pending_count())
+        return row
+
+    def take_changes(self):
+        """Несохраненные правки: ({id товара: изменения}, [новые товары])"""
+        updates = {product_id: dict(changes) for product_id, changes in self.pending.items() if product_id > 0}
+        new_products = []
+        for draft in self.drafts:
+            product = dict(draft, **self.pending.get(draft['id'], {}))
+            del product['id']
+            new_products.append(product)
+        return updates, new_products
+
+    def clear_pending(self):
+        """Сбросить несохраненные правки и черновики"""
+        for draft in self.drafts:
+            self.remove_product(draft['id'])
+        self.drafts = []
+        self.pending.clear()
+        if self.products:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.products) - 1, self.columnCount() - 1))
+        self.pending_changed.emit(0)
+
     def update_data(self, new_data):
         self.beginResetModel()
-        self.products = new_data
+        self.products = list(new_data) + self.drafts
+        # Правки удаленных товаров отбрасываются
+        ids = {product['id'] for product in self.products}
+        self.pending = {product_id: changes for product_id, changes in self.pending.items() if product_id in ids}
         self.endResetModel()
+        self.pending_changed.emit(self.pending_count())
+
+    def find_row(self, product_id):
+        """Номер строки товара или -1"""
+        for row, product in enumerate(self.products):
+            if product['id'] == product_id:
+                return row
+        return -1
+
+    def upsert_product(self, product):
+        """Обновить строку товара (или добавить новую) без сброса модели"""
+        row = self.find_row(product['id'])
+        if row < 0:
+            row = len(self.products)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.products.append(product)
+            self.endInsertRows()
+        else:
+            self.products[row] = product
+            self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+    def remove_product(self, product_id):
+        """Удалить строку товара без сброса модели"""
+        self.pending.pop(product_id, None)
+        row = self.find_row(product_id)
+        if row >= 0:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.products[row]
+            self.endRemoveRows()
 
 
 class SalesTableModel(QAbstractTableModel):
-    def __init__(self, data=None):
+    def __init__(self, data=None, names=None):
         super().__init__()
         self.sales = data if data else []
-        self.headers = ['ID', 'Дата', 'Товар', 'Количество', 'Цена', 'Сумма', 'Тип']
+        self.names = names if names else {}  # str(id товара) -> название (строки чеков его не хранят)
+        self.reasons = {}  # код причины списания -> название
+        self.headers = ['ID', 'Дата', 'Товар', 'Количество', 'Цена', 'Сумма', 'Тип', 'Себестоимость', 'Чек']
 
     def rowCount(self, parent=QModelIndex()):
         return len(self.sales)
@@ -232,7 +2201,7 @@ class SalesTableModel(QAbstractTableModel):
                     pass
                 return date_str
             elif col == 2:  # Товар
-                return sale['product_name']
+                return sale.get('product_name') or self.names.get(str(sale['product_id']), '')
             elif col == 3:  # Количество
                 return str(sale['quantity'])
             elif col == 4:  # Цена
@@ -241,10 +2210,14 @@ class SalesTableModel(QAbstractTableModel):
                 total = sale['quantity'] * sale['price']
                 return f"{total:,.0f} ₽"
             elif col == 6:  # Тип
-                return sale.get('type', 'Продажа')
+                return self.type_title(sale)
+            elif col == 7:  # Себестоимость
+                return f"{sale['cogs']:,.0f} ₽" if 'cogs' in sale else "—"
+            elif col == 8:  # Чек
+                return f"№{sale['receipt_id']}" if 'receipt_id' in sale else "—"
 
         elif role == Qt.ItemDataRole.TextAlignmentRole:
-            if col in [3, 4, 5]:  # Числовые колонки выравниваем по правому краю
+            if col in [3, 4, 5, 7]:  # Числовые колонки выравниваем по правому краю
                 return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
             else:
                 return Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter
@@ -256,11 +2229,27 @@ class SalesTableModel(QAbstractTableModel):
             return self.headers[section]
         return None
 
+    def type_title(self, record):
+        """Тип продажи или чека с причиной списания"""
+        record_type = record.get('type', 'Продажа')
+        if 'reason_code' in record:
+            return f"{record_type}: {self.reasons.get(record['reason_code'], record['reason_code'])}"
+        return record_type
+
     def update_data(self, new_data):
         self.beginResetModel()
-        self.sales = new_data
+        self.sales = list(new_data)
         self.endResetModel()
 
+    def append_rows(self, rows):
+        """Добавить новые записи журнала в конец без сброса модели"""
+        if not rows:
+            return
+        start = len(self.sales)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self.sales.extend(rows)
+        self.endInsertRows()
+
 
 class PurchasesTableModel(QAbstractTableModel):
     def __init__(self, data=None):
@@ -321,9 +2310,169 @@ class PurchasesTableModel(QAbstractTableModel):
 
     def update_data(self, new_data):
         self.beginResetModel()
-        self.purchases = new_data
+        self.purchases = list(new_data)
         self.endResetModel()
 
+    def append_rows(self, rows):
+        """Добавить новые записи журнала в конец без сброса модели"""
+        if not rows:
+            return
+        start = len(self.purchases)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self.purchases.extend(rows)
+        self.endInsertRows()
+
+
+class ProductFilterProxyModel(QSortFilterProxyModel):
+    """Фильтр таблицы товаров по множеству id (в колонке 0 исходной модели)
+
+    Результат поиска, переданный списком, показывается в порядке
+    релевантности, пока пользователь не отсортирует таблицу по колонке.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.visible_ids = None  # None - показывать все товары
+        self.location_ids = None  # Товары выбранного места хранения (None - все)
+        self.ranks = None  # id -> место в результате поиска
+        self.rank_sort = False
+
+    def set_visible_ids(self, ids):
+        """Применить результат поиска одним пересчетом фильтра
+
+        ids - множество id, список id по убыванию релевантности или None.
+        """
+        self.visible_ids = None if ids is None else set(ids)
+        self.ranks = {product_id: rank for rank, product_id in enumerate(ids)} if isinstance(ids, list) else None
+        self.invalidateFilter()
+        if self.ranks is not None:
+            self.rank_sort = True
+            super().sort(0, Qt.SortOrder.AscendingOrder)
+        elif self.rank_sort:
+            self.rank_sort = False
+            super().sort(-1)
+
+    def set_location_ids(self, ids):
+        """Показывать только товары места хранения (вместе с фильтром поиска)"""
+        self.location_ids = None if ids is None else set(ids)
+        self.invalidateFilter()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        # Сортировка по колонке, выбранная пользователем, отменяет порядок релевантности
+        self.rank_sort = False
+        super().sort(column, order)
+
+    def lessThan(self, left, right):
+        if self.rank_sort and self.ranks is not None:
+            return self.ranks.get(self.row_id(left), 0) < self.ranks.get(self.row_id(right), 0)
+        left_value = left.data(Qt.ItemDataRole.UserRole)
+        right_value = right.data(Qt.ItemDataRole.UserRole)
+        if left_value is not None and right_value is not None:
+            return left_value < right_value
+        return super().lessThan(left, right)
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self.visible_ids is None and self.location_ids is None:
+            return True
+        product_id = self.row_id(self.sourceModel().index(source_row, 0, source_parent))
+        # Новые (еще не сохраненные) товары остаются видны при поиске
+        if product_id is None:
+            return True
+        return ((self.visible_ids is None or product_id in self.visible_ids)
+                and (self.location_ids is None or product_id in self.location_ids))
+
+    @staticmethod
+    def row_id(index):
+        """id товара из колонки 0 (None - у нового товара еще нет id)"""
+        value = index.data()
+        return int(value) if value and value.isdigit() else None
+
+
+class TaskSignals(QObject):
+    finished = pyqtSignal(object)
+
+
+class BackgroundTask(QRunnable):
+    """Выполнение функции в пуле потоков с сигналом о завершении"""
+
+    def __init__(self, function, *args):
+        super().__init__()
+        self.function = function
+        self.args = args
+        self.signals = TaskSignals()
+
+    def run(self):
+        self.signals.finished.emit(self.function(*self.args))
+
+
+class SearchSignals(QObject):
+    finished = pyqtSignal(int, object)  # номер запроса, множество id (None - отменен)
+
+
+class SearchTask(QRunnable):
+    """Выполнение поискового запроса в пуле потоков"""
+
+    def __init__(self, index, query, generation, is_cancelled):
+        super().__init__()
+        self.index = index
+        self.query = query
+        self.generation = generation
+        self.is_cancelled = is_cancelled
+        self.signals = SearchSignals()
+
+    def run(self):
+        if self.is_cancelled():
+            return
+        ids = self.index.search(self.query, self.is_cancelled)
+        if ids is not None:
+            self.signals.finished.emit(self.generation, ids)
+
+
+class ProductSearchController(QObject):
+    """Поиск по мере ввода: запрос выполняется после паузы в наборе текста
+
+    Каждое нажатие клавиши делает предыдущий запрос устаревшим: он
+    прерывается в рабочем потоке, а его результат отбрасывается.
+    """
+    results_ready = pyqtSignal(object)  # множество id или None (поиск пустой)
+
+    def __init__(self, index, search_input, parent=None, delay=150):
+        super().__init__(parent)
+        self.index = index
+        self.search_input = search_input
+        self._generation = 0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.run_now)
+        self.search_input.textChanged.connect(self.on_text_changed)
+
+    def on_text_changed(self, text):
+        self._generation += 1  # Запрос в работе больше не нужен
+        self.timer.start()
+
+    def run_now(self):
+        """Выполнить поиск немедленно (Enter, кнопка «Найти»)"""
+        self.timer.stop()
+        self._generation += 1
+        generation = self._generation
+        query = self.search_input.text().strip()
+        if len(query) < MIN_QUERY_LENGTH:
+            self.results_ready.emit(None)
+            return
+
+        task = SearchTask(self.index, query, generation, lambda: generation != self._generation)
+        task.signals.finished.connect(self.on_finished)
+        QThreadPool.globalInstance().start(task)
+
+    def is_active(self):
+        return len(self.search_input.text().strip()) >= MIN_QUERY_LENGTH
+
+    def on_finished(self, generation, ids):
+        if generation == self._generation:
+            self.results_ready.emit(ids)
+
 
 class SalesWidget(QWidget):
     def __init__(self, db, main_window):
@@ -331,7 +2480,10 @@ class SalesWidget(QWidget):
         self.db = db
         self.main_window = main_window
         self.cart_items = []
+        self.cart_index = {}  # id товара -> позиция корзины
+        self.cart_rows = {}  # id товара -> первая ячейка строки корзины
         self.total_amount = 0
+        self.location_stock = {}  # str(id товара) -> остаток на месте продажи
 
         # Создаем макет
         layout = QVBoxLayout()
@@ -346,8 +2498,7 @@ class SalesWidget(QWidget):
         # Подключение сигналов
         self.connect_signals()
 
-        # Загрузка данных
-        self.load_products()
+        # Данные загружает MainWindow после отрисовки страницы (load_page)
 
     def setup_ui(self, layout):
         """Создание интерфейса вручную"""
@@ -356,33 +2507,11 @@ class SalesWidget(QWidget):
 
         # Кнопка возврата на склад
         self.backButton = QPushButton("← Вернуться на склад")
-        self.backButton.setStyleSheet("""
-            QPushButton {
-                padding: 8px 16px;
-                background-color: #6c757d;
-                color: white;
-                border: none;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #545b62;
-            }
-        """)
+        styled(self.backButton, "secondary")
 
         # Кнопка истории продаж
         self.historyButton = QPushButton("📊 История продаж")
-        self.historyButton.setStyleSheet("""
-            QPushButton {
-                padding: 8px 16px;
-                background-color: #17a2b8;
-                color: white;
-                border: none;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #138496;
-            }
-        """)
+        styled(self.historyButton, "info")
 
         nav_layout.addWidget(self.backButton)
         nav_layout.addStretch()
@@ -391,56 +2520,49 @@ class SalesWidget(QWidget):
 
         # Заголовок раздела
         self.sectionTitle = QLabel("Продажи")
-        self.sectionTitle.setStyleSheet("font-size: 20px; font-weight: bold; color: #2c3e50;")
+        styled(self.sectionTitle, "title")
         layout.addWidget(self.sectionTitle)
 
         # Панель поиска
         search_layout = QHBoxLayout()
         self.searchInput = QLineEdit()
         self.searchInput.setPlaceholderText("Поиск товаров по названию, категории...")
-        self.searchInput.setStyleSheet("""
-            QLineEdit {
-                padding: 8px 12px;
-                border: 1px solid #ced4da;
-                border-radius: 4px;
-                font-size: 14px;
-            }
-            QLineEdit:focus {
-                border-color: #007bff;
-            }
-        """)
+        styled(self.searchInput, "search")
         self.search_button = QPushButton("🔍 Найти")
-        self.search_button.setStyleSheet("""
-            QPushButton {
-                padding: 8px 16px;
-                background-color: #007bff;
-                color: white;
-                border: none;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #0056b3;
-            }
-        """)
+        styled(self.search_button, "primary")
         self.filter = QPushButton("⚙️ Фильтры")
-        self.filter.setStyleSheet("""
-            QPushButton {
-                padding: 8px 16px;
-                background-color: #6c757d;
-                color: white;
-                border: none;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #545b62;
-            }
-        """)
+        styled(self.filter, "secondary")
+
+        # Место хранения, с которого отпускается товар
+        self.locationCombo = QComboBox()
+        for location in self.db.get_locations():
+            self.locationCombo.addItem(location['name'], location['id'])
+        styled(self.locationCombo, "form")
 
         search_layout.addWidget(self.searchInput)
         search_layout.addWidget(self.search_button)
         search_layout.addWidget(self.filter)
+        search_layout.addWidget(QLabel("Отпуск с:"))
+        search_layout.addWidget(self.locationCombo)
         layout.addLayout(search_layout)
 
+        # Панель сканера штрихкодов
+        scan_layout = QHBoxLayout()
+        self.scanModeButton = QPushButton("📷 Режим сканера")
+        self.scanModeButton.setCheckable(True)
+        styled(self.scanModeButton, "secondary")
+        self.scanInput = QLineEdit()
+        self.scanInput.setPlaceholderText("Отсканируйте штрихкод или введите артикул (3*код - несколько штук)")
+        styled(self.scanInput, "scanner")
+        self.scanInput.setVisible(False)
+        self.scanStatus = QLabel()
+        styled(self.scanStatus, "status")
+
+        scan_layout.addWidget(self.scanModeButton)
+        scan_layout.addWidget(self.scanInput, 1)
+        scan_layout.addWidget(self.scanStatus, 1)
+        layout.addLayout(scan_layout)
+
         # Основной контент
         content_layout = QHBoxLayout()
 
@@ -448,24 +2570,7 @@ class SalesWidget(QWidget):
         products_group = QGroupBox("📦 Товары")
         products_layout = QVBoxLayout()
         self.productsTable = QTableView()
-        self.productsTable.setStyleSheet("""
-            QTableView {
-                alternate-background-color: #f8f9fa;
-                gridline-color: #dee2e6;
-                selection-background-color: #007bff;
-            }
-            QTableView::item {
-                padding: 8px;
-                border-bottom: 1px solid #dee2e6;
-            }
-            QHeaderView::section {
-                background-color: #e9ecef;
-                padding: 8px;
-                border: none;
-                border-right: 1px solid #dee2e6;
-                font-weight: bold;
-            }
-        """)
+        styled(self.productsTable, "list")
         self.productsTable.setAlternatingRowColors(True)
         self.productsTable.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
         self.productsTable.setSortingEnabled(True)
@@ -476,26 +2581,9 @@ class SalesWidget(QWidget):
         self.quantitySpinBox.setMinimum(1)
         self.quantitySpinBox.setMaximum(999)
         self.quantitySpinBox.setValue(1)
-        self.quantitySpinBox.setStyleSheet("""
-            QSpinBox {
-                padding: 6px;
-                border: 1px solid #ced4da;
-                border-radius: 4px;
-            }
-        """)
+        styled(self.quantitySpinBox, "form")
         self.addButton = QPushButton("➕ Добавить в корзину")
-        self.addButton.setStyleSheet("""
-            QPushButton {
-                padding: 8px 16px;
-                background-color: #28a745;
-                color: white;
-                border: none;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #218838;
-            }
-        """)
+        styled(self.addButton, "success")
 
         quantity_layout.addWidget(quantity_label)
         quantity_layout.addWidget(self.quantitySpinBox)
@@ -510,65 +2598,18 @@ class SalesWidget(QWidget):
         cart_group = QGroupBox("🛒 Корзина")
         cart_layout = QVBoxLayout()
         self.cartTable = QTableView()
-        self.cartTable.setStyleSheet("""
-            QTableView {
-                alternate-background-color: #f8f9fa;
-                gridline-color: #dee2e6;
-                selection-background-color: #17a2b8;
-            }
-            QTableView::item {
-                padding: 8px;
-                border-bottom: 1px solid #dee2e6;
-            }
-            QHeaderView::section {
-                background-color: #e9ecef;
-                padding: 8px;
-                border: none;
-                border-right: 1px solid #dee2e6;
-                font-weight: bold;
-            }
-        """)
+        styled(self.cartTable, "list", accent="info")
         self.cartTable.setAlternatingRowColors(True)
         self.cartTable.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
         self.cartTable.setSortingEnabled(True)
 
         cart_actions_layout = QHBoxLayout()
         self.removeButton = QPushButton("🗑️ Удалить")
-        self.removeButton.setStyleSheet("""
-            QPushButton {
-                padding: 8px 16px;
-                background-color: #dc3545;
-                color: white;
-                border: none;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #c82333;
-            }
-        """)
+        styled(self.removeButton, "danger")
         self.clearButton = QPushButton("🗑️ Очистить корзину")
-        self.clearButton.setStyleSheet("""
-            QPushButton {
-                padding: 8px 16px;
-                background-color: #ffc107;
-                color: #212529;
-                border: none;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #e0a800;
-            }
-        """)
+        styled(self.clearButton, "warning")
         self.totalLabel = QLabel("💰 Итого: 0 ₽")
-        self.totalLabel.setStyleSheet("""
-            font-size: 16px; 
-            font-weight: bold; 
-            color: #d32f2f;
-            background-color: #ffebee; 
-            padding: 8px 16px;
-            border-radius: 4px; 
-            border: 1px solid #f44336;
-        """)
+        styled(self.totalLabel, "total")
         self.totalLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
         cart_actions_layout.addWidget(self.removeButton)
@@ -589,20 +2630,7 @@ class SalesWidget(QWidget):
         footer_layout = QHBoxLayout()
         footer_layout.addStretch()
         self.createSaleButton = QPushButton("✅ Оформить продажу")
-        self.createSaleButton.setStyleSheet("""
-            QPushButton {
-                padding: 12px 24px;
-                background-color: #28a745;
-                color: white;
-                border: none;
-                border-radius: 6px;
-                font-size: 16px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #218838;
-            }
-        """)
+        styled(self.createSaleButton, "success", size="large")
         footer_layout.addWidget(self.createSaleButton)
         layout.addLayout(footer_layout)
 
@@ -611,7 +2639,9 @@ class SalesWidget(QWidget):
         # Таблица товаров
         self.products_model = QStandardItemModel()
         self.products_model.setHorizontalHeaderLabels(["ID", "Название", "Категория", "Цена", "В наличии"])
-        self.productsTable.setModel(self.products_model)
+        self.products_proxy = ProductFilterProxyModel(self)
+        self.products_proxy.setSourceModel(self.products_model)
+        self.productsTable.setModel(self.products_proxy)
         self.productsTable.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
 
         # Настройка ширины колонок для таблицы товаров
@@ -622,6 +2652,10 @@ class SalesWidget(QWidget):
         header.setSectionResizeMode(3, QHeaderView.ResizeMode.ResizeToContents)
         header.setSectionResizeMode(4, QHeaderView.ResizeMode.ResizeToContents)
 
+        # Поиск по мере ввода
+        self.search_controller = ProductSearchController(self.main_window.search_index, self.searchInput, self)
+        self.search_controller.results_ready.connect(self.products_proxy.set_visible_ids)
+
         # Таблица корзины
         self.cart_model = QStandardItemModel()
         self.cart_model.setHorizontalHeaderLabels(["Товар", "Кол-во", "Цена", "Сумма"])
@@ -644,6 +2678,11 @@ class SalesWidget(QWidget):
         self.search_button.clicked.connect(self.search_products)
         self.filter.clicked.connect(self.show_filters)
         self.searchInput.returnPressed.connect(self.search_products)
+        self.locationCombo.currentIndexChanged.connect(lambda index: self.load_products())
+
+        # Сканер штрихкодов
+        self.scanModeButton.toggled.connect(self.set_scan_mode)
+        self.scanInput.returnPressed.connect(self.on_scan)
 
         # Новые кнопки
         self.backButton.clicked.connect(self.return_to_storage)
@@ -657,9 +2696,12 @@ class SalesWidget(QWidget):
         """Показать историю продаж"""
         self.main_window.show_sales_history()
 
-    def load_products(self):
-        """Загрузка товаров из базы данных"""
-        products = self.db.get_products()
+    def load_products(self, products=None):
+        """Загрузка товаров из базы данных (или уже полученного списка)"""
+        if products is None:
+            products = self.db.get_products()
+        # Остатки места продажи - из индекса места хранения
+        self.location_stock = self.db.get_location_stock(self.locationCombo.currentData())
         self.products_model.removeRows(0, self.products_model.rowCount())
 
         for product in products:
@@ -668,7 +2710,7 @@ class SalesWidget(QWidget):
                 QStandardItem(product['name']),
                 QStandardItem(product['category']),
                 QStandardItem(f"{product['price']:,.0f} ₽"),
-                QStandardItem(str(product['quantity']))
+                QStandardItem(str(self.location_stock.get(str(product['id']), 0)))
             ]
 
             # Выравнивание числовых колонок по правому краю
@@ -682,71 +2724,51 @@ class SalesWidget(QWidget):
         """Добавление выбранного товара в корзину"""
         selection = self.productsTable.selectionModel().selectedRows()
         if not selection:
-            QMessageBox.warning(self, "Внимание", "Пожалуйста, выберите товар из списка!")
+            self.main_window.notify("Выберите товар из списка", "warning")
             return
 
-        row = selection[0].row()
+        row = self.products_proxy.mapToSource(selection[0]).row()
         product_id = int(self.products_model.item(row, 0).text())
         product_name = self.products_model.item(row, 1).text()
         price_text = self.products_model.item(row, 3).text().replace(' ₽', '').replace(',', '')
         price = float(price_text)
         quantity = self.quantitySpinBox.value()
 
-        # Проверка наличия товара на складе
-        stock = int(self.products_model.item(row, 4).text())
-        if quantity > stock:
-            QMessageBox.warning(self, "Ошибка", f"Недостаточно товара на складе! В наличии: {stock} шт.")
+        # Проверка наличия товара на месте продажи (с учетом уже лежащего в корзине)
+        stock = self.location_stock.get(str(product_id), 0)
+        if self.cart_quantity(product_id) + quantity > stock:
+            self.main_window.notify(f"Недостаточно товара '{product_name}' ({self.locationCombo.currentText()})! "
+                                    f"В наличии: {stock} шт.", "error")
             return
 
-        total_price = price * quantity
-
-        # Добавление в корзину
-        cart_item = {
-            'id': product_id,
-            'name': product_name,
-            'price': price,
-            'quantity': quantity,
-            'total': total_price
-        }
-
-        # Проверяем, есть ли уже такой товар в корзине
-        existing_item_index = -1
-        for i, item in enumerate(self.cart_items):
-            if item['id'] == product_id:
-                existing_item_index = i
-                break
-
-        if existing_item_index >= 0:
-            # Обновляем существующий товар
-            self.cart_items[existing_item_index]['quantity'] += quantity
-            self.cart_items[existing_item_index]['total'] += total_price
-        else:
-            # Добавляем новый товар
-            self.cart_items.append(cart_item)
-
-        self.update_cart_display()
-        QMessageBox.information(self, "Успех", f"Товар '{product_name}' добавлен в корзину!")
+        self.add_cart_line(product_id, product_name, price, quantity)
+        self.main_window.notify(f"'{product_name}' добавлен в корзину", "success")
 
     def remove_from_cart(self):
         """Удаление выбранного товара из корзины"""
         selection = self.cartTable.selectionModel().selectedRows()
         if not selection:
-            QMessageBox.warning(self, "Внимание", "Пожалуйста, выберите товар для удаления из корзины!")
+            self.main_window.notify("Выберите товар для удаления из корзины", "warning")
             return
 
         row = selection[0].row()
         product_name = self.cart_model.item(row, 0).text()
+        product_id = self.cart_model.item(row, 0).data(Qt.ItemDataRole.UserRole)
 
-        # Удаляем из списка
-        self.cart_items.pop(row)
-        self.update_cart_display()
+        # Удаляем из списка (строка корзины могла быть пересортирована - ищем по id товара)
+        item = self.cart_index.pop(product_id)
+        del self.cart_rows[product_id]
+        self.cart_items.remove(item)
+        self.cart_model.removeRow(row)
+        self.total_amount -= item['total']
+        self.update_total_label()
 
-        QMessageBox.information(self, "Успех", f"Товар '{product_name}' удален из корзины!")
+        self.main_window.notify(f"'{product_name}' удален из корзины")
 
     def clear_cart(self):
         """Очистка всей корзины"""
         if not self.cart_items:
-            QMessageBox.information(self, "Информация", "Корзина уже пуста!")
+            self.main_window.notify("Корзина уже пуста")
             return
 
         reply = QMessageBox.question(self, "Подтверждение",
@@ -756,73 +2778,134 @@ class SalesWidget(QWidget):
         if reply == QMessageBox.StandardButton.Yes:
             self.cart_items.clear()
             self.update_cart_display()
-            QMessageBox.information(self, "Успех", "Корзина очищена!")
+            self.main_window.notify("Корзина очищена")
+
+    def cart_quantity(self, product_id):
+        """Количество товара, уже лежащего в корзине"""
+        item = self.cart_index.get(product_id)
+        return item['quantity'] if item else 0
+
+    def add_cart_line(self, product_id, name, price, quantity):
+        """Добавить товар в корзину, обновив только его строку"""
+        item = self.cart_index.get(product_id)
+        if item is None:
+            item = {
+                'id': product_id,
+                'name': name,
+                'price': price,
+                'quantity': quantity,
+                'total': price * quantity
+            }
+            self.cart_items.append(item)
+            self.cart_index[product_id] = item
+            self.append_cart_row(item)
+        else:
+            item['quantity'] += quantity
+            item['total'] += price * quantity
+            row = self.cart_rows[product_id].row()
+            self.cart_model.item(row, 1).setText(str(item['quantity']))
+            self.cart_model.item(row, 3).setText(f"{item['total']:,.0f} ₽")
+
+        self.total_amount += price * quantity
+        self.update_total_label()
+
+    def append_cart_row(self, item):
+        """Добавить строку корзины в таблицу"""
+        row_items = [
+            QStandardItem(item['name']),
+            QStandardItem(str(item['quantity'])),
+            QStandardItem(f"{item['price']:,.0f} ₽"),
+            QStandardItem(f"{item['total']:,.0f} ₽")
+        ]
+        row_items[0].setData(item['id'], Qt.ItemDataRole.UserRole)
+
+        # Выравнивание числовых колонок
+        row_items[1].setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+        row_items[2].setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+        row_items[3].setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+
+        self.cart_model.appendRow(row_items)
+        self.cart_rows[item['id']] = row_items[0]
+
+    def update_total_label(self):
+        """Обновление общей суммы"""
+        self.totalLabel.setText(f"💰 Итого: {self.total_amount:,.0f} ₽")
 
     def update_cart_display(self):
         """Обновление отображения корзины и общей суммы"""
         self.cart_model.removeRows(0, self.cart_model.rowCount())
+        self.cart_index = {item['id']: item for item in self.cart_items}
+        self.cart_rows = {}
         self.total_amount = 0
 
         for item in self.cart_items:
-            row_items = [
-                QStandardItem(item['name']),
-                QStandardItem(str(item['quantity'])),
-                QStandardItem(f"{item['price']:,.0f} ₽"),
-                QStandardItem(f"{item['total']:,.0f} ₽")
-            ]
+            self.append_cart_row(item)
+            self.total_amount += item['total']
 
-            # Выравнивание числовых колонок
-            row_items[1].setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-            row_items[2].setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
-            row_items[3].setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+        self.update_total_label()
 
-            self.cart_model.appendRow(row_items)
-            self.total_amount += item['total']
+    def set_scan_mode(self, enabled):
+        """Включение режима сканера: коды принимаются в отдельное поле без диалогов"""
+        self.scanInput.setVisible(enabled)
+        self.scanStatus.clear()
+        if enabled:
+            self.scanInput.setFocus()
 
-        # Обновление общей суммы
-        self.totalLabel.setText(f"💰 Итого: {self.total_amount:,.0f} ₽")
+    def on_scan(self):
+        """Обработка кода со сканера: O(1) поиск товара и добавление в корзину"""
+        text = self.scanInput.text().strip()
+        self.scanInput.clear()
+        if not text:
+            return
 
-    def create_sale(self):
-        """Оформление продажи"""
-        if not self.cart_items:
-            QMessageBox.warning(self, "Ошибка", "Корзина пуста! Добавьте товары перед оформлением продажи.")
+        # «3*код» - несколько одинаковых товаров одним сканированием
+        quantity = 1
+        count, separator, code = text.partition('*')
+        if separator and count.strip().isdigit() and int(count) > 0:
+            quantity = int(count)
+            text = code.strip()
+
+        product = self.db.find_by_code(text)
+        if product is None:
+            self.show_scan_status(f"Товар с кодом '{text}' не найден", error=True)
             return
 
-        # Обновляем количество товаров в базе данных и сохраняем продажи
-        for item in self.cart_items:
-            # Находим товар в базе данных
-            product = None
-            for p in self.db.get_products():
-                if p['id'] == item['id']:
-                    product = p
-                    break
+        stock = self.location_stock.get(str(product['id']), 0)
+        if self.cart_quantity(product['id']) + quantity > stock:
+            self.show_scan_status(f"Недостаточно товара '{product['name']}'! "
+                                  f"В наличии: {stock} шт.", error=True)
+            return
 
-            if product:
-                new_quantity = product['quantity'] - item['quantity']
-                if new_quantity < 0:
-                    QMessageBox.warning(self, "Ошибка", f"Недостаточно товара '{product['name']}' на складе!")
-                    return
+        self.add_cart_line(product['id'], product['name'], product['price'], quantity)
+        self.show_scan_status(f"+{quantity} × {product['name']}")
 
-                # Обновляем количество товара
-                self.db.update_product(product['id'], {'quantity': new_quantity})
+    def show_scan_status(self, text, error=False):
+        """Результат сканирования рядом с полем ввода (без модальных окон)"""
+        self.scanStatus.setText(text)
+        set_style_property(self.scanStatus, "state", "error" if error else "ok")
+        if error:
+            QApplication.beep()
 
-                # Сохраняем информацию о продаже
-                sale_data = {
-                    'product_id': product['id'],
-                    'product_name': product['name'],
-                    'quantity': item['quantity'],
-                    'price': product['price'],
-                    'type': 'Продажа'
-                }
-                self.db.add_sale(sale_data)
+    def create_sale(self):
+        """Оформление продажи"""
+        if not self.cart_items:
+            self.main_window.notify("Корзина пуста! Добавьте товары перед оформлением продажи.", "warning")
+            return
 
-        sale_details = "\n".join([f"- {item['name']} x{item['quantity']} = {item['total']:,.0f} ₽"
-                                  for item in self.cart_items])
+        # Чек: остатки уменьшаются и строки сохраняются одной транзакцией
+        receipt = {
+            'type': 'Продажа',
+            'location_id': self.locationCombo.currentData(),
+            'lines': [{'product_id': item['id'], 'quantity': item['quantity'], 'price': item['price']}
+                      for item in self.cart_items]
+        }
+        if not self.db.add_receipt(receipt):
+            self.main_window.notify("Недостаточно товара на месте продажи! Продажа не оформлена.", "error")
+            self.load_products()
+            return
 
-        QMessageBox.information(self, "Продажа оформлена!",
-                                f"Продажа успешно оформлена!\n\n"
-                                f"Состав заказа:\n{sale_details}\n\n"
-                                f"Общая сумма: {self.total_amount:,.0f} ₽")
+        positions = sum(item['quantity'] for item in self.cart_items)
+        self.main_window.notify(f"Чек №{receipt['id']}: {positions} шт. на {receipt['total']:,.0f} ₽", "success")
 
         # Очищаем корзину после успешной продажи
         self.cart_items.clear()
@@ -832,23 +2915,7 @@ class SalesWidget(QWidget):
 
     def search_products(self):
         """Поиск товаров"""
-        search_text = self.searchInput.text().strip().lower()
-
-        if not search_text:
-            # Показываем все товары если поиск пустой
-            for row in range(self.products_model.rowCount()):
-                self.productsTable.setRowHidden(row, False)
-            return
-
-        # Фильтрация товаров
-        for row in range(self.products_model.rowCount()):
-            product_name = self.products_model.item(row, 1).text().lower()
-            product_category = self.products_model.item(row, 2).text().lower()
-
-            if search_text in product_name or search_text in product_category:
-                self.productsTable.setRowHidden(row, False)
-            else:
-                self.productsTable.setRowHidden(row, True)
+        self.search_controller.run_now()
 
     def show_filters(self):
         """Показ диалога фильтров"""
@@ -861,12 +2928,7 @@ class SalesWidget(QWidget):
                                             "Выберите категорию:", categories, 0, False)
         if ok and category:
             # Показываем только товары выбранной категории
-            for row in range(self.products_model.rowCount()):
-                product_category = self.products_model.item(row, 2).text()
-                if product_category == category:
-                    self.productsTable.setRowHidden(row, False)
-                else:
-                    self.productsTable.setRowHidden(row, True)
+            self.products_proxy.set_visible_ids({p['id'] for p in self.db.filter_by_category(category)})
 
 
 class PurchaseWidget(QWidget):
@@ -874,6 +2936,11 @@ class PurchaseWidget(QWidget):
         super().__init__()
         self.db = db
         self.main_window = main_window
+        self.forecast = DemandForecast(db)
+        self.order_lines = []
+        self.order_index = {}  # (id товара, срок годности) -> строка заказа
+        self.order_supplier = ""
+        self.drafts = {}  # ключ названия поставщика (supplier_key) -> отложенные строки заказа
 
         # Создаем макет
         layout = QVBoxLayout()
@@ -888,8 +2955,7 @@ class PurchaseWidget(QWidget):
         # Подключение сигналов
         self.connect_signals()
 
-        # Загрузка данных
-        self.load_products()
+        # Данные загружает MainWindow после отрисовки страницы (load_page)
 
     def setup_ui(self, layout):
         """Создание интерфейса закупок"""
@@ -898,42 +2964,25 @@ class PurchaseWidget(QWidget):
 
         # Кнопка возврата на склад
         self.backButton = QPushButton("← Вернуться на склад")
-        self.backButton.setStyleSheet("""
-            QPushButton {
-                padding: 8px 16px;
-                background-color: #6c757d;
-                color: white;
-                border: none;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #545b62;
-            }
-        """)
+        styled(self.backButton, "secondary")
 
         # Кнопка истории закупок
         self.historyButton = QPushButton("📋 История закупок")
-        self.historyButton.setStyleSheet("""
-            QPushButton {
-                padding: 8px 16px;
-                background-color: #17a2b8;
-                color: white;
-                border: none;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #138496;
-            }
-        """)
+        styled(self.historyButton, "info")
+
+        # Справочник поставщиков с показателями
+        self.suppliersButton = QPushButton("🏭 Поставщики")
+        styled(self.suppliersButton, "info")
 
         nav_layout.addWidget(self.backButton)
         nav_layout.addStretch()
+        nav_layout.addWidget(self.suppliersButton)
         nav_layout.addWidget(self.historyButton)
         layout.addLayout(nav_layout)
 
         # Заголовок раздела
         self.sectionTitle = QLabel("Закупки товаров")
-        self.sectionTitle.setStyleSheet("font-size: 20px; font-weight: bold; color: #2c3e50;")
+        styled(self.sectionTitle, "title")
         layout.addWidget(self.sectionTitle)
 
         # Основной контент
@@ -943,24 +2992,7 @@ class PurchaseWidget(QWidget):
         products_group = QGroupBox("📦 Товары на складе")
         products_layout = QVBoxLayout()
         self.productsTable = QTableView()
-        self.productsTable.setStyleSheet("""
-            QTableView {
-                alternate-background-color: #f8f9fa;
-                gridline-color: #dee2e6;
-                selection-background-color: #007bff;
-            }
-            QTableView::item {
-                padding: 8px;
-                border-bottom: 1px solid #dee2e6;
-            }
-            QHeaderView::section {
-                background-color: #e9ecef;
-                padding: 8px;
-                border: none;
-                border-right: 1px solid #dee2e6;
-                font-weight: bold;
-            }
-        """)
+        styled(self.productsTable, "list")
         self.productsTable.setAlternatingRowColors(True)
         self.productsTable.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
         self.productsTable.setSortingEnabled(True)
@@ -968,80 +3000,95 @@ class PurchaseWidget(QWidget):
         products_layout.addWidget(self.productsTable)
         products_group.setLayout(products_layout)
 
-        # Группа формы закупки
-        purchase_group = QGroupBox("🛒 Оформление закупки")
+        # Группа заказа поставщику
+        purchase_group = QGroupBox("🛒 Заказ поставщику")
         purchase_layout = QVBoxLayout()
 
-        # Форма закупки
+        # Заголовок заказа - поставщик (у каждого поставщика свой черновик заказа)
+        header_layout = QFormLayout()
+        self.supplierInput = QLineEdit()
+        self.supplierInput.setPlaceholderText("Введите название поставщика")
+        styled(self.supplierInput, "form")
+        # Подсказки из справочника поставщиков (поиск по началу любого слова названия)
+        self.supplier_names = QStringListModel()
+        self.supplierCompleter = QCompleter(self.supplier_names, self)
+        self.supplierCompleter.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.supplierInput.setCompleter(self.supplierCompleter)
+        header_layout.addRow("Поставщик:", self.supplierInput)
+
+        # Дата заказа - для срока поставки поставщика; минимальная дата - не указана
+        self.orderDateEdit = QDateEdit()
+        self.orderDateEdit.setCalendarPopup(True)
+        self.orderDateEdit.setMinimumDate(QDate(2000, 1, 1))
+        self.orderDateEdit.setMaximumDate(QDate.currentDate())
+        self.orderDateEdit.setSpecialValueText("не указана")
+        self.orderDateEdit.setDate(self.orderDateEdit.minimumDate())
+        styled(self.orderDateEdit, "form")
+        header_layout.addRow("Дата заказа:", self.orderDateEdit)
+        purchase_layout.addLayout(header_layout)
+
+        # Форма строки заказа
         form_layout = QFormLayout()
 
         self.productCombo = QComboBox()
-        self.productCombo.setStyleSheet("""
-            QComboBox {
-                padding: 6px;
-                border: 1px solid #ced4da;
-                border-radius: 4px;
-            }
-        """)
+        styled(self.productCombo, "form")
 
         self.quantitySpinBox = QSpinBox()
         self.quantitySpinBox.setMinimum(1)
         self.quantitySpinBox.setMaximum(10000)
         self.quantitySpinBox.setValue(1)
-        self.quantitySpinBox.setStyleSheet("""
-            QSpinBox {
-                padding: 6px;
-                border: 1px solid #ced4da;
-                border-radius: 4px;
-            }
-        """)
+        styled(self.quantitySpinBox, "form")
 
         self.purchasePriceSpinBox = QSpinBox()
         self.purchasePriceSpinBox.setMinimum(1)
         self.purchasePriceSpinBox.setMaximum(1000000)
         self.purchasePriceSpinBox.setValue(100)
         self.purchasePriceSpinBox.setPrefix("₽ ")
-        self.purchasePriceSpinBox.setStyleSheet("""
-            QSpinBox {
-                padding: 6px;
-                border: 1px solid #ced4da;
-                border-radius: 4px;
-            }
-        """)
+        styled(self.purchasePriceSpinBox, "form")
 
-        self.supplierInput = QLineEdit()
-        self.supplierInput.setPlaceholderText("Введите название поставщика")
-        self.supplierInput.setStyleSheet("""
-            QLineEdit {
-                padding: 6px;
-                border: 1px solid #ced4da;
-                border-radius: 4px;
-            }
-        """)
+        # Срок годности партии; минимальная дата означает товар без срока
+        self.expiryEdit = QDateEdit()
+        self.expiryEdit.setCalendarPopup(True)
+        self.expiryEdit.setMinimumDate(QDate(2000, 1, 1))
+        self.expiryEdit.setSpecialValueText("без срока")
+        self.expiryEdit.setDate(self.expiryEdit.minimumDate())
+        styled(self.expiryEdit, "form")
 
         form_layout.addRow("Товар:", self.productCombo)
         form_layout.addRow("Количество:", self.quantitySpinBox)
         form_layout.addRow("Цена закупки:", self.purchasePriceSpinBox)
-        form_layout.addRow("Поставщик:", self.supplierInput)
+        form_layout.addRow("Годен до:", self.expiryEdit)
 
         purchase_layout.addLayout(form_layout)
 
-        # Кнопка оформления закупки
-        self.createPurchaseButton = QPushButton("✅ Оформить закупку")
-        self.createPurchaseButton.setStyleSheet("""
-            QPushButton {
-                padding: 12px 24px;
-                background-color: #28a745;
-                color: white;
-                border: none;
-                border-radius: 6px;
-                font-size: 16px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #218838;
-            }
-        """)
+        self.addLineButton = QPushButton("➕ Добавить в заказ")
+        styled(self.addLineButton, "success")
+        purchase_layout.addWidget(self.addLineButton)
+
+        # Строки заказа
+        self.orderTable = QTableView()
+        styled(self.orderTable, "list", accent="info")
+        self.orderTable.setAlternatingRowColors(True)
+        self.orderTable.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.orderTable.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        purchase_layout.addWidget(self.orderTable)
+
+        order_actions_layout = QHBoxLayout()
+        self.removeLineButton = QPushButton("🗑️ Удалить")
+        styled(self.removeLineButton, "danger")
+        self.clearOrderButton = QPushButton("🗑️ Очистить")
+        styled(self.clearOrderButton, "warning")
+        self.orderTotalLabel = QLabel("💰 Итого: 0 ₽")
+        styled(self.orderTotalLabel, "total")
+        order_actions_layout.addWidget(self.removeLineButton)
+        order_actions_layout.addWidget(self.clearOrderButton)
+        order_actions_layout.addStretch()
+        order_actions_layout.addWidget(self.orderTotalLabel)
+        purchase_layout.addLayout(order_actions_layout)
+
+        # Кнопка оприходования заказа
+        self.createPurchaseButton = QPushButton("✅ Оприходовать заказ")
+        styled(self.createPurchaseButton, "success", size="large")
         purchase_layout.addWidget(self.createPurchaseButton)
 
         purchase_group.setLayout(purchase_layout)
@@ -1051,6 +3098,26 @@ class PurchaseWidget(QWidget):
         content_layout.addWidget(purchase_group, 1)
         layout.addLayout(content_layout)
 
+        # Рекомендуемые закупки по прогнозу спроса
+        suggestions_group = QGroupBox("💡 Рекомендуемые закупки")
+        suggestions_layout = QVBoxLayout()
+        self.suggestionsTable = QTableView()
+        styled(self.suggestionsTable, "list")
+        self.suggestionsTable.setAlternatingRowColors(True)
+        self.suggestionsTable.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.suggestionsTable.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        suggestions_hint = QLabel("Двойной щелчок - добавить товар в заказ с рекомендуемым количеством")
+        self.addSuggestionsButton = QPushButton("➕ Все рекомендации в заказ")
+        styled(self.addSuggestionsButton, "info")
+        suggestions_actions_layout = QHBoxLayout()
+        suggestions_actions_layout.addWidget(suggestions_hint)
+        suggestions_actions_layout.addStretch()
+        suggestions_actions_layout.addWidget(self.addSuggestionsButton)
+        suggestions_layout.addWidget(self.suggestionsTable)
+        suggestions_layout.addLayout(suggestions_actions_layout)
+        suggestions_group.setLayout(suggestions_layout)
+        layout.addWidget(suggestions_group)
+
     def setup_tables(self):
         """Настройка таблицы товаров"""
         # Таблица товаров
@@ -1067,12 +3134,39 @@ class PurchaseWidget(QWidget):
         header.setSectionResizeMode(3, QHeaderView.ResizeMode.ResizeToContents)
         header.setSectionResizeMode(4, QHeaderView.ResizeMode.ResizeToContents)
 
+        # Таблица рекомендуемых закупок
+        self.suggestions_model = QStandardItemModel()
+        self.suggestions_model.setHorizontalHeaderLabels(["Товар", "Остаток", "Продаж в день", "Точка заказа",
+                                                          "Рекомендуется"])
+        self.suggestionsTable.setModel(self.suggestions_model)
+        header = self.suggestionsTable.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for column in range(1, 5):
+            header.setSectionResizeMode(column, QHeaderView.ResizeMode.ResizeToContents)
+
+        # Таблица строк заказа
+        self.order_model = QStandardItemModel()
+        self.order_model.setHorizontalHeaderLabels(["Товар", "Кол-во", "Цена", "Сумма", "Годен до"])
+        self.orderTable.setModel(self.order_model)
+        header = self.orderTable.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for column in range(1, 4):
+            header.setSectionResizeMode(column, QHeaderView.ResizeMode.ResizeToContents)
+
     def connect_signals(self):
         """Подключение сигналов кнопок"""
         self.createPurchaseButton.clicked.connect(self.create_purchase)
+        self.addLineButton.clicked.connect(self.add_order_line)
+        self.removeLineButton.clicked.connect(self.remove_order_line)
+        self.clearOrderButton.clicked.connect(self.clear_order)
+        self.addSuggestionsButton.clicked.connect(self.add_all_suggestions)
+        self.supplierInput.editingFinished.connect(self.on_supplier_changed)
+        self.supplierInput.textEdited.connect(self.complete_supplier)
         self.backButton.clicked.connect(self.return_to_storage)
         self.historyButton.clicked.connect(self.show_purchase_history)
+        self.suppliersButton.clicked.connect(self.show_suppliers)
         self.productsTable.selectionModel().selectionChanged.connect(self.on_product_selected)
+        self.suggestionsTable.doubleClicked.connect(self.on_suggestion_double_click)
 
     def return_to_storage(self):
         """Вернуться на склад"""
@@ -1082,6 +3176,14 @@ class PurchaseWidget(QWidget):
         """Показать историю закупок"""
         self.main_window.show_purchase_history()
 
+    def show_suppliers(self):
+        """Показать справочник поставщиков"""
+        SuppliersDialog(self.db, self).exec()
+
+    def complete_supplier(self, text):
+        """Подсказки названия поставщика по введенному началу"""
+        self.supplier_names.setStringList([supplier['name'] for supplier in self.db.find_suppliers(text)])
+
     def on_product_selected(self):
         """Обработка выбора товара в таблице"""
         selection = self.productsTable.selectionModel().selectedRows()
@@ -1095,9 +3197,10 @@ class PurchaseWidget(QWidget):
             if index >= 0:
                 self.productCombo.setCurrentIndex(index)
 
-    def load_products(self):
-        """Загрузка товаров из базы данных"""
-        products = self.db.get_products()
+    def load_products(self, products=None):
+        """Загрузка товаров из базы данных (или уже полученного списка)"""
+        if products is None:
+            products = self.db.get_products()
 
         # Очищаем таблицу
         self.products_model.removeRows(0, self.products_model.rowCount())
@@ -1125,83 +3228,245 @@ class PurchaseWidget(QWidget):
             # Добавляем в комбобокс
             self.productCombo.addItem(f"{product['name']} ({product['category']})", product['id'])
 
-    def create_purchase(self):
-        """Оформление закупки"""
+        self.update_suggestions(products)
+
+    def update_suggestions(self, products):
+        """Рекомендуемые закупки (прогноз пересчитывается только после новых продаж)"""
+        self.suggestions_model.removeRows(0, self.suggestions_model.rowCount())
+        for suggestion in self.forecast.suggestions(products):
+            items = [
+                QStandardItem(suggestion['name']),
+                QStandardItem(str(suggestion['quantity'])),
+                QStandardItem(f"{suggestion['velocity']:.1f}"),
+                QStandardItem(str(suggestion['reorder_point'])),
+                QStandardItem(str(suggestion['suggested']))
+            ]
+            items[0].setData(suggestion['product_id'], Qt.ItemDataRole.UserRole)
+            for item in items[1:]:
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            self.suggestions_model.appendRow(items)
+
+    def on_suggestion_double_click(self, index):
+        """Перенос рекомендации в заказ"""
+        self.add_suggestion(index.row())
+
+    def add_all_suggestions(self):
+        """Перенос всех рекомендаций в заказ"""
+        if not self.suggestions_model.rowCount():
+            self.main_window.notify("Рекомендуемых закупок нет")
+            return
+        for row in range(self.suggestions_model.rowCount()):
+            self.add_suggestion(row)
+        self.main_window.notify(f"В заказ добавлено рекомендаций: {self.suggestions_model.rowCount()}", "success")
+
+    def add_suggestion(self, row):
+        """Строка заказа из рекомендации: цена - по последней закупке товара"""
+        product_id = self.suggestions_model.item(row, 0).data(Qt.ItemDataRole.UserRole)
+        name = self.suggestions_model.item(row, 0).text()
+        quantity = int(self.suggestions_model.item(row, 4).text())
+        price = self.db.get_last_purchase_price(product_id)
+        if price is None:
+            price = self.purchasePriceSpinBox.value()
+        self.add_line(product_id, name, quantity, price)
+
+    def add_order_line(self):
+        """Добавление товара из формы в заказ"""
         if self.productCombo.currentIndex() == -1:
-            QMessageBox.warning(self, "Внимание", "Пожалуйста, выберите товар!")
+            self.main_window.notify("Выберите товар", "warning")
             return
-
         product_id = self.productCombo.currentData()
-        quantity = self.quantitySpinBox.value()
-        purchase_price = self.purchasePriceSpinBox.value()
+        product = self.db.get_product(product_id)
+        if product is None:
+            QMessageBox.critical(self, "Ошибка", "Товар не найден в базе данных")
+            return
+        expiry = None
+        if self.expiryEdit.date() != self.expiryEdit.minimumDate():
+            expiry = self.expiryEdit.date().toString(Qt.DateFormat.ISODate)
+        self.add_line(product_id, product['name'], self.quantitySpinBox.value(), self.purchasePriceSpinBox.value(),
+                      expiry)
+        self.quantitySpinBox.setValue(1)
+        self.expiryEdit.setDate(self.expiryEdit.minimumDate())
+
+    def add_line(self, product_id, name, quantity, purchase_price, expiry=None):
+        """Добавить товар в заказ; повторный товар с тем же сроком годности увеличивает количество своей строки
+
+        Товар с другим сроком - отдельная строка: при приемке она станет отдельной партией.
+        """
+        expiry = expiry or None
+        line = self.order_index.get((product_id, expiry))
+        if line is None:
+            line = {'product_id': product_id, 'name': name, 'quantity': 0, 'purchase_price': purchase_price}
+            if expiry:
+                line['expiry'] = expiry
+            self.order_lines.append(line)
+            self.order_index[(product_id, expiry)] = line
+        line['quantity'] += quantity
+        line['purchase_price'] = purchase_price
+        self.update_order_display()
+
+    def remove_order_line(self):
+        """Удаление выбранной строки заказа"""
+        selection = self.orderTable.selectionModel().selectedRows()
+        if not selection:
+            self.main_window.notify("Выберите строку заказа для удаления", "warning")
+            return
+        key = self.order_model.item(selection[0].row(), 0).data(Qt.ItemDataRole.UserRole)
+        self.order_lines.remove(self.order_index[tuple(key)])
+        self.update_order_display()
+
+    def clear_order(self):
+        """Очистка заказа текущего поставщика"""
+        if not self.order_lines:
+            self.main_window.notify("Заказ уже пуст")
+            return
+        reply = QMessageBox.question(self, "Подтверждение", "Удалить все строки заказа?",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply == QMessageBox.StandardButton.Yes:
+            self.order_lines = []
+            self.update_order_display()
+
+    def on_supplier_changed(self):
+        """Смена поставщика: текущий заказ откладывается, открывается заказ нового поставщика
+
+        Заказы откладываются по ключу названия, поэтому разные написания
+        одного поставщика открывают один заказ.
+        """
         supplier = self.supplierInput.text().strip()
+        key = supplier_key(supplier)
+        if key == supplier_key(self.order_supplier):
+            self.order_supplier = supplier
+            return
+        draft = self.drafts.pop(key, [])
+        if self.order_supplier:
+            if self.order_lines:
+                self.drafts[supplier_key(self.order_supplier)] = self.order_lines
+        else:
+            # Строки, набранные до ввода поставщика, дополняют его отложенный заказ
+            lines = {(line['product_id'], line.get('expiry')): line for line in draft}
+            for line in self.order_lines:
+                existing = lines.get((line['product_id'], line.get('expiry')))
+                if existing is None:
+                    draft.append(line)
+                else:
+                    existing['quantity'] += line['quantity']
+                    existing['purchase_price'] = line['purchase_price']
+        self.order_lines = draft
+        self.order_supplier = supplier
+        self.update_order_display()
+
+    def update_order_display(self):
+        """Обновление таблицы строк заказа и итоговой суммы"""
+        self.order_model.removeRows(0, self.order_model.rowCount())
+        self.order_index = {(line['product_id'], line.get('expiry')): line for line in self.order_lines}
+        total = 0
+        for line in self.order_lines:
+            line_total = line['quantity'] * line['purchase_price']
+            items = [
+                QStandardItem(line['name']),
+                QStandardItem(str(line['quantity'])),
+                QStandardItem(f"{line['purchase_price']:,.0f} ₽"),
+                QStandardItem(f"{line_total:,.0f} ₽"),
+                QStandardItem(date.fromisoformat(line['expiry']).strftime("%d.%m.%Y") if line.get('expiry') else "—")
+            ]
+            items[0].setData((line['product_id'], line.get('expiry')), Qt.ItemDataRole.UserRole)
+            for item in items[1:]:
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            self.order_model.appendRow(items)
+            total += line_total
+        self.orderTotalLabel.setText(f"💰 Итого: {total:,.0f} ₽")
 
+    def create_purchase(self):
+        """Оприходование заказа: все строки сохраняются одной транзакцией"""
+        self.on_supplier_changed()
+        supplier = self.order_supplier
         if not supplier:
             QMessageBox.warning(self, "Внимание", "Пожалуйста, укажите поставщика!")
             return
+        if not self.order_lines:
+            QMessageBox.warning(self, "Внимание", "Добавьте товары в заказ!")
+            return
 
-        # Находим товар в базе данных
-        product = None
-        for p in self.db.get_products():
-            if p['id'] == product_id:
-                product = p
-                break
+        order = {
+            'supplier': supplier,
+            'ordered': None,
+            'lines': [{'product_id': line['product_id'], 'quantity': line['quantity'],
+                       'purchase_price': line['purchase_price'], 'expiry': line.get('expiry')}
+                      for line in self.order_lines]
+        }
+        if self.orderDateEdit.date() != self.orderDateEdit.minimumDate():
+            order['ordered'] = self.orderDateEdit.date().toString(Qt.DateFormat.ISODate)
+        if not self.db.receive_purchase_order(order):
+            QMessageBox.critical(self, "Ошибка", "Не удалось оприходовать заказ. Изменения не сохранены.")
+            self.load_products()
+            return
 
-        if product:
-            # Обновляем количество товара
-            new_quantity = product['quantity'] + quantity
-            if self.db.update_product(product_id, {'quantity': new_quantity}):
-                # Сохраняем информацию о закупке
-                purchase_data = {
-                    'product_id': product_id,
-                    'product_name': product['name'],
-                    'quantity': quantity,
-                    'purchase_price': purchase_price,
-                    'supplier': supplier
-                }
+        positions = sum(line['quantity'] for line in self.order_lines)
+        self.main_window.notify(f"Заказ №{order['id']} оприходован: {len(self.order_lines)} поз., {positions} шт. "
+                                f"на {order['total']:,.0f} ₽ ({supplier})", "success")
 
-                if self.db.add_purchase(purchase_data):
-                    # Обновляем отображение
-                    self.load_products()
-
-                    total_cost = quantity * purchase_price
-                    QMessageBox.information(self, "Закупка оформлена!",
-                                            f"Закупка успешно оформлена!\n\n"
-                                            f"Товар: {product['name']}\n"
-                                            f"Количество: {quantity} шт.\n"
-                                            f"Цена закупки: {purchase_price:,.0f} ₽\n"
-                                            f"Общая стоимость: {total_cost:,.0f} ₽\n"
-                                            f"Поставщик: {supplier}")
-
-                    # Очищаем форму
-                    self.quantitySpinBox.setValue(1)
-                    self.purchasePriceSpinBox.setValue(100)
-                    self.supplierInput.clear()
-                else:
-                    QMessageBox.critical(self, "Ошибка", "Не удалось сохранить информацию о закупке")
-            else:
-                QMessageBox.critical(self, "Ошибка", "Не удалось обновить количество товара")
-        else:
-            QMessageBox.critical(self, "Ошибка", "Товар не найден в базе данных")
+        # Очищаем заказ
+        self.order_lines = []
+        self.update_order_display()
+        self.supplierInput.clear()
+        self.orderDateEdit.setDate(self.orderDateEdit.minimumDate())
+        self.order_supplier = ""
+        self.load_products()
 
 
 class SalesHistoryDialog(QDialog):
+    PERIODS = ["Сегодня", "7 дней", "Этот месяц", "Все время", "Выбранные даты"]
+
     def __init__(self, db, parent=None):
         super().__init__(parent)
         self.db = db
         self.setWindowTitle("История продаж")
         self.setGeometry(100, 100, 900, 600)
+        self.setModal(False)
+
+        # Последний показанный id продажи; stale - нужна полная перезагрузка
+        self.last_id = 0
+        self.stale = True
+        self.total_count = 0
+        self.total_amount = 0
+        self.total_margin = 0
+        self.total_refunds = 0
 
         layout = QVBoxLayout()
 
         # Заголовок
         title_label = QLabel("История продаж и списаний")
-        title_label.setStyleSheet("font-size: 18px; font-weight: bold; margin: 10px;")
+        styled(title_label, "dialogTitle")
         layout.addWidget(title_label)
 
+        # Период
+        period_layout = QHBoxLayout()
+        self.period_combo = QComboBox()
+        self.period_combo.addItems(self.PERIODS)
+        self.period_combo.setCurrentText("Этот месяц")
+        styled(self.period_combo, "form")
+        self.date_from = QDateEdit(QDate.currentDate().addDays(1 - QDate.currentDate().day()))
+        self.date_to = QDateEdit(QDate.currentDate())
+        for date_edit in (self.date_from, self.date_to):
+            date_edit.setCalendarPopup(True)
+            date_edit.setDisplayFormat("dd.MM.yyyy")
+            date_edit.setEnabled(False)  # Даты выбираются только для периода «Выбранные даты»
+            styled(date_edit, "form")
+        period_layout.addWidget(QLabel("Период:"))
+        period_layout.addWidget(self.period_combo)
+        period_layout.addWidget(QLabel("с"))
+        period_layout.addWidget(self.date_from)
+        period_layout.addWidget(QLabel("по"))
+        period_layout.addWidget(self.date_to)
+        period_layout.addStretch()
+        layout.addLayout(period_layout)
+
+        self.period_combo.currentTextChanged.connect(self.on_period_changed)
+        self.date_from.dateChanged.connect(self.on_dates_changed)
+        self.date_to.dateChanged.connect(self.on_dates_changed)
+
         # Статистика
         self.stats_label = QLabel()
-        self.stats_label.setStyleSheet("font-size: 14px; margin: 5px;")
+        styled(self.stats_label, "stats")
         layout.addWidget(self.stats_label)
 
         # Создаем таблицу для отображения продаж
@@ -1223,6 +3488,9 @@ class SalesHistoryDialog(QDialog):
         header.setSectionResizeMode(4, QHeaderView.ResizeMode.ResizeToContents)  # Цена
         header.setSectionResizeMode(5, QHeaderView.ResizeMode.ResizeToContents)  # Сумма
         header.setSectionResizeMode(6, QHeaderView.ResizeMode.ResizeToContents)  # Тип
+        header.setSectionResizeMode(7, QHeaderView.ResizeMode.ResizeToContents)  # Себестоимость
+        header.setSectionResizeMode(8, QHeaderView.ResizeMode.ResizeToContents)  # Чек
+        self.sales_table.doubleClicked.connect(self.show_receipt)
 
         layout.addWidget(self.sales_table)
 
@@ -1230,36 +3498,19 @@ class SalesHistoryDialog(QDialog):
         button_layout = QHBoxLayout()
 
         refresh_btn = QPushButton("🔄 Обновить")
-        refresh_btn.setStyleSheet("""
-            QPushButton {
-                padding: 8px 16px;
-                background-color: #17a2b8;
-                color: white;
-                border: none;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #138496;
-            }
-        """)
+        styled(refresh_btn, "info")
         refresh_btn.clicked.connect(self.load_sales)
 
+        return_btn = QPushButton("↩️ Возврат по чеку")
+        styled(return_btn, "warning")
+        return_btn.clicked.connect(self.create_return)
+
         close_btn = QPushButton("Закрыть")
-        close_btn.setStyleSheet("""
-            QPushButton {
-                padding: 8px 16px;
-                background-color: #6c757d;
-                color: white;
-                border: none;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #545b62;
-            }
-        """)
+        styled(close_btn, "secondary")
         close_btn.clicked.connect(self.close)
 
         button_layout.addWidget(refresh_btn)
+        button_layout.addWidget(return_btn)
         button_layout.addStretch()
         button_layout.addWidget(close_btn)
 
@@ -1268,15 +3519,279 @@ class SalesHistoryDialog(QDialog):
         self.setLayout(layout)
         self.load_sales()
 
+    def on_period_changed(self, period):
+        custom = period == "Выбранные даты"
+        self.date_from.setEnabled(custom)
+        self.date_to.setEnabled(custom)
+        self.stale = True
+        self.load_sales()
+
+    def on_dates_changed(self):
+        if self.period_combo.currentText() == "Выбранные даты":
+            self.stale = True
+            self.load_sales()
+
+    def query_period(self):
+        """Продажи за выбранный период (индекс дат, из архива - только нужные месяцы)"""
+        period = self.period_combo.currentText()
+        today = date.today()
+        self.period_start = self.period_end = None
+        if period == "Сегодня":
+            self.period_start = today.isoformat()
+            return self.db.get_sales_for_day(self.period_start)
+        if period == "7 дней":
+            self.period_start = (datetime.now() - timedelta(days=7)).isoformat()
+            return self.db.get_recent_sales(7 * 24 * 3600)
+        if period == "Этот месяц":
+            self.period_start = today.replace(day=1).isoformat()
+        elif period == "Выбранные даты":
+            self.period_start = self.date_from.date().toPyDate().isoformat()
+            self.period_end = (self.date_to.date().toPyDate() + timedelta(days=1)).isoformat()
+        else:
+            return self.db.get_sales()
+        return self.db.get_sales(self.period_start, self.period_end)
+
+    def in_period(self, sale):
+        sale_date = sale.get('date', '')
+        return ((self.period_start is None or sale_date >= self.period_start)
+                and (self.period_end is None or sale_date < self.period_end))
+
     def load_sales(self):
-        """Загрузка истории продаж"""
-        sales = self.db.get_sales()
-        self.sales_model.update_data(sales)
+        """Загрузка истории продаж (после первой загрузки - только новые записи)"""
+        if self.stale:
+            scroll = self.sales_table.verticalScrollBar().value()
+            sales = self.query_period()
+            # Новые продажи дальше подгружаются начиная с последнего выданного id
+            self.last_id = self.db.get_last_sale_id()
+            self.sales_model.names = self.db.get_product_names()
+            self.sales_model.reasons = self.db.get_write_off_reasons()
+            self.sales_model.update_data(sales)
+            self.sales_table.verticalScrollBar().setValue(scroll)
+            self.stale = False
+            self.total_count = self.total_amount = self.total_margin = self.total_refunds = 0
+        else:
+            new_sales = self.db.get_sales_since(self.last_id)
+            if new_sales:
+                self.last_id = new_sales[-1]['id']
+            sales = [sale for sale in new_sales if self.in_period(sale)]
+            if sales:
+                self.sales_model.names = self.db.get_product_names()
+                self.sales_model.reasons = self.db.get_write_off_reasons()
+            self.sales_model.append_rows(sales)
 
         # Обновляем статистику
-        total_sales = len(sales)
-        total_amount = sum(sale['quantity'] * sale['price'] for sale in sales)
-        self.stats_label.setText(f"Всего операций: {total_sales} | Общая сумма: {total_amount:,.0f} ₽")
+        self.total_count += len(sales)
+        self.total_amount += sum(sale['quantity'] * sale['price'] for sale in sales)
+        # Маржа - по продажам с известной себестоимостью (возвраты ее уменьшают)
+        self.total_margin += sum(sale['quantity'] * sale['price'] - sale['cogs'] for sale in sales
+                                 if 'cogs' in sale and sale.get('type', 'Продажа') in ('Продажа', 'Возврат'))
+        self.total_refunds -= sum(sale['quantity'] * sale['price'] for sale in sales if sale.get('type') == 'Возврат')
+        self.stats_label.setText(f"Всего операций: {self.total_count} | Общая сумма: {self.total_amount:,.0f} ₽ | "
+                                 f"Возвраты: {self.total_refunds:,.0f} ₽ | Маржа: {self.total_margin:,.0f} ₽")
+
+    def create_return(self):
+        """Возврат по чеку выбранной продажи"""
+        selection = self.sales_table.selectionModel().selectedRows()
+        if not selection:
+            QMessageBox.warning(self, "Внимание", "Выберите продажу из чека, по которому оформляется возврат")
+            return
+        sale = self.sales_model.sales[selection[0].row()]
+        receipt = self.db.get_returnable(sale['receipt_id']) if 'receipt_id' in sale else None
+        if receipt is None:
+            QMessageBox.warning(self, "Внимание", "Возврат возможен только по чеку продажи")
+            return
+        if not any(line['returnable'] > 0 for line in receipt['lines']):
+            QMessageBox.information(self, "Возврат", f"Все товары чека №{receipt['id']} уже возвращены")
+            return
+        dialog = ReturnDialog(self.db, receipt, self.sales_model.names, self)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            self.parent().notify(f"Возврат по чеку №{receipt['id']}: {-dialog.refund['total']:,.0f} ₽", "success")
+
+    def show_receipt(self, index):
+        """Состав чека, к которому относится продажа"""
+        sale = self.sales_model.sales[index.row()]
+        receipt = self.db.get_receipt(sale['receipt_id']) if 'receipt_id' in sale else None
+        if receipt is None:
+            QMessageBox.information(self, "Чек", "Продажа оформлена до перехода на чеки")
+            return
+        names = self.sales_model.names
+        lines = "\n".join(f"{line.get('product_name') or names.get(str(line['product_id']), '')}: "
+                          f"{line['quantity']} × {line['price']:,.0f} ₽" for line in receipt['lines'])
+        date_text = datetime.fromisoformat(receipt['date']).strftime("%d.%m.%Y %H:%M")
+        QMessageBox.information(self, f"Чек №{receipt['id']}",
+                                f"{self.sales_model.type_title(receipt)} от {date_text}\n\n{lines}\n\nИтого: {receipt['total']:,.0f} ₽")
+
+    def on_db_changed(self, event):
+        """Новые продажи подгружаются, пока окно открыто"""
+        if event["collection"] not in ("sales", "*"):
+            return
+        if event["collection"] == "*" or (event.get("id") or 0) <= self.last_id:
+            # Журнал перезагружен или изменен «в середине» (слияние, откат транзакции)
+            self.stale = True
+        if self.isVisible():
+            self.load_sales()
+
+
+class ReturnDialog(QDialog):
+    """Выбор количества возвращаемого товара по строкам чека"""
+
+    def __init__(self, db, receipt, names, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.receipt = receipt
+        self.refund = None
+        self.setWindowTitle(f"Возврат по чеку №{receipt['id']}")
+
+        layout = QVBoxLayout()
+        date_text = datetime.fromisoformat(receipt['date']).strftime("%d.%m.%Y %H:%M")
+        title_label = QLabel(f"Чек №{receipt['id']} от {date_text} на {receipt['total']:,.0f} ₽")
+        styled(title_label, "dialogTitle")
+        layout.addWidget(title_label)
+
+        form_layout = QFormLayout()
+        self.spin_boxes = {}  # id строки продажи -> количество к возврату
+        for line in receipt['lines']:
+            name = line.get('product_name') or names.get(str(line['product_id']), '')
+            spin_box = QSpinBox()
+            spin_box.setRange(0, line['returnable'])
+            spin_box.setEnabled(line['returnable'] > 0)
+            styled(spin_box, "form")
+            self.spin_boxes[line['id']] = spin_box
+            form_layout.addRow(f"{name} (продано {line['quantity']}, возвращено {line['returned']}):", spin_box)
+
+        self.reasonInput = QLineEdit()
+        self.reasonInput.setPlaceholderText("Причина возврата")
+        styled(self.reasonInput, "form")
+        form_layout.addRow("Причина:", self.reasonInput)
+        layout.addLayout(form_layout)
+
+        button_layout = QHBoxLayout()
+        return_btn = QPushButton("↩️ Оформить возврат")
+        styled(return_btn, "warning")
+        return_btn.clicked.connect(self.create_return)
+        cancel_btn = QPushButton("Отмена")
+        styled(cancel_btn, "secondary")
+        cancel_btn.clicked.connect(self.reject)
+        button_layout.addStretch()
+        button_layout.addWidget(return_btn)
+        button_layout.addWidget(cancel_btn)
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+
+    def create_return(self):
+        refund = {
+            'receipt_id': self.receipt['id'],
+            'reason': self.reasonInput.text().strip(),
+            'lines': [{'sale_id': sale_id, 'quantity': spin_box.value()}
+                      for sale_id, spin_box in self.spin_boxes.items() if spin_box.value() > 0]
+        }
+        if not refund['lines']:
+            QMessageBox.warning(self, "Внимание", "Укажите количество возвращаемого товара")
+            return
+        if not self.db.add_return(refund):
+            QMessageBox.critical(self, "Ошибка", "Не удалось оформить возврат")
+            return
+        self.refund = refund
+        self.accept()
+
+
+class SuppliersDialog(QDialog):
+    """Поставщики: сумма закупок, срок поставки и история цен по товарам"""
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.setWindowTitle("Поставщики")
+        self.setGeometry(120, 120, 900, 600)
+
+        layout = QVBoxLayout()
+        self.suppliers_table = QTableView()
+        self.suppliers_model = QStandardItemModel()
+        self.suppliers_model.setHorizontalHeaderLabels(["Поставщик", "Закупок", "Заказов", "Сумма",
+                                                        "Срок поставки", "Последняя закупка"])
+        self.suppliers_table.setModel(self.suppliers_model)
+        styled(self.suppliers_table, "list")
+        self.suppliers_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.suppliers_table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.suppliers_table.setAlternatingRowColors(True)
+        self.suppliers_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.suppliers_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.suppliers_table, 2)
+
+        prices_group = QGroupBox("📈 История цен")
+        prices_layout = QVBoxLayout()
+        self.prices_table = QTableView()
+        self.prices_model = QStandardItemModel()
+        self.prices_model.setHorizontalHeaderLabels(["Товар", "Дата", "Цена", "Изменение"])
+        self.prices_table.setModel(self.prices_model)
+        styled(self.prices_table, "list")
+        self.prices_table.setAlternatingRowColors(True)
+        self.prices_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.prices_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        prices_layout.addWidget(self.prices_table)
+        prices_group.setLayout(prices_layout)
+        layout.addWidget(prices_group, 1)
+
+        close_btn = QPushButton("Закрыть")
+        styled(close_btn, "secondary")
+        close_btn.clicked.connect(self.reject)
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        button_layout.addWidget(close_btn)
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+        self.suppliers = sorted(self.db.get_suppliers(), key=lambda supplier: -supplier['spend'])
+        self.load_suppliers()
+        self.suppliers_table.selectionModel().selectionChanged.connect(self.load_prices)
+
+    def load_suppliers(self):
+        for supplier in self.suppliers:
+            lead_time = "—"
+            if supplier['lead_orders']:
+                lead_time = f"{supplier['lead_days'] / supplier['lead_orders']:.1f} дн."
+            last_date = "—"
+            if supplier['last_date']:
+                last_date = datetime.fromisoformat(supplier['last_date']).strftime("%d.%m.%Y")
+            items = [
+                QStandardItem(supplier['name']),
+                QStandardItem(str(supplier['purchases'])),
+                QStandardItem(str(supplier['orders'])),
+                QStandardItem(f"{supplier['spend']:,.0f} ₽"),
+                QStandardItem(lead_time),
+                QStandardItem(last_date)
+            ]
+            for item in items[1:5]:
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            self.suppliers_model.appendRow(items)
+
+    def load_prices(self):
+        """История цен выбранного поставщика: последние цены по каждому товару"""
+        self.prices_model.removeRows(0, self.prices_model.rowCount())
+        selection = self.suppliers_table.selectionModel().selectedRows()
+        if not selection:
+            return
+        supplier = self.suppliers[selection[0].row()]
+        names = self.db.get_product_names()
+        for product_key, history in supplier['prices'].items():
+            product = self.db.get_product(int(product_key))
+            name = product['name'] if product else names.get(product_key, f"Товар #{product_key}")
+            previous = None
+            for day, price in history:
+                change = "—"
+                if previous:
+                    change = f"{(price - previous) / previous * 100:+.1f}%"
+                items = [
+                    QStandardItem(name),
+                    QStandardItem(date.fromisoformat(day).strftime("%d.%m.%Y")),
+                    QStandardItem(f"{price:,.0f} ₽"),
+                    QStandardItem(change)
+                ]
+                for item in items[2:]:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.prices_model.appendRow(items)
+                previous = price
 
 
 class PurchaseHistoryDialog(QDialog):
@@ -1285,17 +3800,25 @@ class PurchaseHistoryDialog(QDialog):
         self.db = db
         self.setWindowTitle("История закупок")
         self.setGeometry(100, 100, 900, 600)
+        self.setModal(False)
+
+        # Последний показанный id закупки; stale - нужна полная перезагрузка
+        self.last_id = 0
+        self.stale = True
+        self.total_count = 0
+        self.total_quantity = 0
+        self.total_amount = 0
 
         layout = QVBoxLayout()
 
         # Заголовок
         title_label = QLabel("История закупок")
-        title_label.setStyleSheet("font-size: 18px; font-weight: bold; margin: 10px;")
+        styled(title_label, "dialogTitle")
         layout.addWidget(title_label)
 
         # Статистика
         self.stats_label = QLabel()
-        self.stats_label.setStyleSheet("font-size: 14px; margin: 5px;")
+        styled(self.stats_label, "stats")
         layout.addWidget(self.stats_label)
 
         # Создаем таблицу для отображения закупок
@@ -1324,33 +3847,11 @@ class PurchaseHistoryDialog(QDialog):
         button_layout = QHBoxLayout()
 
         refresh_btn = QPushButton("🔄 Обновить")
-        refresh_btn.setStyleSheet("""
-            QPushButton {
-                padding: 8px 16px;
-                background-color: #17a2b8;
-                color: white;
-                border: none;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #138496;
-            }
-        """)
+        styled(refresh_btn, "info")
         refresh_btn.clicked.connect(self.load_purchases)
 
         close_btn = QPushButton("Закрыть")
-        close_btn.setStyleSheet("""
-            QPushButton {
-                padding: 8px 16px;
-                background-color: #6c757d;
-                color: white;
-                border: none;
-                border-radius: 4px;
-            }
-            QPushButton:hover {
-                background-color: #545b62;
-            }
-        """)
+        styled(close_btn, "secondary")
         close_btn.clicked.connect(self.close)
 
         button_layout.addWidget(refresh_btn)
@@ -1363,24 +3864,487 @@ class PurchaseHistoryDialog(QDialog):
         self.load_purchases()
 
     def load_purchases(self):
-        """Загрузка истории закупок"""
-        purchases = self.db.get_purchases()
-        self.purchases_model.update_data(purchases)
+        """Загрузка истории закупок (после первой загрузки - только новые записи)"""
+        if self.stale:
+            scroll = self.purchases_table.verticalScrollBar().value()
+            purchases = self.db.get_purchases()
+            self.purchases_model.update_data(purchases)
+            self.purchases_table.verticalScrollBar().setValue(scroll)
+            self.stale = False
+            self.last_id = self.total_count = self.total_quantity = self.total_amount = 0
+        else:
+            purchases = self.db.get_purchases_since(self.last_id)
+            self.purchases_model.append_rows(purchases)
 
+        if purchases:
+            self.last_id = purchases[-1]['id']
         # Обновляем статистику
-        total_purchases = len(purchases)
-        total_quantity = sum(purchase['quantity'] for purchase in purchases)
-        total_amount = sum(purchase['quantity'] * purchase['purchase_price'] for purchase in purchases)
+        self.total_count += len(purchases)
+        self.total_quantity += sum(purchase['quantity'] for purchase in purchases)
+        self.total_amount += sum(purchase['quantity'] * purchase['purchase_price'] for purchase in purchases)
         self.stats_label.setText(
-            f"Всего закупок: {total_purchases} | Товаров: {total_quantity} шт. | Общая сумма: {total_amount:,.0f} ₽")
+            f"Всего закупок: {self.total_count} | Товаров: {self.total_quantity} шт. | "
+            f"Общая сумма: {self.total_amount:,.0f} ₽")
+
+    def on_db_changed(self, event):
+        """Новые закупки подгружаются, пока окно открыто"""
+        if event["collection"] not in ("purchases", "*"):
+            return
+        if event["collection"] == "*" or (event.get("id") or 0) <= self.last_id:
+            # Журнал перезагружен или изменен «в середине» (слияние, откат транзакции)
+            self.stale = True
+        if self.isVisible():
+            self.load_purchases()
+
+
+class ProductMovementDialog(QDialog):
+    """Карточка движения товара: закупки, продажи и списания с остатком"""
+
+    def __init__(self, db, product, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.product = product
+        self.edit_requested = False
+        self.setWindowTitle(f"Движение товара: {product['name']}")
+        self.setGeometry(150, 150, 800, 500)
+
+        layout = QVBoxLayout()
+
+        # Заголовок
+        title_label = QLabel(f"{product['name']} ({product['category']})")
+        styled(title_label, "dialogTitle")
+        layout.addWidget(title_label)
+
+        # Статистика
+        self.stats_label = QLabel()
+        styled(self.stats_label, "stats")
+        layout.addWidget(self.stats_label)
+
+        # Таблица движения
+        self.movements_table = QTableView()
+        self.movements_model = QStandardItemModel()
+        self.movements_model.setHorizontalHeaderLabels(["Дата", "Операция", "Количество", "Цена", "Остаток",
+                                                        "Поставщик / причина"])
+        self.movements_table.setModel(self.movements_model)
+        styled(self.movements_table, "list")
+        self.movements_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.movements_table.setAlternatingRowColors(True)
+        self.movements_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+
+        header = self.movements_table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)  # Дата
+        header.setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)  # Операция
+        header.setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)  # Количество
+        header.setSectionResizeMode(3, QHeaderView.ResizeMode.ResizeToContents)  # Цена
+        header.setSectionResizeMode(4, QHeaderView.ResizeMode.ResizeToContents)  # Остаток
+        header.setSectionResizeMode(5, QHeaderView.ResizeMode.ResizeToContents)  # Поставщик / причина
+        layout.addWidget(self.movements_table)
+
+        # Кнопки управления
+        button_layout = QHBoxLayout()
+
+        edit_btn = QPushButton("✏️ Редактировать товар")
+        styled(edit_btn, "primary")
+        edit_btn.clicked.connect(self.request_edit)
+
+        close_btn = QPushButton("Закрыть")
+        styled(close_btn, "secondary")
+        close_btn.clicked.connect(self.reject)
+
+        button_layout.addWidget(edit_btn)
+        button_layout.addStretch()
+        button_layout.addWidget(close_btn)
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+        self.load_movements()
+
+    def load_movements(self):
+        """Движение товара с остатком после каждой операции
+
+        Остаток считается назад от текущего количества, поэтому ручные
+        правки количества при редактировании товара в нем не видны
+        отдельными строками.
+        """
+        movements = self.db.get_product_movements(self.product['id'])
+
+        stock = self.product['quantity']
+        balances = []
+        for movement in reversed(movements):
+            balances.append(stock)
+            stock -= movement['quantity']
+        balances.reverse()
+
+        self.movements_model.removeRows(0, self.movements_model.rowCount())
+        received = sold = written_off = 0
+        for movement, balance in zip(movements, balances):
+            date_str = movement['date']
+            try:
+                date_str = datetime.fromisoformat(date_str).strftime("%d.%m.%Y %H:%M")
+            except ValueError:
+                pass
+            items = [
+                QStandardItem(date_str),
+                QStandardItem(movement['type']),
+                QStandardItem(f"{movement['quantity']:+d}"),
+                QStandardItem(f"{movement['price']:,.0f} ₽"),
+                QStandardItem(str(balance)),
+                QStandardItem(movement['details'])
+            ]
+            for item in items[2:5]:
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            self.movements_model.appendRow(items)
+
+            if movement['type'] == 'Закупка':
+                received += movement['quantity']
+            elif movement['type'].startswith('Списание'):
+                written_off -= movement['quantity']
+            else:
+                sold -= movement['quantity']  # Возврат уменьшает проданное
+
+        self.stats_label.setText(f"Закуплено: {received} шт. | Продано: {sold} шт. | "
+                                 f"Списано: {written_off} шт. | Остаток: {self.product['quantity']} шт.")
+        self.movements_table.scrollToBottom()
+
+    def request_edit(self):
+        self.edit_requested = True
+        self.accept()
+
+
+class BulkUpdateDialog(QDialog):
+    """Массовое изменение цены или атрибута товаров"""
+    FIELDS = [("Цена", "price"), ("Категория", "category"), ("Описание", "description")]
+    OPERATIONS = [("Установить", "set"), ("Изменить на %", "percent"), ("Округлить до", "round")]
+
+    def __init__(self, categories, selected_ids, visible_ids, parent=None):
+        super().__init__(parent)
+        self.update = None
+        self.selected_ids = selected_ids
+        self.visible_ids = visible_ids
+        self.setWindowTitle("Массовое изменение товаров")
+
+        layout = QVBoxLayout()
+        form_layout = QFormLayout()
+
+        # Какие товары меняются
+        self.scope_combo = QComboBox()
+        styled(self.scope_combo, "form")
+        if selected_ids:
+            self.scope_combo.addItem(f"Выбранные товары ({len(selected_ids)})", "selected")
+        self.scope_combo.addItem(f"Показанные в таблице ({len(visible_ids)})", "visible")
+        for category in categories:
+            self.scope_combo.addItem(f"Категория: {category}", category)
+        form_layout.addRow("Товары:", self.scope_combo)
+
+        self.field_combo = QComboBox()
+        styled(self.field_combo, "form")
+        for title, field in self.FIELDS:
+            self.field_combo.addItem(title, field)
+        form_layout.addRow("Поле:", self.field_combo)
+
+        self.operation_combo = QComboBox()
+        styled(self.operation_combo, "form")
+        form_layout.addRow("Действие:", self.operation_combo)
+
+        self.valueInput = QLineEdit()
+        styled(self.valueInput, "form")
+        form_layout.addRow("Значение:", self.valueInput)
+        layout.addLayout(form_layout)
+
+        button_layout = QHBoxLayout()
+        apply_btn = QPushButton("✅ Применить")
+        styled(apply_btn, "success")
+        apply_btn.clicked.connect(self.apply)
+        cancel_btn = QPushButton("Отмена")
+        styled(cancel_btn, "secondary")
+        cancel_btn.clicked.connect(self.reject)
+        button_layout.addStretch()
+        button_layout.addWidget(apply_btn)
+        button_layout.addWidget(cancel_btn)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        self.field_combo.currentIndexChanged.connect(self.on_field_changed)
+        self.on_field_changed()
+
+    def on_field_changed(self):
+        """Для текстовых полей доступна только установка значения"""
+        operations = BULK_OPERATIONS[self.field_combo.currentData()]
+        self.operation_combo.clear()
+        for title, operation in self.OPERATIONS:
+            if operation in operations:
+                self.operation_combo.addItem(title, operation)
+
+    def apply(self):
+        field = self.field_combo.currentData()
+        operation = self.operation_combo.currentData()
+        value = self.valueInput.text().strip()
+        if field == "price":
+            try:
+                value = float(value.replace(',', '.').replace('%', '').replace('₽', '').replace(' ', ''))
+            except ValueError:
+                QMessageBox.warning(self, "Внимание", "Введите число")
+                return
+        elif field == "category" and not value:
+            QMessageBox.warning(self, "Внимание", "Категория не может быть пустой")
+            return
+
+        update = {"field": field, "operation": operation, "value": value}
+        scope = self.scope_combo.currentData()
+        if scope == "selected":
+            update["product_ids"] = self.selected_ids
+        elif scope == "visible":
+            update["product_ids"] = self.visible_ids
+        else:
+            update["category"] = scope
+        self.update = update
+        self.accept()
+
+
+class WriteOffDialog(QDialog):
+    """Списание нескольких товаров: количество по каждому и общая причина из справочника"""
+
+    def __init__(self, products, reasons, parent=None):
+        super().__init__(parent)
+        self.receipt = None
+        self.reason_title = None  # Новая причина, которой еще нет в справочнике
+        self.setWindowTitle("Списание товаров")
+
+        layout = QVBoxLayout()
+        title_label = QLabel(f"Выбрано товаров: {len(products)}")
+        styled(title_label, "dialogTitle")
+        layout.addWidget(title_label)
+
+        form_layout = QFormLayout()
+        self.lines = []  # (товар, поле количества)
+        for product in products:
+            spin_box = QSpinBox()
+            spin_box.setRange(0, product['quantity'])
+            spin_box.setValue(product['quantity'])
+            styled(spin_box, "form")
+            self.lines.append((product, spin_box))
+            form_layout.addRow(f"{product['name']} (на складе {product['quantity']}):", spin_box)
+
+        # Причину можно выбрать из справочника или ввести новую
+        self.reason_combo = QComboBox()
+        self.reason_combo.setEditable(True)
+        for code, title in reasons.items():
+            self.reason_combo.addItem(title, code)
+        styled(self.reason_combo, "form")
+        form_layout.addRow("Причина:", self.reason_combo)
+        layout.addLayout(form_layout)
+
+        button_layout = QHBoxLayout()
+        write_off_btn = QPushButton("🗑️ Списать")
+        styled(write_off_btn, "danger")
+        write_off_btn.clicked.connect(self.apply)
+        cancel_btn = QPushButton("Отмена")
+        styled(cancel_btn, "secondary")
+        cancel_btn.clicked.connect(self.reject)
+        button_layout.addStretch()
+        button_layout.addWidget(write_off_btn)
+        button_layout.addWidget(cancel_btn)
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+
+    def apply(self):
+        lines = [{'product_id': product['id'], 'quantity': spin_box.value(), 'price': product['price']}
+                 for product, spin_box in self.lines if spin_box.value() > 0]
+        if not lines:
+            QMessageBox.warning(self, "Внимание", "Укажите количество списываемого товара")
+            return
+        title = self.reason_combo.currentText().strip()
+        if not title:
+            QMessageBox.warning(self, "Внимание", "Укажите причину списания")
+            return
+        index = self.reason_combo.findText(title)
+        self.receipt = {'type': 'Списание', 'lines': lines}
+        if index >= 0:
+            self.receipt['reason_code'] = self.reason_combo.itemData(index)
+        else:
+            self.reason_title = title
+        self.accept()
+
+
+class ExpiringDialog(QDialog):
+    """Партии с истекающим (и истекшим) сроком годности, списание выбранных партий"""
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.receipt = None
+        self.setWindowTitle("Сроки годности")
+        self.setGeometry(150, 150, 700, 450)
+
+        layout = QVBoxLayout()
+        days_layout = QHBoxLayout()
+        days_layout.addWidget(QLabel("Истекает в ближайшие дни:"))
+        self.days_spin = QSpinBox()
+        self.days_spin.setRange(0, 365)
+        self.days_spin.setValue(EXPIRY_WARNING_DAYS)
+        styled(self.days_spin, "form")
+        days_layout.addWidget(self.days_spin)
+        days_layout.addStretch()
+        layout.addLayout(days_layout)
+
+        self.lots_table = QTableView()
+        self.lots_model = QStandardItemModel()
+        self.lots_model.setHorizontalHeaderLabels(["Товар", "Количество", "Годен до", "Осталось дней", "Закупка"])
+        self.lots_table.setModel(self.lots_model)
+        styled(self.lots_table, "list")
+        self.lots_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.lots_table.setAlternatingRowColors(True)
+        self.lots_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.lots_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.lots_table)
+
+        button_layout = QHBoxLayout()
+        write_off_btn = QPushButton("🗑️ Списать выбранные партии")
+        styled(write_off_btn, "danger")
+        write_off_btn.clicked.connect(self.write_off)
+        close_btn = QPushButton("Закрыть")
+        styled(close_btn, "secondary")
+        close_btn.clicked.connect(self.reject)
+        button_layout.addWidget(write_off_btn)
+        button_layout.addStretch()
+        button_layout.addWidget(close_btn)
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+        self.days_spin.valueChanged.connect(self.load_lots)
+        self.load_lots()
+
+    def load_lots(self):
+        self.lots = self.db.get_expiring(self.days_spin.value())
+        self.lots_model.removeRows(0, self.lots_model.rowCount())
+        for lot in self.lots:
+            items = [
+                QStandardItem(lot['name']),
+                QStandardItem(str(lot['quantity'])),
+                QStandardItem(date.fromisoformat(lot['expiry']).strftime("%d.%m.%Y")),
+                QStandardItem(str(lot['days_left']) if lot['days_left'] >= 0 else "истек"),
+                QStandardItem(f"№{lot['purchase_id']}")
+            ]
+            if lot['days_left'] < 0:
+                for item in items:
+                    item.setForeground(QColor("#dc3545"))
+            for item in items[1:]:
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            self.lots_model.appendRow(items)
+
+    def write_off(self):
+        """Списание выбранных партий одним чеком с причиной «Истек срок годности»
+
+        Строка чека указывает выбранные партии товара, поэтому списываются
+        именно они, а не партии с ближайшим сроком.
+        """
+        rows = [index.row() for index in self.lots_table.selectionModel().selectedRows()]
+        if not rows:
+            QMessageBox.warning(self, "Внимание", "Выберите партии для списания")
+            return
+        selected = {}
+        for row in rows:
+            lot = self.lots[row]
+            selected.setdefault(lot['product_id'], []).append([lot['purchase_id'], lot['expiry'], lot['quantity']])
+        lines = []
+        for product_id, lots in selected.items():
+            product = self.db.get_product(product_id)
+            if product is not None:
+                lines.append({'product_id': product_id, 'quantity': sum(lot[2] for lot in lots),
+                              'price': product['price'], 'lots': lots})
+        # Причина - по названию: код мог быть создан при переводе старых списаний
+        self.receipt = {'type': 'Списание', 'reason_title': WRITE_OFF_REASONS["expired"], 'lines': lines}
+        self.accept()
+
+
+class TransferDialog(QDialog):
+    """Перемещение выбранных товаров между местами хранения"""
+
+    def __init__(self, db, products, location_id=None, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.transfer = None
+        self.setWindowTitle("Перемещение товаров")
+
+        layout = QVBoxLayout()
+        title_label = QLabel(f"Выбрано товаров: {len(products)}")
+        styled(title_label, "dialogTitle")
+        layout.addWidget(title_label)
+
+        form_layout = QFormLayout()
+        self.source_combo = QComboBox()
+        self.target_combo = QComboBox()
+        for combo in (self.source_combo, self.target_combo):
+            for location in db.get_locations():
+                combo.addItem(location['name'], location['id'])
+            styled(combo, "form")
+        # Откуда - место, показанное в таблице склада; куда - следующее по списку
+        source = max(self.source_combo.findData(location_id), 0)
+        self.source_combo.setCurrentIndex(source)
+        self.target_combo.setCurrentIndex((source + 1) % self.target_combo.count())
+        form_layout.addRow("Откуда:", self.source_combo)
+        form_layout.addRow("Куда:", self.target_combo)
+
+        self.lines = []  # (товар, подпись, поле количества)
+        for product in products:
+            label = QLabel()
+            spin_box = QSpinBox()
+            styled(spin_box, "form")
+            self.lines.append((product, label, spin_box))
+            form_layout.addRow(label, spin_box)
+        layout.addLayout(form_layout)
+
+        button_layout = QHBoxLayout()
+        transfer_btn = QPushButton("🔀 Переместить")
+        styled(transfer_btn, "primary")
+        transfer_btn.clicked.connect(self.apply)
+        cancel_btn = QPushButton("Отмена")
+        styled(cancel_btn, "secondary")
+        cancel_btn.clicked.connect(self.reject)
+        button_layout.addStretch()
+        button_layout.addWidget(transfer_btn)
+        button_layout.addWidget(cancel_btn)
+        layout.addLayout(button_layout)
+
+        self.setLayout(layout)
+        self.source_combo.currentIndexChanged.connect(self.on_source_changed)
+        self.on_source_changed()
+
+    def on_source_changed(self):
+        """Количество можно выбрать в пределах остатка на месте «откуда»"""
+        location_id = self.source_combo.currentData()
+        for product, label, spin_box in self.lines:
+            stock = self.db.stock_at(product['id'], location_id)
+            label.setText(f"{product['name']} (в наличии {stock}):")
+            spin_box.setRange(0, stock)
+            spin_box.setValue(stock)
+
+    def apply(self):
+        source, target = self.source_combo.currentData(), self.target_combo.currentData()
+        if source == target:
+            QMessageBox.warning(self, "Внимание", "Выберите разные места хранения")
+            return
+        lines = [{'product_id': product['id'], 'quantity': spin_box.value()}
+                 for product, _, spin_box in self.lines if spin_box.value() > 0]
+        if not lines:
+            QMessageBox.warning(self, "Внимание", "Укажите количество перемещаемого товара")
+            return
+        self.transfer = {'from': source, 'to': target, 'lines': lines}
+        self.accept()
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    # Изменения данных другими кассами (приходят из потока клиента сервера)
+    db_changed = pyqtSignal(object)
+
+    def __init__(self, db=None):
         super().__init__()
+        self.startup_time = time.perf_counter()
+        self.startup_reported = False
 
-        # Инициализация базы данных
-        self.db = DatabaseManager()
+        # Инициализация базы данных (локальный файл или сервер базы данных)
+        self.db = db if db is not None else DatabaseManager()
 
         # Инициализация UI из сгенерированного файла
         self.ui = Ui_MainWindow()
@@ -1390,14 +4354,23 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Учет товаров магазина - v4.0 [Полная версия]")
         self.setMinimumSize(800, 600)
 
-        # Настройка светлой цветовой палитры
-        self.set_light_theme()
+        # Вид кнопок навигации задается темой приложения (theme.py) через свойство active
+        for button in (self.ui.storage, self.ui.purchase, self.ui.sales):
+            button.setStyleSheet("")
+        self.ui.storage.setProperty("active", True)
+
+        # Всплывающие уведомления вместо модальных окон на частых операциях
+        self.notifications = NotificationCenter(self)
+
+        # Поисковый индекс товаров (общий для склада и продаж) строится в фоне
+        self.search_index = ProductSearchIndex()
+        self.rebuild_search_index()
 
         # Создаем stacked widget для переключения между интерфейсами
         self.setup_stacked_widget()
 
-        # Инициализация данных
-        self.init_data()
+        # Данные склада загружаются после первой отрисовки окна (showEvent)
+        self.products = []
 
         # Настройка таблицы
         self.setup_table()
@@ -1410,48 +4383,69 @@ class MainWindow(QMainWindow):
         # Создаем stacked widget
         self.stacked_widget = QStackedWidget()
 
-        # Создаем виджеты для разных разделов
-        self.sales_widget = SalesWidget(self.db, self)
-        self.purchase_widget = PurchaseWidget(self.db, self)
+        # Разделы продаж и закупок создаются при первом переходе (get_sales_widget, get_purchase_widget)
+        self.sales_widget = None
+        self.purchase_widget = None
+        self.sales_history_dialog = None
+        self.purchase_history_dialog = None
+        self.page_loads = {}  # страница -> номер последней загрузки
 
-        # Добавляем виджеты в stacked widget
-        self.stacked_widget.addWidget(self.ui.centralwidget)  # индекс 0 - основной интерфейс (склад)
-        self.stacked_widget.addWidget(self.sales_widget)  # индекс 1 - интерфейс продаж
-        self.stacked_widget.addWidget(self.purchase_widget)  # индекс 2 - интерфейс закупок
+        # Добавляем основной интерфейс (склад) в stacked widget
+        self.stacked_widget.addWidget(self.ui.centralwidget)
 
         # Устанавливаем stacked widget как центральный виджет
         self.setCentralWidget(self.stacked_widget)
 
-    def set_light_theme(self):
-        """Установка светлой темы для приложения"""
-        app = QApplication.instance()
-
-        # Создаем светлую палитру
-        palette = QPalette()
-        palette.setColor(QPalette.ColorRole.Window, QColor(255, 255, 255))
-        palette.setColor(QPalette.ColorRole.WindowText, QColor(0, 0, 0))
-        palette.setColor(QPalette.ColorRole.Base, QColor(255, 255, 255))
-        palette.setColor(QPalette.ColorRole.AlternateBase, QColor(245, 245, 245))
-        palette.setColor(QPalette.ColorRole.ToolTipBase, QColor(255, 255, 255))
-        palette.setColor(QPalette.ColorRole.ToolTipText, QColor(0, 0, 0))
-        palette.setColor(QPalette.ColorRole.Text, QColor(0, 0, 0))
-        palette.setColor(QPalette.ColorRole.Button, QColor(240, 240, 240))
-        palette.setColor(QPalette.ColorRole.ButtonText, QColor(0, 0, 0))
-        palette.setColor(QPalette.ColorRole.BrightText, QColor(255, 0, 0))
-        palette.setColor(QPalette.ColorRole.Link, QColor(0, 120, 215))
-        palette.setColor(QPalette.ColorRole.Highlight, QColor(0, 120, 215))
-        palette.setColor(QPalette.ColorRole.HighlightedText, QColor(255, 255, 255))
-
-        app.setPalette(palette)
-
-        # Устанавливаем стиль, который хорошо работает на всех платформах
-        app.setStyle('Fusion')
+    def get_sales_widget(self):
+        """Раздел продаж (создается при первом обращении)"""
+        if self.sales_widget is None:
+            started = time.perf_counter()
+            self.sales_widget = SalesWidget(self.db, self)
+            self.stacked_widget.addWidget(self.sales_widget)
+            print(f"Раздел продаж создан за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return self.sales_widget
+
+    def get_purchase_widget(self):
+        """Раздел закупок (создается при первом обращении)"""
+        if self.purchase_widget is None:
+            started = time.perf_counter()
+            self.purchase_widget = PurchaseWidget(self.db, self)
+            self.stacked_widget.addWidget(self.purchase_widget)
+            print(f"Раздел закупок создан за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return self.purchase_widget
+
+    def load_page(self, page):
+        """Загрузка товаров страницы в фоне - страница отрисовывается сразу"""
+        load_id = self.page_loads.get(page, 0) + 1
+        self.page_loads[page] = load_id
+        task = BackgroundTask(self.fetch_products)
+        task.signals.finished.connect(lambda products: self.on_page_loaded(page, load_id, products))
+        QThreadPool.globalInstance().start(task)
+
+    def fetch_products(self):
+        """Получение списка товаров (выполняется в пуле потоков)"""
+        try:
+            return list(self.db.get_products())
+        except (OSError, RuntimeError) as e:
+            print(f"Ошибка загрузки товаров: {e}")
+            return None
+
+    def on_page_loaded(self, page, load_id, products):
+        if products is None or self.page_loads.get(page) != load_id:
+            return  # Ошибка загрузки или уже запущена более новая загрузка
+        page.load_products(products)
 
     def setup_table(self):
         """Настройка таблицы товаров"""
         # Создаем модель данных
         self.table_model = ProductTableModel(self.products)
-        self.ui.tableView.setModel(self.table_model)
+        self.table_proxy = ProductFilterProxyModel(self)
+        self.table_proxy.setSourceModel(self.table_model)
+        self.ui.tableView.setModel(self.table_proxy)
+
+        # Поиск по мере ввода
+        self.search_controller = ProductSearchController(self.search_index, self.ui.searchInput, self)
+        self.search_controller.results_ready.connect(self.apply_search_results)
 
         # Настраиваем внешний вид таблицы
         self.ui.tableView.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
@@ -1467,6 +4461,53 @@ class MainWindow(QMainWindow):
         header.setSectionResizeMode(4, QHeaderView.ResizeMode.ResizeToContents)  # Цена
         header.setSectionResizeMode(5, QHeaderView.ResizeMode.ResizeToContents)  # Сумма
         header.setSectionResizeMode(6, QHeaderView.ResizeMode.ResizeToContents)  # Описание
+        header.setSectionResizeMode(7, QHeaderView.ResizeMode.ResizeToContents)  # Артикул
+
+        # Правка товаров прямо в таблице с сохранением пакетом
+        self.inlineEditButton = QPushButton("✏️ Правка в таблице")
+        self.inlineEditButton.setCheckable(True)
+        styled(self.inlineEditButton, "secondary")
+        self.addRowButton = QPushButton("➕ Новая строка")
+        styled(self.addRowButton, "info")
+        self.saveEditsButton = QPushButton("💾 Сохранить")
+        styled(self.saveEditsButton, "success")
+        self.discardEditsButton = QPushButton("↩️ Отменить правки")
+        styled(self.discardEditsButton, "warning")
+        for button in (self.inlineEditButton, self.addRowButton, self.saveEditsButton, self.discardEditsButton):
+            self.ui.footerLayout.addWidget(button)
+        self.on_pending_changed(0)
+
+        # Массовое изменение цен и атрибутов
+        self.bulkUpdateButton = QPushButton("🧮 Массовое изменение")
+        styled(self.bulkUpdateButton, "info")
+        self.ui.actionsLayout.insertWidget(4, self.bulkUpdateButton)
+
+        # Партии с истекающим сроком годности
+        self.expiringButton = QPushButton("⏳ Сроки годности")
+        styled(self.expiringButton, "warning")
+        self.ui.actionsLayout.insertWidget(5, self.expiringButton)
+
+        # Остатки по местам хранения и перемещение между ними
+        self.transferButton = QPushButton("🔀 Перемещение")
+        styled(self.transferButton, "info")
+        self.ui.actionsLayout.insertWidget(6, self.transferButton)
+        self.locationCombo = QComboBox()
+        styled(self.locationCombo, "form")
+        self.ui.searchLayout.addWidget(self.locationCombo)
+        self.load_locations()
+        # Остатки места перечитываются один раз после серии изменений
+        self.location_timer = QTimer(self)
+        self.location_timer.setSingleShot(True)
+        self.location_timer.setInterval(0)
+        self.location_timer.timeout.connect(self.show_location)
+
+        # Отмена и повтор операций (Ctrl+Z / Ctrl+Y)
+        self.undoButton = QPushButton("↶ Отменить")
+        self.redoButton = QPushButton("↷ Повторить")
+        for button in (self.undoButton, self.redoButton):
+            styled(button, "secondary")
+            self.ui.footerLayout.addWidget(button)
+        self.update_undo_buttons()
 
     def connect_signals(self):
         """Подключение всех сигналов к слотам"""
@@ -1493,41 +4534,257 @@ class MainWindow(QMainWindow):
         # Двойной клик по таблице для редактирования
         self.ui.tableView.doubleClicked.connect(self.on_table_double_click)
 
+        # Правка в таблице
+        self.inlineEditButton.toggled.connect(self.set_inline_editing)
+        self.addRowButton.clicked.connect(self.add_inline_row)
+        self.saveEditsButton.clicked.connect(self.save_inline_edits)
+        self.discardEditsButton.clicked.connect(self.discard_inline_edits)
+        self.table_model.pending_changed.connect(self.on_pending_changed)
+        self.table_model.validation_failed.connect(lambda error: self.notify(error, "error"))
+
+        # Массовое изменение, отмена и повтор
+        self.bulkUpdateButton.clicked.connect(self.bulk_update)
+        self.expiringButton.clicked.connect(self.show_expiring)
+        self.transferButton.clicked.connect(self.transfer_products)
+        self.locationCombo.currentIndexChanged.connect(lambda index: self.show_location())
+        self.undoButton.clicked.connect(self.undo)
+        self.redoButton.clicked.connect(self.redo)
+        QShortcut(QKeySequence.StandardKey.Undo, self).activated.connect(self.undo)
+        QShortcut(QKeySequence.StandardKey.Redo, self).activated.connect(self.redo)
+
+        # Изменения данных, сделанные другими кассами или внешними программами
+        self.db_changed.connect(self.on_db_changed)
+        self.db.add_listener(self.db_changed.emit)
+        self.setup_file_watcher()
+
+    def setup_file_watcher(self):
+        """Отслеживание изменений файла базы данных другими процессами"""
+        if not isinstance(self.db, DatabaseManager):
+            return  # Файлом владеет сервер базы данных
+
+        self.file_watcher = QFileSystemWatcher(self)
+        self.file_watcher.addPath(os.path.abspath(self.db.filename))
+        self.file_watcher.fileChanged.connect(self.on_database_file_changed)
+
+        # Внешняя программа может писать файл в несколько приемов - ждем паузы
+        self.file_check_timer = QTimer(self)
+        self.file_check_timer.setSingleShot(True)
+        self.file_check_timer.setInterval(300)
+        self.file_check_timer.timeout.connect(self.check_database_file)
+
+    def on_database_file_changed(self, path):
+        """Файл базы данных изменен или заменен"""
+        self.file_check_timer.start()
+
+    def check_database_file(self):
+        """Слияние внешних изменений файла базы данных"""
+        path = os.path.abspath(self.db.filename)
+        # При замене файла (в том числе при нашей собственной записи) наблюдение снимается
+        if path not in self.file_watcher.files() and os.path.exists(path):
+            self.file_watcher.addPath(path)
+
+        conflicts = self.db.check_external_changes()
+        if conflicts:
+            details = "\n".join(f"- {c['collection']} #{c['id']}: {c['reason']}" for c in conflicts)
+            QMessageBox.warning(self, "Конфликт изменений",
+                                f"Файл базы данных изменен другой программой.\n"
+                                f"Для следующих записей сохранены локальные изменения:\n{details}")
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.startup_reported:
+            # Загрузка данных - после того, как окно отрисовано
+            self.startup_reported = True
+            QTimer.singleShot(0, self.init_data)
+
     def init_data(self):
         """Инициализация данных из базы"""
         self.products = self.db.get_products()
         self.update_display()
 
+        # Время до готовности склада к работе
+        elapsed = (time.perf_counter() - self.startup_time) * 1000
+        print(f"Склад готов к работе за {elapsed:.0f} мс")
+        self.ui.statusbar.showMessage(f"Загружено товаров: {len(self.products)} за {elapsed:.0f} мс", 5000)
+
+        expiring = self.db.get_expiring()
+        if expiring:
+            expired = sum(1 for lot in expiring if lot['days_left'] < 0)
+            text = f"Истекает срок годности: {len(expiring)} партий"
+            self.notify(f"{text}, из них истекли: {expired}" if expired else text, "warning")
+
     def update_display(self):
         """Обновление отображения данных"""
-        total_products = len(self.products)
-        total_value = sum(p["quantity"] * p["price"] for p in self.products)
-
-        # Обновление статистики
-        self.ui.statsLabel.setText(f"Всего: {total_products} товаров | Сумма: {total_value:,.0f} ₽")
+        self.update_stats()
 
         # Обновление данных в таблице
         if hasattr(self, 'table_model'):
             self.table_model.update_data(self.products)
 
+    def on_db_changed(self, event):
+        """Обновление индексов и отображения после изменений данных"""
+        self.update_search_index(event)
+        if event["collection"] == "history":
+            self.update_undo_buttons()
+        if event["collection"] in ("locations", "*"):
+            self.load_locations()
+        if event["collection"] in ("products", "*") and self.locationCombo.currentData() is not None:
+            self.location_timer.start()
+        # Свои изменения окно показывает само, отмена обновляет строки так же, как внешние изменения
+        if not event.get("external") and not event.get("undo"):
+            return
+        current = self.stacked_widget.currentWidget()
+        if event["collection"] in ("products", "*"):
+            if current is not self.ui.centralwidget:
+                self.load_page(current)
+
+            self.products = self.db.get_products()
+            if event["collection"] == "products" and event.get("id") is not None:
+                # Точечное обновление строки без сброса таблицы
+                product = self.db.get_product(event["id"])
+                if event["action"] == "delete" or product is None:
+                    self.table_model.remove_product(event["id"])
+                else:
+                    self.table_model.upsert_product(product)
+                self.update_stats()
+            else:
+                self.update_display()
+            if self.search_controller.is_active():
+                self.search_controller.run_now()
+        if event.get("external"):
+            self.ui.statusbar.showMessage("Данные изменены вне программы", 3000)
+
+    def rebuild_search_index(self):
+        """Перестроение поискового индекса в пуле потоков"""
+        self.index_pending_ids = set()  # Товары, измененные во время перестроения
+        task = BackgroundTask(self.search_index.rebuild, list(self.db.get_products()))
+        task.signals.finished.connect(self.on_search_index_built)
+        QThreadPool.globalInstance().start(task)
+
+    def on_search_index_built(self, result):
+        pending_ids, self.index_pending_ids = self.index_pending_ids, None
+        for product_id in pending_ids:
+            product = self.db.get_product(product_id)
+            if product is None:
+                self.search_index.remove(product_id)
+            else:
+                self.search_index.update(product)
+        if self.search_controller.is_active():
+            self.search_controller.run_now()
+
+    def update_search_index(self, event):
+        """Поддержание поискового индекса в актуальном состоянии"""
+        if event["collection"] == "*":
+            self.rebuild_search_index()
+        elif event["collection"] == "products" and event.get("id") is not None:
+            if self.index_pending_ids is not None:
+                self.index_pending_ids.add(event["id"])
+            product = self.db.get_product(event["id"])
+            if event["action"] == "delete" or product is None:
+                self.search_index.remove(event["id"])
+            else:
+                self.search_index.update(product)
+
+    def update_stats(self):
+        """Обновление статистики склада"""
+        total_products = len(self.products)
+        total_value = sum(p["quantity"] * p["price"] for p in self.products)
+        self.ui.statsLabel.setText(f"Всего: {total_products} товаров | Сумма: {total_value:,.0f} ₽")
+
     def get_selected_product(self):
         """Получить выбранный товар из таблицы"""
         selection = self.ui.tableView.selectionModel()
         if selection.hasSelection():
-            row = selection.selectedRows()[0].row()
-            if row < len(self.products):
-                return self.products[row]
+            row = self.table_proxy.mapToSource(selection.selectedRows()[0]).row()
+            # Новые товары, еще не сохраненные из таблицы, не выбираются для операций
+            if 0 <= row < len(self.table_model.products) and self.table_model.products[row]['id'] > 0:
+                return self.table_model.products[row]
         return None
 
+    def set_inline_editing(self, enabled):
+        """Включение правки ячеек таблицы (изменения копятся до сохранения)"""
+        self.table_model.editable = enabled
+        if enabled:
+            triggers = (QAbstractItemView.EditTrigger.DoubleClicked | QAbstractItemView.EditTrigger.EditKeyPressed
+                        | QAbstractItemView.EditTrigger.AnyKeyPressed)
+        else:
+            triggers = QAbstractItemView.EditTrigger.NoEditTriggers
+        self.ui.tableView.setEditTriggers(triggers)
+        self.on_pending_changed(self.table_model.pending_count())
+
+    def on_pending_changed(self, count):
+        """Кнопки сохранения видны в режиме правки и пока есть несохраненные правки"""
+        visible = self.table_model.editable or count > 0
+        self.addRowButton.setVisible(self.table_model.editable)
+        self.saveEditsButton.setVisible(visible)
+        self.discardEditsButton.setVisible(visible)
+        self.saveEditsButton.setEnabled(count > 0)
+        self.discardEditsButton.setEnabled(count > 0)
+        self.saveEditsButton.setText(f"💾 Сохранить ({count})" if count else "💾 Сохранить")
+
+    def add_inline_row(self):
+        """Новая строка товара в таблице"""
+        row = self.table_model.add_draft()
+        index = self.table_proxy.mapFromSource(self.table_model.index(row, 1))
+        self.ui.tableView.scrollTo(index)
+        self.ui.tableView.setCurrentIndex(index)
+        self.ui.tableView.edit(index)
+
+    def save_inline_edits(self):
+        """Сохранение всех правок таблицы одной транзакцией"""
+        updates, new_products = self.table_model.take_changes()
+        if any(not product['name'] or not product['category'] for product in new_products):
+            QMessageBox.warning(self, "Внимание", "Укажите название и категорию новых товаров")
+            return
+
+        with self.db.transaction() as tx:
+            for product_id, changes in updates.items():
+                if not self.db.update_product(product_id, changes):
+                    tx.rollback()
+                    break
+            else:
+                for product in new_products:
+                    if not self.db.add_product(product):
+                        tx.rollback()
+                        break
+
+        self.products = self.db.get_products()
+        if not tx.ok:
+            # Откат вернул прежние данные - перечитываем таблицу, правки остаются несохраненными
+            self.update_display()
+            QMessageBox.critical(self, "Ошибка", "Правки не сохранены: товар удален или артикул уже занят")
+            return
+
+        # Обновляются только измененные строки
+        self.table_model.clear_pending()
+        for product_id in list(updates) + [product['id'] for product in new_products]:
+            product = self.db.get_product(product_id)
+            if product is not None:
+                self.table_model.upsert_product(product)
+        self.update_stats()
+        self.notify(f"Сохранено товаров: {len(updates) + len(new_products)}", "success")
+
+    def discard_inline_edits(self):
+        """Отмена всех несохраненных правок таблицы"""
+        reply = QMessageBox.question(self, "Подтверждение",
+                                     f"Отменить правки товаров: {self.table_model.pending_count()}?",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply == QMessageBox.StandardButton.Yes:
+            self.table_model.clear_pending()
+
     def on_table_double_click(self, index):
-        """Обработка двойного клика по таблице"""
+        """Обработка двойного клика по таблице - карточка движения товара"""
+        if self.table_model.editable:
+            return  # В режиме правки двойной клик открывает редактор ячейки
         product = self.get_selected_product()
         if product:
-            self.edit_selected_product()
+            dialog = ProductMovementDialog(self.db, product, self)
+            if dialog.exec() and dialog.edit_requested:
+                self.edit_selected_product()
 
     def show_storage(self):
         """Показать раздел Склад"""
-        self.stacked_widget.setCurrentIndex(0)
+        self.stacked_widget.setCurrentWidget(self.ui.centralwidget)
         self.ui.sectionTitle.setText("Склад товаров")
         self.update_navigation_style("storage")
         self.products = self.db.get_products()  # Загружаем все товары
@@ -1535,27 +4792,46 @@ class MainWindow(QMainWindow):
 
     def show_purchase(self):
         """Показать раздел Закупка"""
-        self.stacked_widget.setCurrentIndex(2)
+        page = self.get_purchase_widget()
+        self.stacked_widget.setCurrentWidget(page)
         self.update_navigation_style("purchase")
         # Обновляем данные в виджете закупок
-        self.purchase_widget.load_products()
+        self.load_page(page)
 
     def show_sales(self):
         """Показать раздел Продажи"""
-        self.stacked_widget.setCurrentIndex(1)
+        page = self.get_sales_widget()
+        self.stacked_widget.setCurrentWidget(page)
         self.update_navigation_style("sales")
         # Обновляем данные в виджете продаж
-        self.sales_widget.load_products()
+        self.load_page(page)
 
     def show_sales_history(self):
-        """Показать историю продаж"""
-        dialog = SalesHistoryDialog(self.db, self)
-        dialog.exec()
+        """Показать историю продаж (окно создается один раз и не блокирует работу)"""
+        if self.sales_history_dialog is None:
+            self.sales_history_dialog = SalesHistoryDialog(self.db, self)
+            self.db_changed.connect(self.sales_history_dialog.on_db_changed)
+        else:
+            self.sales_history_dialog.load_sales()
+        self.show_dialog(self.sales_history_dialog)
 
     def show_purchase_history(self):
-        """Показать историю закупок"""
-        dialog = PurchaseHistoryDialog(self.db, self)
-        dialog.exec()
+        """Показать историю закупок (окно создается один раз и не блокирует работу)"""
+        if self.purchase_history_dialog is None:
+            self.purchase_history_dialog = PurchaseHistoryDialog(self.db, self)
+            self.db_changed.connect(self.purchase_history_dialog.on_db_changed)
+        else:
+            self.purchase_history_dialog.load_purchases()
+        self.show_dialog(self.purchase_history_dialog)
+
+    def show_dialog(self, dialog):
+        dialog.show()
+        dialog.raise_()
+        dialog.activateWindow()
+
+    def notify(self, text, level="info"):
+        """Неблокирующее уведомление (info, success, warning, error)"""
+        self.notifications.notify(text, level)
 
     def update_navigation_style(self, active_button):
         """Обновление стиля навигационных кнопок"""
@@ -1566,33 +4842,8 @@ class MainWindow(QMainWindow):
         }
 
         for name, button in buttons.items():
-            if name == active_button:
-                button.setChecked(True)
-                button.setStyleSheet("""
-                    QPushButton {
-                        text-align: left;
-                        padding: 12px 15px;
-                        border: none;
-                        background-color: #007bff;
-                        color: white;
-                        border-left: 3px solid #0056b3;
-                    }
-                """)
-            else:
-                button.setChecked(False)
-                button.setStyleSheet("""
-                    QPushButton {
-                        text-align: left;
-                        padding: 12px 15px;
-                        border: none;
-                        border-left: 3px solid transparent;
-                        background-color: transparent;
-                        color: #2c3e50;
-                    }
-                    QPushButton:hover {
-                        background-color: #e9ecef;
-                    }
-                """)
+            button.setChecked(name == active_button)
+            set_style_property(button, "active", name == active_button)
 
     def add_product(self):
         """Добавить новый товар"""
@@ -1603,6 +4854,8 @@ class MainWindow(QMainWindow):
             quantity, ok2 = QInputDialog.getInt(self, "Добавить товар", "Количество:", 0, 0, 10000)
             price, ok3 = QInputDialog.getInt(self, "Добавить товар", "Цена:", 0, 0, 1000000)
             description, ok4 = QInputDialog.getText(self, "Добавить товар", "Описание:")
+            sku, ok5 = QInputDialog.getText(self, "Добавить товар", "Артикул:")
+            barcode, ok6 = QInputDialog.getText(self, "Добавить товар", "Штрихкод:")
 
             if ok1 and ok2 and ok3:
                 new_product = {
@@ -1610,16 +4863,32 @@ class MainWindow(QMainWindow):
                     "category": category,
                     "quantity": quantity,
                     "price": price,
-                    "description": description if ok4 else ""
+                    "description": description if ok4 else "",
+                    "sku": sku.strip() if ok5 else "",
+                    "barcode": barcode.strip() if ok6 else ""
                 }
 
+                if not self.check_product_codes(new_product):
+                    return
+
                 if self.db.add_product(new_product):
                     self.products = self.db.get_products()
                     self.update_display()
-                    QMessageBox.information(self, "Успех", f"Товар '{name}' добавлен!")
+                    self.notify(f"Товар '{name}' добавлен", "success")
                 else:
                     QMessageBox.critical(self, "Ошибка", "Не удалось сохранить товар в базу данных")
 
+    def check_product_codes(self, product, product_id=None):
+        """Проверка уникальности артикула и штрихкода"""
+        for field, title in (('sku', 'Артикул'), ('barcode', 'Штрихкод')):
+            code = product.get(field)
+            if code and not self.db.is_code_available(code, product_id):
+                owner = self.db.find_by_code(code)
+                QMessageBox.warning(self, "Внимание",
+                                    f"{title} '{code}' уже используется товаром '{owner['name']}'")
+                return False
+        return True
+
     def edit_product(self):
         """Редактировать товар"""
         product = self.get_selected_product()
@@ -1644,6 +4913,10 @@ class MainWindow(QMainWindow):
             price, ok3 = QInputDialog.getInt(self, "Редактировать товар", "Цена:", product['price'], 0, 1000000)
             description, ok4 = QInputDialog.getText(self, "Редактировать товар", "Описание:",
                                                     text=product.get('description', ''))
+            sku, ok5 = QInputDialog.getText(self, "Редактировать товар", "Артикул:",
+                                            text=product.get('sku', ''))
+            barcode, ok6 = QInputDialog.getText(self, "Редактировать товар", "Штрихкод:",
+                                                text=product.get('barcode', ''))
 
             if ok1 and ok2 and ok3:
                 updated_data = {
@@ -1651,13 +4924,18 @@ class MainWindow(QMainWindow):
                     'category': category,
                     'quantity': quantity,
                     'price': price,
-                    'description': description if ok4 else product.get('description', '')
+                    'description': description if ok4 else product.get('description', ''),
+                    'sku': sku.strip() if ok5 else product.get('sku', ''),
+                    'barcode': barcode.strip() if ok6 else product.get('barcode', '')
                 }
 
+                if not self.check_product_codes(updated_data, product['id']):
+                    return
+
                 if self.db.update_product(product['id'], updated_data):
                     self.products = self.db.get_products()
                     self.update_display()
-                    QMessageBox.information(self, "Успех", f"Товар '{name}' обновлен!")
+                    self.notify(f"Товар '{name}' обновлен", "success")
                 else:
                     QMessageBox.critical(self, "Ошибка", "Не удалось обновить товар в базе данных")
 
@@ -1675,7 +4953,7 @@ class MainWindow(QMainWindow):
             if self.db.delete_product(product['id']):
                 self.products = self.db.get_products()
                 self.update_display()
-                QMessageBox.information(self, "Успех", f"Товар '{product['name']}' удален!")
+                self.notify(f"Товар '{product['name']}' удален", "success")
             else:
                 QMessageBox.critical(self, "Ошибка", "Не удалось удалить товар из базы данных")
 
@@ -1688,15 +4966,83 @@ class MainWindow(QMainWindow):
 
         new_product = product.copy()
         new_product['name'] = f"{product['name']} (копия)"
-        # ID будет сгенерирован автоматически при добавлении
+        # ID будет сгенерирован автоматически при добавлении, артикул и штрихкод должны быть уникальными
+        new_product.pop('sku', None)
+        new_product.pop('barcode', None)
 
         if self.db.add_product(new_product):
             self.products = self.db.get_products()
             self.update_display()
-            QMessageBox.information(self, "Успех", f"Товар скопирован!")
+            self.notify("Товар скопирован", "success")
         else:
             QMessageBox.critical(self, "Ошибка", "Не удалось скопировать товар в базу данных")
 
+    def selected_product_ids(self):
+        """id всех выбранных строк таблицы"""
+        rows = [self.table_proxy.mapToSource(index).row()
+                for index in self.ui.tableView.selectionModel().selectedRows()]
+        return [self.table_model.products[row]['id'] for row in rows if self.table_model.products[row]['id'] > 0]
+
+    def visible_product_ids(self):
+        """id товаров, показанных в таблице с учетом поиска и фильтра"""
+        ids = []
+        for row in range(self.table_proxy.rowCount()):
+            product = self.table_model.products[self.table_proxy.mapToSource(self.table_proxy.index(row, 0)).row()]
+            if product['id'] > 0:
+                ids.append(product['id'])
+        return ids
+
+    def bulk_update(self):
+        """Массовое изменение цены или атрибута товаров"""
+        categories = sorted({p['category'] for p in self.db.get_products()})
+        dialog = BulkUpdateDialog(categories, self.selected_product_ids(), self.visible_product_ids(), self)
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+        update = dialog.update
+        if not self.db.bulk_update(update):
+            QMessageBox.critical(self, "Ошибка", "Не удалось выполнить массовое изменение")
+            return
+        self.apply_bulk_result(update)
+        self.notify(f"Изменено товаров: {len(update['changed'])} (Ctrl+Z - отменить)", "success")
+
+    def undo(self):
+        """Отмена последней операции с данными (Ctrl+Z)"""
+        self.step_history(redo=False)
+
+    def redo(self):
+        """Повтор отмененной операции (Ctrl+Y)"""
+        self.step_history(redo=True)
+
+    def step_history(self, redo):
+        """Отмена или повтор шага истории (с сервером - своего шага кассы); таблица обновляется по событиям отмены"""
+        label = self.db.history_label(redo)
+        if label is None:
+            return
+        if self.table_model.pending_count():
+            QMessageBox.warning(self, "Внимание", "Сначала сохраните или отмените правки в таблице")
+            return
+        if self.db.redo() if redo else self.db.undo():
+            self.notify(f"{'Повторено' if redo else 'Отменено'}: {label}")
+        else:
+            QMessageBox.warning(self, "Внимание",
+                                f"Операцию «{label}» нельзя {'повторить' if redo else 'отменить'}: "
+                                f"данные изменены позже. История отмены очищена.")
+
+    def update_undo_buttons(self):
+        for button, redo, text in ((self.undoButton, False, "Отменить"), (self.redoButton, True, "Повторить")):
+            label = self.db.history_label(redo)
+            button.setEnabled(label is not None)
+            button.setToolTip(f"{text}: {label}" if label else "")
+
+    def apply_bulk_result(self, update):
+        """Обновление только измененных строк таблицы"""
+        self.products = self.db.get_products()
+        for product_id in update["changed"]:
+            product = self.db.get_product(product_id)
+            if product is not None:
+                self.table_model.upsert_product(product)
+        self.update_stats()
+
     def create_sale(self):
         """Создать продажу"""
         product = self.get_selected_product()
@@ -1704,82 +5050,137 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Внимание", "Выберите товар для продажи")
             return
 
-        if product['quantity'] == 0:
+        available = self.location_quantity(product)
+        if available == 0:
             QMessageBox.warning(self, "Внимание", "Товар отсутствует на складе")
             return
 
         quantity, ok = QInputDialog.getInt(self, "Продажа товара",
-                                           f"Количество для продажи (доступно: {product['quantity']}):",
-                                           1, 1, product['quantity'])
+                                           f"Количество для продажи (доступно: {available}):",
+                                           1, 1, available)
         if ok:
-            new_quantity = product['quantity'] - quantity
-            if self.db.update_product(product['id'], {'quantity': new_quantity}):
-                # Сохраняем информацию о продаже
-                sale_data = {
-                    'product_id': product['id'],
-                    'product_name': product['name'],
-                    'quantity': quantity,
-                    'price': product['price'],
-                    'type': 'Продажа'
-                }
+            receipt = {
+                'type': 'Продажа',
+                'location_id': self.locationCombo.currentData(),
+                'lines': [{'product_id': product['id'], 'quantity': quantity, 'price': product['price']}]
+            }
+            sold = self.db.add_receipt(receipt)
 
-                if self.db.add_sale(sale_data):
-                    self.products = self.db.get_products()
-                    total = quantity * product['price']
-                    self.update_display()
-                    QMessageBox.information(self, "Продажа создана",
-                                            f"Продано {quantity} шт. товара '{product['name']}'\n"
-                                            f"На сумму: {total:,.0f} ₽")
-                else:
-                    QMessageBox.critical(self, "Ошибка", "Не удалось сохранить информацию о продаже")
+            self.products = self.db.get_products()
+            self.update_display()
+            if sold:
+                total = quantity * product['price']
+                self.notify(f"Продано {quantity} шт. товара '{product['name']}' на сумму {total:,.0f} ₽", "success")
             else:
                 QMessageBox.critical(self, "Ошибка", "Не удалось обновить количество товара")
 
     def write_off_product(self):
-        """Списать товар"""
-        product = self.get_selected_product()
-        if not product:
-            QMessageBox.warning(self, "Внимание", "Выберите товар для списания")
+        """Списать выбранные товары (полностью или частично) с общей причиной"""
+        product_ids = self.selected_product_ids()
+        if not product_ids:
+            QMessageBox.warning(self, "Внимание", "Выберите товары для списания")
+            return
+        # Списание - с места хранения, показанного в таблице
+        products = [dict(product, quantity=self.location_quantity(product))
+                    for product in (self.db.get_product(product_id) for product_id in product_ids)
+                    if product is not None]
+        products = [product for product in products if product['quantity'] > 0]
+        if not products:
+            self.notify("Выбранные товары уже отсутствуют на складе", "warning")
             return
 
-        reason, ok = QInputDialog.getText(self, "Списание товара", "Причина списания:")
-        if ok and reason:
-            if product['quantity'] > 0:
-                # Сохраняем информацию о списании
-                sale_data = {
-                    'product_id': product['id'],
-                    'product_name': product['name'],
-                    'quantity': product['quantity'],
-                    'price': product['price'],
-                    'type': f'Списание: {reason}'
-                }
+        reasons = self.db.get_write_off_reasons()
+        dialog = WriteOffDialog(products, reasons, self)
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+        receipt = dialog.receipt
+        receipt['location_id'] = self.locationCombo.currentData()
+        if dialog.reason_title:
+            # Новая причина создается вместе с чеком списания одной транзакцией
+            receipt['reason_title'] = dialog.reason_title
+        self.post_write_off(receipt)
+
+    def post_write_off(self, receipt):
+        """Проведение чека списания и обновление строк списанных товаров"""
+        # Списание оформляется одним чеком: все строки проводятся одной транзакцией
+        if not self.db.add_receipt(receipt):
+            QMessageBox.critical(self, "Ошибка", "Не удалось списать товары")
+            return
+        self.products = self.db.get_products()
+        for line in receipt['lines']:
+            product = self.db.get_product(line['product_id'])
+            if product is not None:
+                self.table_model.upsert_product(product)
+        self.update_stats()
+        quantity = sum(line['quantity'] for line in receipt['lines'])
+        reason = self.db.get_write_off_reasons().get(receipt['reason_code'], '')
+        self.notify(f"Списано товаров: {len(receipt['lines'])} ({quantity} шт.): {reason}", "success")
+
+    def load_locations(self):
+        """Список мест хранения для просмотра остатков (выбранное место сохраняется)"""
+        current = self.locationCombo.currentData()
+        self.locationCombo.blockSignals(True)
+        self.locationCombo.clear()
+        self.locationCombo.addItem("Все места", None)
+        for location in self.db.get_locations():
+            self.locationCombo.addItem(location['name'], location['id'])
+        self.locationCombo.setCurrentIndex(max(self.locationCombo.findData(current), 0))
+        self.locationCombo.blockSignals(False)
+
+    def show_location(self):
+        """Таблица склада по выбранному месту хранения: его товары и остатки"""
+        location_id = self.locationCombo.currentData()
+        if location_id is None:
+            stock = None
+        else:
+            stock = self.db.get_location_stock(location_id)
+        self.table_model.set_location_stock(stock)
+        self.table_proxy.set_location_ids(None if stock is None else [int(product_id) for product_id in stock])
+
+    def location_quantity(self, product):
+        """Остаток, с которого продает и списывает склад: на выбранном месте хранения (все места - склад)"""
+        location_id = self.locationCombo.currentData()
+        if location_id is None:
+            location_id = DEFAULT_LOCATION_ID
+        return self.db.stock_at(product['id'], location_id)
+
+    def transfer_products(self):
+        """Переместить выбранные товары на другое место хранения"""
+        products = [product for product in (self.db.get_product(product_id)
+                                            for product_id in self.selected_product_ids())
+                    if product is not None]
+        if not products:
+            QMessageBox.warning(self, "Внимание", "Выберите товары для перемещения")
+            return
+        dialog = TransferDialog(self.db, products, self.locationCombo.currentData(), self)
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+        transfer = dialog.transfer
+        if not self.db.transfer(transfer):
+            QMessageBox.critical(self, "Ошибка", "Не удалось переместить товары: остаток на месте изменился")
+            return
+        self.show_location()
+        quantity = sum(line['quantity'] for line in transfer['lines'])
+        self.notify(f"Перемещено: {dialog.source_combo.currentText()} → {dialog.target_combo.currentText()}, "
+                    f"{len(transfer['lines'])} товаров ({quantity} шт.)", "success")
 
-                if self.db.add_sale(sale_data):
-                    if self.db.update_product(product['id'], {'quantity': 0}):
-                        self.products = self.db.get_products()
-                        self.update_display()
-                        QMessageBox.information(self, "Списание",
-                                                f"Товар '{product['name']}' списан по причине: {reason}\n"
-                                                f"Списано {product['quantity']} шт.")
-                    else:
-                        QMessageBox.critical(self, "Ошибка", "Не удалось списать товар")
-                else:
-                    QMessageBox.critical(self, "Ошибка", "Не удалось сохранить информацию о списании")
-            else:
-                QMessageBox.information(self, "Списание", "Товар уже отсутствует на складе")
+    def show_expiring(self):
+        """Партии с истекающим сроком годности"""
+        dialog = ExpiringDialog(self.db, self)
+        if dialog.exec() == QDialog.DialogCode.Accepted and dialog.receipt['lines']:
+            self.post_write_off(dialog.receipt)
 
     def search_products(self):
         """Поиск товаров"""
-        search_text = self.ui.searchInput.text().strip()
-        if search_text:
-            # Используем метод поиска из базы данных
-            filtered_products = self.db.search_products(search_text)
-            self.table_model.update_data(filtered_products)
-            self.ui.statsLabel.setText(f"Найдено: {len(filtered_products)} товаров")
+        self.search_controller.run_now()
+
+    def apply_search_results(self, ids):
+        """Применение результата поиска к таблице"""
+        self.table_proxy.set_visible_ids(ids)
+        if ids is None:
+            self.update_stats()
         else:
-            # Показываем все товары
-            self.products = self.db.get_products()
-            self.update_display()
+            self.ui.statsLabel.setText(f"Найдено: {len(ids)} товаров")
 
     def show_filters(self):
         """Показать фильтры"""
@@ -1792,11 +5193,23 @@ class MainWindow(QMainWindow):
                                             "Выберите категорию:", categories, 0, False)
         if ok and category:
             filtered_products = self.db.filter_by_category(category)
-            self.table_model.update_data(filtered_products)
+            self.table_proxy.set_visible_ids({p['id'] for p in filtered_products})
             self.ui.statsLabel.setText(f"Категория: {category} | Товаров: {len(filtered_products)}")
 
     def closeEvent(self, event):
         """Обработка закрытия приложения"""
+        count = self.table_model.pending_count()
+        if count:
+            reply = QMessageBox.question(self, "Несохраненные правки",
+                                         f"Сохранить правки товаров ({count}) перед выходом?",
+                                         QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+                                         | QMessageBox.StandardButton.Cancel)
+            if reply == QMessageBox.StandardButton.Cancel:
+                event.ignore()
+                return
+            if reply == QMessageBox.StandardButton.Yes:
+                self.save_inline_edits()
+
         # Автоматическое сохранение при закрытии
         if self.db.save_data():
             print("Данные сохранены при закрытии приложения")
@@ -1806,9 +5219,23 @@ class MainWindow(QMainWindow):
 def main():
     # Создание приложения
     app = QApplication(sys.argv)
+    apply_theme(app)
+
+    # Режим нескольких касс: python main.py --server host:port
+    db = None
+    if "--server" in sys.argv[1:-1]:
+        from db_server import RemoteDatabaseManager, DEFAULT_PORT
+
+        address = sys.argv[sys.argv.index("--server") + 1]
+        host, _, port = address.partition(":")
+        try:
+            db = RemoteDatabaseManager(host, int(port) if port else DEFAULT_PORT)
+        except OSError as e:
+            QMessageBox.critical(None, "Ошибка", f"Не удалось подключиться к серверу {address}: {e}")
+            sys.exit(1)
 
     # Создание и отображение главного окна
-    window = MainWindow()
+    window = MainWindow(db)
     window.show()
 
     # Запуск главного цикла
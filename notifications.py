@@ -0,0 +1,104 @@
+"""Всплывающие уведомления, не блокирующие работу кассира.
+
+Сообщения ставятся в очередь и показываются по одному в углу окна,
+каждое скрывается автоматически. Повтор одного и того же сообщения
+не занимает очередь - у показанного уведомления растет счетчик (×N).
+Если сообщения приходят быстрее, чем их можно прочитать, очередь
+ограничена, а время показа каждого сокращается до min_interval.
+"""
+from collections import deque
+
+from PyQt6.QtCore import Qt, QObject, QTimer, QEvent
+from PyQt6.QtWidgets import QLabel
+
+from theme import styled, set_style_property
+
+LEVELS = ("info", "success", "warning", "error")
+
+
+class Toast(QLabel):
+    """Уведомление; скрывается по щелчку"""
+
+    def __init__(self, parent, on_click):
+        super().__init__(parent)
+        self.on_click = on_click
+        styled(self, "toast", state="info")
+        self.setWordWrap(True)
+        self.setMaximumWidth(420)
+        self.setAttribute(Qt.WidgetAttribute.WA_ShowWithoutActivating)
+        self.hide()
+
+    def mousePressEvent(self, event):
+        self.on_click()
+
+
+class NotificationCenter(QObject):
+    """Очередь уведомлений окна"""
+
+    def __init__(self, window, duration=2500, min_interval=600, max_queue=5, margin=16):
+        super().__init__(window)
+        self.window = window
+        self.duration = duration
+        self.min_interval = min_interval
+        self.margin = margin
+        self.queue = deque(maxlen=max_queue)  # [текст, уровень, количество]; старые вытесняются
+        self.current = None
+
+        self.toast = Toast(window, self.next)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.next)
+        window.installEventFilter(self)
+
+    def notify(self, text, level="info"):
+        """Показать уведомление (или поставить в очередь)"""
+        if level not in LEVELS:
+            level = "info"
+
+        # Повтор сообщения - увеличиваем счетчик вместо новой записи
+        if self.current is not None and self.current[:2] == [text, level]:
+            self.current[2] += 1
+            self.render()
+            self.timer.start(self.duration)
+            return
+        for entry in self.queue:
+            if entry[:2] == [text, level]:
+                entry[2] += 1
+                return
+
+        self.queue.append([text, level, 1])
+        if self.current is None:
+            self.next()
+        elif not self.timer.isActive() or self.timer.remainingTime() > self.min_interval:
+            # Очередь не пуста - текущее уведомление показываем не дольше min_interval
+            self.timer.start(self.min_interval)
+
+    def next(self):
+        """Показать следующее уведомление из очереди"""
+        if not self.queue:
+            self.current = None
+            self.toast.hide()
+            return
+        self.current = self.queue.popleft()
+        self.render()
+        self.toast.show()
+        self.toast.raise_()
+        self.timer.start(self.min_interval if self.queue else self.duration)
+
+    def render(self):
+        text, level, count = self.current
+        self.toast.setText(f"{text}  ×{count}" if count > 1 else text)
+        set_style_property(self.toast, "state", level)
+        self.toast.adjustSize()
+        self.place()
+
+    def place(self):
+        """Правый нижний угол окна"""
+        x = self.window.width() - self.toast.width() - self.margin
+        y = self.window.height() - self.toast.height() - self.margin * 2
+        self.toast.move(max(x, 0), max(y, 0))
+
+    def eventFilter(self, obj, event):
+        if obj is self.window and event.type() == QEvent.Type.Resize and self.toast.isVisible():
+            self.place()
+        return False
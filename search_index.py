@@ -0,0 +1,401 @@
+"""Поисковый индекс товаров.
+
+Индекс хранит нормализованный текст товара (название, артикул,
+штрихкод, категория, описание) и два набора структур:
+
+* триграммы полного текста - для точного поиска подстроки: запрос
+  сначала сужается пересечением списков триграмм, и только оставшиеся
+  кандидаты проверяются поиском подстроки;
+* словарь слов в транслитерированной форме - для нечеткого поиска:
+  «logitech», «логитек» и «Logitec» приводятся к близким формам, а
+  опечатки находятся автоматом Левенштейна среди слов, отобранных по
+  общим триграммам.
+
+Результат поиска упорядочен по релевантности. Поиск может выполняться
+в рабочем потоке: изменения индекса и запросы выполняются под
+блокировкой, а долгий запрос можно прервать функцией is_cancelled.
+"""
+import re
+import heapq
+import bisect
+import threading
+from operator import itemgetter
+from itertools import chain, islice
+from collections import Counter, defaultdict
+
+SEARCH_FIELDS = ("name", "sku", "barcode", "category", "description")
+
+# Вес совпадения в зависимости от поля товара
+FIELD_WEIGHTS = {"name": 1.0, "sku": 1.0, "barcode": 1.0, "category": 0.6, "description": 0.3}
+
+# Как часто долгий перебор проверяет отмену запроса
+CANCEL_CHECK_INTERVAL = 1000
+
+# Сколько слов словаря может дать один короткий префикс запроса
+PREFIX_EXPANSION_LIMIT = 500
+
+# Минимальная длина запроса (и начала слова для поиска по префиксу)
+MIN_QUERY_LENGTH = 2
+
+# Сколько слов словаря с наибольшим числом общих триграмм проверяется автоматом
+FUZZY_CANDIDATE_LIMIT = 200
+
+# Триграммы, встречающиеся в большем числе слов словаря (у артикулов и моделей - «mod», цифры),
+# не используются для отбора кандидатов нечеткого поиска
+FUZZY_TRIGRAM_LIMIT = 5000
+
+TOKEN_RE = re.compile(r"[0-9a-zа-я]+")
+HARD_C_RE = re.compile(r"c(?!h)")
+
+TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh",
+    "з": "z", "и": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n",
+    "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f",
+    "х": "h", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sch", "ъ": "", "ы": "i",
+    "ь": "", "э": "e", "ю": "yu", "я": "ya",
+}
+
+# Латинские написания, которые звучат одинаково
+LATIN_FOLDS = (("ph", "f"), ("ck", "k"), ("x", "ks"), ("w", "v"), ("q", "k"), ("y", "i"))
+
+
+def normalize(text):
+    """Приведение текста к виду для поиска"""
+    return text.lower().replace("ё", "е")
+
+
+def transliterate(token):
+    """Общая латинская форма слова для русского и английского написания"""
+    token = "".join(TRANSLIT.get(char, char) for char in token)
+    for source, target in LATIN_FOLDS:
+        token = token.replace(source, target)
+    # Отдельная «c» приводится к «k»: «logitec» и «логитек» дают одну форму
+    return HARD_C_RE.sub("k", token)
+
+
+def tokenize(text):
+    """Слова нормализованного текста в транслитерированной форме"""
+    return [transliterate(token) for token in TOKEN_RE.findall(text)]
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def token_trigrams(token):
+    """Триграммы слова с маркерами начала и конца"""
+    return trigrams(f"^{token}$")
+
+
+def max_edits(token):
+    """Допустимое число опечаток в зависимости от длины слова"""
+    if len(token) <= 3:
+        return 0
+    if len(token) <= 6:
+        return 1
+    return 2
+
+
+class LevenshteinAutomaton:
+    """Автомат Левенштейна для слова word с не более чем max_edits правками
+
+    Состояние - разреженная строка матрицы расстояний: позиции в word и
+    расстояния до них, не превышающие max_edits. Пустое состояние
+    означает, что совпадение уже невозможно, поэтому проверка слова
+    словаря обрывается на первых несовпадающих символах.
+    """
+
+    def __init__(self, word, max_edits):
+        self.word = word
+        self.max_edits = max_edits
+
+    def start(self):
+        positions = list(range(min(self.max_edits, len(self.word)) + 1))
+        return positions, positions[:]
+
+    def step(self, state, char):
+        positions, values = state
+        new_positions, new_values = [], []
+        if positions and positions[0] == 0 and values[0] < self.max_edits:
+            new_positions.append(0)
+            new_values.append(values[0] + 1)
+        for j, (i, value) in enumerate(zip(positions, values)):
+            if i == len(self.word):
+                break
+            cost = 0 if self.word[i] == char else 1
+            value += cost
+            if new_positions and new_positions[-1] == i:
+                value = min(value, new_values[-1] + 1)
+            if j + 1 < len(positions) and positions[j + 1] == i + 1:
+                value = min(value, values[j + 1] + 1)
+            if value <= self.max_edits:
+                new_positions.append(i + 1)
+                new_values.append(value)
+        return new_positions, new_values
+
+    def distance(self, state):
+        """Расстояние до word, если состояние допускающее, иначе None"""
+        positions, values = state
+        if positions and positions[-1] == len(self.word):
+            return values[-1]
+        return None
+
+    def match(self, text):
+        """Расстояние от text до word или None, если оно больше max_edits"""
+        state = self.start()
+        for char in text:
+            state = self.step(state, char)
+            if not state[0]:
+                return None
+        return self.distance(state)
+
+
+class ProductSearchIndex:
+    def __init__(self, products=()):
+        self._lock = threading.Lock()
+        self._reset()
+        if products:
+            self.rebuild(products)
+
+    def _reset(self):
+        self._texts = {}  # id товара -> нормализованный текст
+        self._postings = defaultdict(set)  # триграмма текста -> id товаров
+        self._product_tokens = {}  # id товара -> {слово: вес}
+        self._token_postings = defaultdict(dict)  # слово -> {id товара: вес}
+        self._vocab_trigrams = defaultdict(set)  # триграмма слова -> слова
+        self._vocab = []  # отсортированный словарь для поиска по префиксу
+
+    def __len__(self):
+        return len(self._texts)
+
+    @staticmethod
+    def product_text(product):
+        # Поля разделены переводом строки, чтобы подстрока запроса не склеивала соседние поля
+        return "\n".join(normalize(str(product.get(field) or "")) for field in SEARCH_FIELDS)
+
+    @staticmethod
+    def product_tokens(text):
+        """Слова товара с весом лучшего поля, в котором они встречаются"""
+        tokens = {}
+        for field, field_text in zip(SEARCH_FIELDS, text.split("\n")):
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(field_text):
+                if tokens.get(token, 0) < weight:
+                    tokens[token] = weight
+        return tokens
+
+    def rebuild(self, products):
+        """Построить индекс заново
+
+        Новый индекс строится без блокировки и подменяет старый целиком,
+        поэтому запросы во время перестроения отвечают по старому индексу.
+        """
+        fresh = ProductSearchIndex()
+        for product in list(products):
+            fresh._add(product["id"], self.product_text(product), bulk=True)
+        fresh._vocab = sorted(fresh._token_postings)
+        with self._lock:
+            self._texts = fresh._texts
+            self._postings = fresh._postings
+            self._product_tokens = fresh._product_tokens
+            self._token_postings = fresh._token_postings
+            self._vocab_trigrams = fresh._vocab_trigrams
+            self._vocab = fresh._vocab
+
+    def update(self, product):
+        """Добавить или обновить товар; возвращает False, если текст не изменился"""
+        text = self.product_text(product)
+        product_id = product["id"]
+        with self._lock:
+            old_text = self._texts.get(product_id)
+            if old_text == text:
+                return False
+            if old_text is not None:
+                self._discard(product_id)
+            self._add(product_id, text)
+        return True
+
+    def remove(self, product_id):
+        """Удалить товар из индекса"""
+        with self._lock:
+            if product_id in self._texts:
+                self._discard(product_id)
+
+    def _add(self, product_id, text, bulk=False):
+        self._texts[product_id] = text
+        for trigram in trigrams(text):
+            self._postings[trigram].add(product_id)
+        tokens = self.product_tokens(text)
+        self._product_tokens[product_id] = tokens
+        for token, weight in tokens.items():
+            postings = self._token_postings[token]
+            if not postings:
+                for trigram in token_trigrams(token):
+                    self._vocab_trigrams[trigram].add(token)
+                if not bulk:
+                    bisect.insort(self._vocab, token)
+            postings[product_id] = weight
+
+    def _discard(self, product_id):
+        text = self._texts.pop(product_id)
+        for trigram in trigrams(text):
+            ids = self._postings.get(trigram)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del self._postings[trigram]
+        for token in self._product_tokens.pop(product_id):
+            postings = self._token_postings[token]
+            postings.pop(product_id, None)
+            if not postings:
+                # Слово больше не встречается - убираем его из словаря
+                del self._token_postings[token]
+                for trigram in token_trigrams(token):
+                    words = self._vocab_trigrams.get(trigram)
+                    if words is not None:
+                        words.discard(token)
+                        if not words:
+                            del self._vocab_trigrams[trigram]
+                position = bisect.bisect_left(self._vocab, token)
+                if position < len(self._vocab) and self._vocab[position] == token:
+                    del self._vocab[position]
+
+    def search(self, query, is_cancelled=None, limit=None):
+        """Список id товаров, упорядоченный по релевантности
+
+        Товар подходит, если содержит запрос как подстроку или если
+        каждое слово запроса совпадает с каким-либо словом товара точно,
+        по началу слова (для последнего, еще набираемого слова) или с
+        допустимым числом опечаток. limit ограничивает число лучших
+        результатов. Возвращает None, если запрос был отменен.
+        """
+        query = normalize(query.strip())
+        with self._lock:
+            scores = self._substring_scores(query, is_cancelled)
+            if scores is None:
+                return None
+
+            query_tokens = tokenize(query)
+            token_scores = None
+            for position, token in enumerate(query_tokens):
+                if is_cancelled is not None and is_cancelled():
+                    return None
+                is_last = position == len(query_tokens) - 1
+                matches = self._match_token(token, prefix=is_last)
+                # Товар должен содержать все слова запроса
+                if token_scores is None:
+                    token_scores = matches
+                else:
+                    token_scores = {product_id: score + matches[product_id]
+                                    for product_id, score in token_scores.items() if product_id in matches}
+                if not token_scores:
+                    break
+
+            for product_id, score in (token_scores or {}).items():
+                scores[product_id] = scores.get(product_id, 0) + score
+
+        if limit is not None:
+            ranked = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        else:
+            ranked = sorted(scores.items(), key=itemgetter(1), reverse=True)
+        return [product_id for product_id, _ in ranked]
+
+    def _substring_scores(self, query, is_cancelled):
+        """Товары, содержащие запрос как подстроку, с оценкой по полю совпадения
+
+        Короткие запросы (до трех символов) ищутся только по началу слов.
+        """
+        if len(query) < 3:
+            return {}
+        candidates = None
+        # Начинаем с самых коротких списков, чтобы пересечение быстрее сужалось
+        for trigram in sorted(trigrams(query), key=lambda t: len(self._postings.get(t, ()))):
+            ids = self._postings.get(trigram)
+            if not ids:
+                return {}
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                return {}
+
+        scores = {}
+        texts = self._texts
+        for count, product_id in enumerate(candidates):
+            text = texts[product_id]
+            if is_cancelled is not None and count % CANCEL_CHECK_INTERVAL == 0 and is_cancelled():
+                return None
+            position = text.find(query)
+            if position < 0:
+                continue
+            field = SEARCH_FIELDS[text.count("\n", 0, position)]
+            scores[product_id] = FIELD_WEIGHTS[field]
+        return scores
+
+    def _fuzzy_candidates(self, query_trigrams, required):
+        """Слова словаря для проверки автоматом - с наибольшим числом общих с запросом триграмм
+
+        Кандидаты отбираются только по редким триграммам запроса: частые
+        (больше FUZZY_TRIGRAM_LIMIT слов) пропускаются, а если редких нет,
+        берется часть слов самой редкой из них. Поэтому перебор ограничен
+        и не растет со словарем. Слову нужно не меньше required общих
+        триграмм, из них в пропущенных могли быть все пропущенные.
+        """
+        vocab_trigrams = self._vocab_trigrams
+        ordered = sorted(query_trigrams, key=lambda trigram: len(vocab_trigrams.get(trigram, ())))
+        lists = [vocab_trigrams.get(trigram, ()) for trigram in ordered]
+        seeds = [words for words in lists if len(words) <= FUZZY_TRIGRAM_LIMIT]
+        if not seeds:
+            seeds = [islice(lists[0], FUZZY_TRIGRAM_LIMIT)]
+        minimum = max(required - (len(lists) - len(seeds)), 1)
+        shared = Counter(chain.from_iterable(seeds))
+        candidates = []
+        for word, count in shared.most_common(FUZZY_CANDIDATE_LIMIT):
+            if count < minimum:
+                break
+            candidates.append(word)
+        return candidates
+
+    def _match_token(self, token, prefix=False):
+        """Товары, содержащие слово token (точно, по началу или с опечатками)"""
+        matched_words = {}  # слово словаря -> оценка совпадения
+
+        if token in self._token_postings:
+            matched_words[token] = 1.0
+
+        if prefix and len(token) >= MIN_QUERY_LENGTH:
+            start = bisect.bisect_left(self._vocab, token)
+            for word in self._vocab[start:start + PREFIX_EXPANSION_LIMIT]:
+                if not word.startswith(token):
+                    break
+                if word != token:
+                    matched_words[word] = 0.6 + 0.3 * len(token) / len(word)
+
+        edits = max_edits(token)
+        if edits:
+            query_trigrams = token_trigrams(token)
+            # Каждая правка портит не более трех триграмм
+            required = len(query_trigrams) - 3 * edits
+            automaton = LevenshteinAutomaton(token, edits)
+            for word in self._fuzzy_candidates(query_trigrams, required):
+                if word in matched_words or abs(len(word) - len(token)) > edits:
+                    continue
+                count = len(query_trigrams & token_trigrams(word))
+                if count < required:
+                    continue
+                distance = automaton.match(word)
+                if distance is None:
+                    continue
+                similarity = count / len(query_trigrams | token_trigrams(word))
+                matched_words[word] = 0.5 * (1 - distance / len(token)) + 0.3 * similarity
+
+        products = {}
+        # Сначала лучшие совпадения: дальше товар получает оценку только один раз
+        for word, word_score in sorted(matched_words.items(), key=itemgetter(1), reverse=True):
+            postings = self._token_postings[word]
+            if not products:
+                products = {product_id: word_score * weight for product_id, weight in postings.items()}
+                continue
+            for product_id, weight in postings.items():
+                score = word_score * weight
+                if products.get(product_id, 0) < score:
+                    products[product_id] = score
+        return products
@@ -0,0 +1,83 @@
+"""Ежедневные снимки остатков товаров.
+
+Раз в день (при первой записи базы за день) количество всех товаров
+сохраняется в двоичный файл <архив>/stock-YYYY-MM-DD.bin: массив id и
+массив количеств (по 8 байт на число). Список снимков с временем их
+создания хранится в checkpoints.json; сами снимки читаются только когда
+нужны для запроса остатков на дату.
+"""
+import os
+import json
+import bisect
+from array import array
+
+from date_index import to_timestamp
+
+MANIFEST_FILE = "checkpoints.json"
+
+
+class StockCheckpoints:
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest = {}  # день -> {"file", "time", "count"}
+        self.times = []  # время снимков по возрастанию (ISO-строки)
+        self.load_manifest()
+
+    def load_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+        except (OSError, ValueError) as e:
+            print(f"Ошибка чтения списка снимков остатков: {e}")
+            self.manifest = {}
+        self.times = sorted(info["time"] for info in self.manifest.values())
+
+    def has(self, day):
+        """Есть ли снимок за день ('2026-10-19')"""
+        return day in self.manifest
+
+    def take(self, moment, products):
+        """Сохранить снимок остатков на момент moment (datetime)"""
+        ids = array('q', (product["id"] for product in products))
+        quantities = array('q', (int(product.get("quantity", 0)) for product in products))
+        day = moment.date().isoformat()
+        filename = f"stock-{day}.bin"
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, filename)
+        with open(path + ".tmp", "wb") as f:
+            ids.tofile(f)
+            quantities.tofile(f)
+        os.replace(path + ".tmp", path)
+
+        self.load_manifest()  # Снимки мог сделать и другой процесс
+        self.manifest[day] = {"file": filename, "time": moment.isoformat(), "count": len(ids)}
+        manifest_path = os.path.join(self.directory, MANIFEST_FILE)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        os.replace(manifest_path + ".tmp", manifest_path)
+        self.times = sorted(info["time"] for info in self.manifest.values())
+        print(f"Снимок остатков за {day}: {len(ids)} товаров")
+
+    def nearest(self, target):
+        """Ближайший к target снимок: (время, {id товара: количество}) или None"""
+        if not self.times:
+            return None
+        position = bisect.bisect_left(self.times, target)
+        candidates = self.times[max(position - 1, 0):position + 1]
+        target_timestamp = to_timestamp(target)
+        time = min(candidates, key=lambda candidate: abs(to_timestamp(candidate) - target_timestamp))
+        return time, self.load(time[:10])
+
+    def load(self, day):
+        """Количества товаров из снимка за день"""
+        info = self.manifest[day]
+        ids = array('q')
+        quantities = array('q')
+        with open(os.path.join(self.directory, info["file"]), "rb") as f:
+            ids.fromfile(f, info["count"])
+            quantities.fromfile(f, info["count"])
+        return dict(zip(ids, quantities))
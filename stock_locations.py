@@ -0,0 +1,76 @@
+"""Остатки товаров по местам хранения (склад, торговый зал, полки...).
+
+Общий остаток товара - по-прежнему product["quantity"]. Основное место
+(склад, DEFAULT_LOCATION_ID) держит все, что не разложено по другим
+местам, поэтому данные без мест хранения остаются верными как есть.
+Количество на остальных местах хранится картой
+{id товара: {id места: количество}} (ключи - строки, как в JSON),
+нулевые записи удаляются.
+
+Для ответов без перебора данных держатся два индекса:
+    место -> {товар: количество} - остатки одного места,
+    товар -> количество на всех неосновных местах - остаток основного места.
+"""
+
+DEFAULT_LOCATION_ID = 1  # Склад: остаток товара за вычетом других мест
+DEFAULT_LOCATIONS = [{"id": DEFAULT_LOCATION_ID, "name": "Склад"}, {"id": 2, "name": "Торговый зал"}]
+
+
+class LocationStock:
+    def __init__(self, stock):
+        self.stock = stock
+        self.on_change = None  # callback(товар, место, количество до изменения) - для отмены
+        self._by_location = {}  # id места -> {id товара: количество}
+        self._located = {}  # id товара -> количество на неосновных местах
+        for key, places in stock.items():
+            for location, quantity in places.items():
+                self._index(int(key), int(location), quantity)
+
+    def _index(self, product_id, location_id, delta):
+        products = self._by_location.setdefault(location_id, {})
+        quantity = products.get(product_id, 0) + delta
+        if quantity:
+            products[product_id] = quantity
+        else:
+            products.pop(product_id, None)
+        located = self._located.get(product_id, 0) + delta
+        if located:
+            self._located[product_id] = located
+        else:
+            self._located.pop(product_id, None)
+
+    def at(self, product_id, location_id):
+        """Количество товара на неосновном месте"""
+        return self._by_location.get(location_id, {}).get(product_id, 0)
+
+    def located(self, product_id):
+        """Количество товара на всех неосновных местах"""
+        return self._located.get(product_id, 0)
+
+    def products_at(self, location_id):
+        """Остатки неосновного места: {id товара: количество}"""
+        return self._by_location.get(location_id, {})
+
+    def change(self, product_id, location_id, delta):
+        """Изменить количество товара на неосновном месте на delta"""
+        previous = self.at(product_id, location_id)
+        if self.on_change is not None:
+            self.on_change(product_id, location_id, previous)
+        self.replace(product_id, location_id, previous + delta)
+
+    def replace(self, product_id, location_id, quantity):
+        """Записать количество товара на месте, вернуть прежнее"""
+        key, location = str(product_id), str(location_id)
+        places = self.stock.setdefault(key, {})
+        previous = places.pop(location, 0)
+        if quantity:
+            places[location] = quantity
+        elif not places:
+            del self.stock[key]
+        self._index(product_id, location_id, quantity - previous)
+        return previous
+
+    def clear_product(self, product_id):
+        """Убрать товар со всех неосновных мест (удаление товара)"""
+        for location in list(self.stock.get(str(product_id), {})):
+            self.change(product_id, int(location), -self.at(product_id, int(location)))
@@ -0,0 +1,72 @@
+"""Справочник поставщиков: единый ключ названия и подсказки по префиксу.
+
+Разные написания одного поставщика («ООО "Ромашка"», «ромашка»,
+«Ромашка ООО») приводятся к одному ключу: регистр, кавычки и знаки,
+организационно-правовая форма и лишние пробелы не учитываются.
+
+Ключи хранятся в префиксном дереве (trie) - с каждого слова ключа,
+поэтому «торг» находит и «Альфа Торг». Подсказка при вводе названия -
+обход поддерева префикса, без перебора всех поставщиков.
+"""
+import re
+
+WORD_RE = re.compile(r"[0-9a-zа-я]+")
+LEGAL_FORMS = {"ооо", "оао", "зао", "пао", "ао", "ип", "llc", "ltd", "inc", "gmbh"}
+
+# Показатели поставщика, которые пересчитываются с каждой закупкой
+SUPPLIER_TOTALS = ("spend", "purchases", "orders", "lead_days", "lead_orders", "last_date")
+PRICE_HISTORY = 20  # Сколько последних цен товара хранится у поставщика
+
+_END = ""  # Ключ узла trie со списком поставщиков, чей ключ здесь заканчивается
+
+
+def supplier_key(name):
+    """Ключ названия поставщика ('' - названия нет)"""
+    words = WORD_RE.findall(str(name or "").lower().replace("ё", "е"))
+    return " ".join(word for word in words if word not in LEGAL_FORMS)
+
+
+class SupplierTrie:
+    def __init__(self):
+        self.root = {}
+
+    def add(self, key, supplier_id):
+        """Добавить ключ поставщика (с каждого его слова)"""
+        for suffix in self._suffixes(key):
+            node = self.root
+            for char in suffix:
+                node = node.setdefault(char, {})
+            node.setdefault(_END, set()).add(supplier_id)
+
+    def remove(self, key, supplier_id):
+        for suffix in self._suffixes(key):
+            node = self.root
+            for char in suffix:
+                node = node.get(char)
+                if node is None:
+                    break
+            else:
+                node.get(_END, set()).discard(supplier_id)
+
+    def complete(self, prefix, limit=10):
+        """id поставщиков, ключ которых (или слово ключа) начинается с prefix"""
+        node = self.root
+        for char in supplier_key(prefix):
+            node = node.get(char)
+            if node is None:
+                return []
+        result = []
+        stack = [node]
+        while stack and len(result) < limit:
+            node = stack.pop()
+            for supplier_id in sorted(node.get(_END, ())):
+                if supplier_id not in result:
+                    result.append(supplier_id)
+            # Обход в алфавитном порядке ключей
+            stack.extend(node[char] for char in sorted(node, reverse=True) if char != _END)
+        return result[:limit]
+
+    @staticmethod
+    def _suffixes(key):
+        words = key.split(" ")
+        return [" ".join(words[i:]) for i in range(len(words)) if words[i]]
@@ -0,0 +1,224 @@
+"""DatabaseManager: слияние изменений нескольких процессов одного файла"""
+import json
+
+import pytest
+
+pytest.importorskip("PyQt6")
+
+from main import DatabaseManager  # noqa: E402
+
+
+def make_file(tmp_path, quantity=10):
+    filename = tmp_path / "database.json"
+    filename.write_text(json.dumps({"products": [{"id": 1, "name": "Молоко", "category": "Продукты",
+                                                  "quantity": quantity, "price": 80}],
+                                    "sales": [], "purchases": [], "last_id": 1}), encoding="utf-8")
+    return str(filename)
+
+
+def sell(db, quantity):
+    receipt = {"type": "Продажа", "lines": [{"product_id": 1, "quantity": quantity, "price": 80}]}
+    assert db.add_receipt(receipt)
+    return receipt
+
+
+def test_merge_renumbers_receipt_with_taken_id(tmp_path):
+    filename = make_file(tmp_path)
+    first, second = DatabaseManager(filename), DatabaseManager(filename)
+    first.autosave = second.autosave = False
+    assert sell(first, 2)["id"] == sell(second, 3)["id"]
+    assert first.commit()
+
+    assert second.commit()
+    totals = {receipt["total"]: receipt["id"] for receipt in second.data["receipts"]}
+    assert sorted(totals.values()) == [1, 2]
+    assert [line["quantity"] for line in second.get_receipt(totals[160])["lines"]] == [2]
+    renumbered = second.get_receipt(totals[240])
+    assert [line["quantity"] for line in renumbered["lines"]] == [3]
+    returnable = second.get_returnable(totals[240])
+    assert [line["returnable"] for line in returnable["lines"]] == [3]
+
+
+def test_merge_takes_lots_added_by_other_process(tmp_path):
+    filename = make_file(tmp_path)
+    first, second = DatabaseManager(filename), DatabaseManager(filename)
+    assert first.adjust_quantity(1, 5)
+    purchase = {"product_id": 1, "quantity": 5, "purchase_price": 50, "expiry": "2026-11-01"}
+    assert first.add_purchase(purchase)
+
+    second.check_external_changes()
+    assert list(second.cost_lots.lots["1"])[-1] == [5, 50, purchase["id"]]
+    assert [lot["purchase_id"] for lot in second.get_expiring(3650)] == [purchase["id"]]
+    assert second.add_sale({"product_id": 1, "quantity": 12, "price": 80})
+    assert second.expiry_lots.lots.get("1") is None
+
+
+def test_merge_keeps_local_lots_on_conflict(tmp_path):
+    filename = make_file(tmp_path)
+    first, second = DatabaseManager(filename), DatabaseManager(filename)
+    second.autosave = False
+    assert first.add_purchase({"product_id": 1, "quantity": 5, "purchase_price": 50})
+    assert second.add_purchase({"product_id": 1, "quantity": 2, "purchase_price": 40})
+
+    conflicts = second.check_external_changes()
+    assert {"collection": "cost_lots", "id": "1", "reason": "изменен и локально, и в файле"} in conflicts
+    assert [lot[:2] for lot in second.cost_lots.lots["1"]][-1] == [2, 40]
+
+
+def test_merge_takes_stock_moved_by_other_process(tmp_path):
+    filename = make_file(tmp_path)
+    first, second = DatabaseManager(filename), DatabaseManager(filename)
+    assert first.transfer({"from": 1, "to": 2, "lines": [{"product_id": 1, "quantity": 4}]})
+
+    second.check_external_changes()
+    assert second.stock_at(1, 2) == 4
+    assert second.get_location_stock(1) == {"1": 6}
+    assert second.get_location_stock(2) == {"1": 4}
+    assert second.transfer({"from": 2, "to": 1, "lines": [{"product_id": 1, "quantity": 4}]})
+    assert second.get_location_stock(2) == {}
+
+
+def test_merge_adds_supplier_totals_of_both_processes(tmp_path):
+    filename = make_file(tmp_path)
+    first = DatabaseManager(filename)
+    assert first.add_purchase({"product_id": 1, "quantity": 1, "purchase_price": 10, "supplier": "Ромашка"})
+    second = DatabaseManager(filename)
+    second.autosave = False
+    assert first.add_purchase({"product_id": 1, "quantity": 2, "purchase_price": 20, "supplier": "Ромашка"})
+    assert second.add_purchase({"product_id": 1, "quantity": 3, "purchase_price": 30, "supplier": "ООО Ромашка"})
+
+    assert second.commit()
+    [supplier] = second.get_suppliers()
+    assert (supplier["purchases"], supplier["spend"]) == (3, 10 + 40 + 90)
+    assert [price for _, price in supplier["prices"]["1"]] == [10, 20, 30]
+
+
+def test_merge_joins_supplier_added_by_both_processes(tmp_path):
+    filename = make_file(tmp_path)
+    first, second = DatabaseManager(filename), DatabaseManager(filename)
+    second.autosave = False
+    assert first.add_purchase({"product_id": 1, "quantity": 1, "purchase_price": 10, "supplier": "Альфа"})
+    assert first.add_purchase({"product_id": 1, "quantity": 1, "purchase_price": 10, "supplier": "Ромашка"})
+    assert second.add_purchase({"product_id": 1, "quantity": 2, "purchase_price": 20, "supplier": "Ромашка"})
+    assert second.add_purchase({"product_id": 1, "quantity": 1, "purchase_price": 5, "supplier": "Бета"})
+
+    assert second.commit()
+    names = {supplier["name"]: supplier for supplier in second.get_suppliers()}
+    assert sorted(names) == ["Альфа", "Бета", "Ромашка"]
+    assert len({supplier["id"] for supplier in names.values()}) == 3
+    assert names["Ромашка"]["purchases"] == 2
+    assert {purchase["supplier"]: purchase["supplier_id"] for purchase in second.data["purchases"]} == {
+        name: supplier["id"] for name, supplier in names.items()}
+
+
+def test_bulk_update_checks_value_type_per_field(tmp_path):
+    db = DatabaseManager(make_file(tmp_path))
+    assert not db.bulk_update({"field": "price", "operation": "set", "value": "сто"})
+    assert not db.bulk_update({"field": "price", "operation": "set", "value": -5})
+    assert not db.bulk_update({"field": "category", "operation": "set", "value": 5})
+    assert db.get_product(1)["price"] == 80 and db.get_product(1)["category"] == "Продукты"
+
+    assert db.bulk_update({"field": "price", "operation": "percent", "value": 10})
+    assert db.bulk_update({"field": "description", "operation": "set", "value": "Пастеризованное"})
+    assert db.get_product(1)["price"] == 88
+    assert db.get_product(1)["description"] == "Пастеризованное"
+
+
+def test_write_off_creates_reason_with_receipt(tmp_path):
+    db = DatabaseManager(make_file(tmp_path))
+    failed = {"type": "Списание", "reason_title": "Кража", "lines": [{"product_id": 1, "quantity": 50, "price": 80}]}
+    assert not db.add_receipt(failed)
+    assert "Кража" not in db.get_write_off_reasons().values()
+
+    receipt = {"type": "Списание", "reason_title": "Кража", "lines": [{"product_id": 1, "quantity": 2, "price": 80}]}
+    assert db.add_receipt(receipt)
+    assert db.get_write_off_reasons()[receipt["reason_code"]] == "Кража"
+    assert db.get_receipt(receipt["id"])["lines"][0]["reason_code"] == receipt["reason_code"]
+    assert db.undo()
+    assert "Кража" not in db.get_write_off_reasons().values()
+    assert db.get_product(1)["quantity"] == 10
+
+
+def test_merge_renumbers_product_added_by_both_processes(tmp_path):
+    filename = make_file(tmp_path)
+    first, second = DatabaseManager(filename), DatabaseManager(filename)
+    second.autosave = False
+    assert first.add_product({"name": "Хлеб", "category": "Продукты", "quantity": 3, "price": 40})
+    own = {"name": "Сыр", "category": "Продукты", "quantity": 1, "price": 500, "sku": "CH-1"}
+    assert second.add_product(own)
+    assert own["id"] == 2
+
+    assert second.commit()
+    assert {product["id"]: product["name"] for product in second.get_products()} == {1: "Молоко", 2: "Хлеб", 3: "Сыр"}
+    assert second.find_by_code("ch-1")["id"] == 3
+    with open(filename, encoding="utf-8") as file:
+        assert json.load(file)["last_id"] == 3
+    assert DatabaseManager(filename).get_product(3)["name"] == "Сыр"
+
+
+def test_return_is_limited_by_sold_quantity(tmp_path):
+    db = DatabaseManager(make_file(tmp_path))
+    receipt = {"type": "Продажа", "lines": [{"product_id": 1, "quantity": 4, "price": 80}]}
+    assert db.add_receipt(receipt)
+    sale_id = receipt["lines"][0]["id"]
+    assert db.get_product(1)["quantity"] == 6
+
+    refund = {"receipt_id": receipt["id"], "reason": "Брак", "lines": [{"sale_id": sale_id, "quantity": 3}]}
+    assert db.add_return(refund)
+    assert db.get_product(1)["quantity"] == 9
+    assert db.get_returnable(receipt["id"])["lines"][0]["returnable"] == 1
+    assert not db.add_return({"receipt_id": receipt["id"], "lines": [{"sale_id": sale_id, "quantity": 2}]})
+    assert db.get_product(1)["quantity"] == 9
+
+
+def test_undo_and_redo_receipt(tmp_path):
+    db = DatabaseManager(make_file(tmp_path))
+    receipt = {"type": "Продажа", "lines": [{"product_id": 1, "quantity": 4, "price": 80}]}
+    assert db.add_receipt(receipt)
+    assert db.history_label() == "Чек"
+
+    assert db.undo()
+    assert db.get_product(1)["quantity"] == 10
+    assert db.get_receipt(receipt["id"]) is None
+    assert db.can_redo() and not db.can_undo()
+
+    assert db.redo()
+    assert db.get_product(1)["quantity"] == 6
+    assert [line["quantity"] for line in db.get_receipt(receipt["id"])["lines"]] == [4]
+    assert DatabaseManager(db.filename).get_product(1)["quantity"] == 6
+
+
+def test_transfer_moves_stock_or_nothing(tmp_path):
+    db = DatabaseManager(make_file(tmp_path))
+    hall = db.add_location("Витрина")
+    assert db.transfer({"from": 1, "to": hall, "lines": [{"product_id": 1, "quantity": 4}]})
+    assert (db.stock_at(1), db.stock_at(1, hall)) == (6, 4)
+    assert not db.transfer({"from": hall, "to": 2, "lines": [{"product_id": 1, "quantity": 5}]})
+    assert (db.stock_at(1, hall), db.stock_at(1, 2)) == (4, 0)
+    assert len(db.get_transfers()) == 1
+
+    # Продажа с места хранения не может забрать больше, чем на нем лежит
+    assert not db.add_receipt({"type": "Продажа", "location_id": hall,
+                               "lines": [{"product_id": 1, "quantity": 5, "price": 80}]})
+    assert db.add_receipt({"type": "Продажа", "location_id": hall,
+                           "lines": [{"product_id": 1, "quantity": 4, "price": 80}]})
+    assert db.get_location_stock(hall) == {} and db.get_location_stock(1) == {"1": 6}
+
+    assert db.undo() and db.undo()
+    assert (db.stock_at(1), db.stock_at(1, hall)) == (10, 0)
+    assert db.get_transfers() == []
+
+
+def test_bulk_update_scope_and_undo(tmp_path):
+    db = DatabaseManager(make_file(tmp_path))
+    assert db.add_product({"name": "Мыло", "category": "Хозтовары", "quantity": 1, "price": 55})
+    update = {"field": "price", "operation": "round", "value": 10, "category": "Хозтовары"}
+    assert db.bulk_update(update)
+    assert update["changed"] == [2]
+    assert (db.get_product(1)["price"], db.get_product(2)["price"]) == (80, 60)
+
+    update = {"field": "category", "operation": "set", "value": "Разное", "product_ids": [1, 2]}
+    assert db.bulk_update(update)
+    assert {product["category"] for product in db.get_products()} == {"Разное"}
+    assert db.undo()
+    assert [product["category"] for product in db.get_products()] == ["Продукты", "Хозтовары"]
@@ -0,0 +1,55 @@
+"""Партии со сроком годности: FEFO и списание выбранной партии"""
+import json
+
+import pytest
+
+from expiry_lots import ExpiryLots
+
+
+def make_lots():
+    lots = ExpiryLots({})
+    lots.add(1, 5, "2026-11-01", 10)
+    lots.add(1, 4, "2026-12-01", 11)
+    return lots
+
+
+def test_allocate_takes_earliest_lot_first():
+    lots = make_lots()
+    assert lots.allocate(1, 6) == [[10, "2026-11-01", 5], [11, "2026-12-01", 1]]
+    assert lots.lots["1"] == [[3, "2026-12-01", 11]]
+
+
+def test_take_reduces_selected_later_lot():
+    lots = make_lots()
+    assert lots.take(1, [[11, "2026-12-01", 3]]) == [[11, "2026-12-01", 3]]
+    assert lots.lots["1"] == [[5, "2026-11-01", 10], [1, "2026-12-01", 11]]
+
+
+def test_take_is_limited_by_lot_quantity():
+    lots = make_lots()
+    assert lots.take(1, [[11, "2026-12-01", 9], [99, "2026-12-01", 1]]) == [[11, "2026-12-01", 4]]
+    assert lots.lots["1"] == [[5, "2026-11-01", 10]]
+    assert [lot[2] for _, lot in lots.expiring("2027-01-01")] == [10]
+
+
+def test_write_off_of_selected_lot_through_receipt(tmp_path):
+    pytest.importorskip("PyQt6")
+    from main import DatabaseManager
+
+    filename = tmp_path / "database.json"
+    filename.write_text(json.dumps({"products": [{"id": 1, "name": "Молоко", "category": "Продукты",
+                                                  "quantity": 0, "price": 80}],
+                                    "sales": [], "purchases": [], "last_id": 1}), encoding="utf-8")
+    db = DatabaseManager(str(filename))
+    for quantity, expiry in ((5, "2026-11-01"), (4, "2026-12-01")):
+        db.adjust_quantity(1, quantity)
+        db.add_purchase({"product_id": 1, "quantity": quantity, "purchase_price": 50, "expiry": expiry})
+    later = [lot for lot in db.get_expiring(365) if lot["expiry"] == "2026-12-01"][0]
+
+    receipt = {"type": "Списание", "reason_code": "expired",
+               "lines": [{"product_id": 1, "quantity": 2, "price": 80,
+                          "lots": [[later["purchase_id"], later["expiry"], 2]]}]}
+    assert db.add_receipt(receipt)
+    assert db.expiry_lots.lots["1"] == [[5, "2026-11-01", later["purchase_id"] - 1],
+                                        [2, "2026-12-01", later["purchase_id"]]]
+    assert db.get_receipt(receipt["id"])["lines"][0]["lots"] == [[later["purchase_id"], "2026-12-01", 2]]
@@ -0,0 +1,49 @@
+"""Поисковый индекс: нечеткий поиск по артикулам и моделям на большом каталоге"""
+import random
+import time
+
+import pytest
+
+from search_index import ProductSearchIndex, FUZZY_TRIGRAM_LIMIT, token_trigrams
+
+CATALOG_SIZE = 100000
+WORDS = ["мышь", "клавиатура", "кабель", "монитор", "ноутбук", "наушники", "колонки", "адаптер",
+         "logitech", "samsung", "xiaomi", "беспроводная", "игровая", "черный", "белый"]
+
+
+@pytest.fixture(scope="module")
+def catalog_index():
+    rng = random.Random(1)
+    products = [{"id": product_id, "name": f"{' '.join(rng.sample(WORDS, 2))} model{rng.randint(1, 99999)}",
+                 "sku": f"SKU-{product_id:06d}", "category": rng.choice(WORDS)}
+                for product_id in range(1, CATALOG_SIZE + 1)]
+    products.append({"id": CATALOG_SIZE + 1, "name": "Мышь Logitech model12345", "sku": "LG-12345",
+                     "category": "мышь"})
+    return ProductSearchIndex(products)
+
+
+def best_time(index, query, repeat=5):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        index.search(query, limit=50)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def test_common_trigrams_are_not_scanned(catalog_index):
+    # У моделей «model…» триграммы «^mo», «mod», «ode», «del» есть почти у каждого слова
+    assert len(catalog_index._vocab_trigrams["mod"]) > FUZZY_TRIGRAM_LIMIT
+    query_trigrams = token_trigrams("model123")
+    candidates = catalog_index._fuzzy_candidates(query_trigrams, len(query_trigrams) - 6)
+    assert 0 < len(candidates) <= 200
+
+
+@pytest.mark.parametrize("query", ["model123", "modle12345", "model9999"])
+def test_model_query_is_fast(catalog_index, query):
+    assert best_time(catalog_index, query) < 0.03
+
+
+def test_typo_in_model_is_found(catalog_index):
+    assert CATALOG_SIZE + 1 in catalog_index.search("modle12345")
+    assert catalog_index.search("логитек modle12345")[0] == CATALOG_SIZE + 1
@@ -0,0 +1,110 @@
+"""Сервер базы данных: запросы касс через RemoteDatabaseManager"""
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("PyQt6")
+
+from main import DatabaseManager  # noqa: E402
+from db_server import DatabaseServer, RemoteDatabaseManager  # noqa: E402
+
+
+@pytest.fixture
+def server(tmp_path):
+    filename = tmp_path / "database.json"
+    filename.write_text(json.dumps({"products": [{"id": 1, "name": "Молоко", "category": "Продукты",
+                                                  "quantity": 10, "price": 80},
+                                                 {"id": 2, "name": "Хлеб", "category": "Продукты",
+                                                  "quantity": 5, "price": 40}],
+                                    "sales": [], "purchases": [], "last_id": 2}), encoding="utf-8")
+    server = DatabaseServer(("127.0.0.1", 0), DatabaseManager(str(filename)), commit_interval=0.05)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    clients = []
+
+    def connect():
+        client = RemoteDatabaseManager(*server.server_address)
+        clients.append(client)
+        return client
+
+    yield connect
+    for client in clients:
+        client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_bulk_update_is_undone_through_client_history(server):
+    first, second = server(), server()
+    update = {"field": "price", "operation": "percent", "value": 10, "category": "Продукты"}
+    assert first.bulk_update(update)
+    assert sorted(update["changed"]) == [1, 2]
+    assert second.adjust_quantity(1, -1)
+    assert first.history_label() == "Массовое изменение"
+
+    assert first.undo()
+    assert [first.get_product(product_id)["price"] for product_id in (1, 2)] == [80, 40]
+    assert first.get_product(1)["quantity"] == 9
+    assert not first.can_undo() and first.can_redo()
+    assert second.history_label() == "Изменение остатка"
+
+    assert first.redo()
+    assert [second.get_product(product_id)["price"] for product_id in (1, 2)] == [88, 44]
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_receipt_round_trip_copies_ids_back(server, tmp_path):
+    client = server()
+    receipt = {"type": "Продажа", "lines": [{"product_id": 1, "quantity": 2, "price": 80},
+                                            {"product_id": 2, "quantity": 1, "price": 40}]}
+    assert client.add_receipt(receipt)
+    assert receipt["total"] == 200 and all("id" in line for line in receipt["lines"])
+    assert [line["quantity"] for line in client.get_receipt(receipt["id"])["lines"]] == [2, 1]
+
+    refund = {"receipt_id": receipt["id"], "lines": [{"sale_id": receipt["lines"][0]["id"], "quantity": 1}]}
+    assert client.add_return(refund)
+    assert [line["returnable"] for line in client.get_returnable(receipt["id"])["lines"]] == [1, 1]
+    assert client.get_product(1)["quantity"] == 9
+    assert client.save_data()
+    saved = DatabaseManager(str(tmp_path / "database.json"))
+    assert [line["quantity"] for line in saved.get_receipt(refund["id"])["lines"]] == [-1]
+
+
+def test_other_client_sees_changes(server):
+    first, second = server(), server()
+    events = []
+    second.add_listener(events.append)
+    assert second.get_product(1)["quantity"] == 10  # Ответ попадает в кэш второго клиента
+
+    assert first.adjust_quantity(1, -3)
+    assert wait_for(lambda: any(event["collection"] == "products" for event in events))
+    assert all(event.get("external") for event in events)
+    assert second.get_product(1)["quantity"] == 7
+
+
+def test_batch_is_rolled_back_as_a_whole(server):
+    client = server()
+    with client.transaction() as tx:
+        client.adjust_quantity(1, -2)
+        client.adjust_quantity(2, -50)
+    assert not tx.ok
+    assert (client.get_product(1)["quantity"], client.get_product(2)["quantity"]) == (10, 5)
+    assert not client.can_undo()
+
+    with client.transaction() as tx:
+        client.adjust_quantity(1, -2)
+        client.transfer({"from": 1, "to": 2, "lines": [{"product_id": 1, "quantity": 3}]})
+    assert tx.ok
+    assert (client.stock_at(1), client.stock_at(1, 2)) == (5, 3)
+    assert client.undo()
+    assert (client.stock_at(1), client.stock_at(1, 2)) == (10, 0)
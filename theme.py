@@ -0,0 +1,212 @@
+"""Оформление приложения: светлая палитра и общая таблица стилей.
+
+Таблица стилей устанавливается один раз на все приложение. Виджеты не
+задают собственных стилей - вид определяется динамическими свойствами:
+    role   - назначение виджета (primary, success, danger, title, ...)
+    size   - размер кнопки (large)
+    active - активная кнопка навигации
+    state  - состояние индикатора или уровень уведомления (ok, error, success, ...)
+
+После изменения свойства у уже показанного виджета нужно вызвать
+repolish(), чтобы Qt пересчитал стиль только этого виджета.
+"""
+from PyQt6.QtGui import QColor, QPalette
+
+# Цвета кнопок: роль -> (фон, фон при наведении, текст)
+BUTTON_COLORS = {
+    "primary": ("#007bff", "#0056b3", "white"),
+    "secondary": ("#6c757d", "#545b62", "white"),
+    "info": ("#17a2b8", "#138496", "white"),
+    "success": ("#28a745", "#218838", "white"),
+    "danger": ("#dc3545", "#c82333", "white"),
+    "warning": ("#ffc107", "#e0a800", "#212529"),
+}
+
+BASE_STYLESHEET = """
+QPushButton[role] {
+    padding: 8px 16px;
+    border: none;
+    border-radius: 4px;
+}
+QPushButton[size="large"] {
+    padding: 12px 24px;
+    border-radius: 6px;
+    font-size: 16px;
+    font-weight: bold;
+}
+QPushButton[role="secondary"]:checked {
+    background-color: #28a745;
+}
+
+QWidget#navPanel QPushButton {
+    text-align: left;
+    padding: 12px 15px;
+    border: none;
+    border-left: 3px solid transparent;
+    background-color: transparent;
+    color: #2c3e50;
+}
+QWidget#navPanel QPushButton:hover {
+    background-color: #e9ecef;
+}
+QWidget#navPanel QPushButton[active="true"] {
+    background-color: #007bff;
+    color: white;
+    border-left: 3px solid #0056b3;
+}
+
+QLineEdit[role="search"] {
+    padding: 8px 12px;
+    border: 1px solid #ced4da;
+    border-radius: 4px;
+    font-size: 14px;
+}
+QLineEdit[role="search"]:focus {
+    border-color: #007bff;
+}
+QLineEdit[role="scanner"] {
+    padding: 8px 12px;
+    border: 2px solid #28a745;
+    border-radius: 4px;
+    font-size: 14px;
+}
+QLineEdit[role="form"], QSpinBox[role="form"], QComboBox[role="form"] {
+    padding: 6px;
+    border: 1px solid #ced4da;
+    border-radius: 4px;
+}
+
+QLabel[role="title"] {
+    font-size: 20px;
+    font-weight: bold;
+    color: #2c3e50;
+}
+QLabel[role="dialogTitle"] {
+    font-size: 18px;
+    font-weight: bold;
+    margin: 10px;
+}
+QLabel[role="stats"] {
+    font-size: 14px;
+    margin: 5px;
+}
+QLabel[role="status"] {
+    font-size: 14px;
+    font-weight: bold;
+}
+QLabel[role="status"][state="ok"] {
+    color: #28a745;
+}
+QLabel[role="status"][state="error"] {
+    color: #dc3545;
+}
+QLabel[role="total"] {
+    font-size: 16px;
+    font-weight: bold;
+    color: #d32f2f;
+    background-color: #ffebee;
+    padding: 8px 16px;
+    border-radius: 4px;
+    border: 1px solid #f44336;
+}
+
+QLabel[role="toast"] {
+    color: white;
+    background-color: #343a40;
+    padding: 10px 16px;
+    border-radius: 6px;
+    font-size: 14px;
+}
+QLabel[role="toast"][state="success"] {
+    background-color: #28a745;
+}
+QLabel[role="toast"][state="warning"] {
+    color: #212529;
+    background-color: #ffc107;
+}
+QLabel[role="toast"][state="error"] {
+    background-color: #dc3545;
+}
+
+QTableView[role="list"] {
+    alternate-background-color: #f8f9fa;
+    gridline-color: #dee2e6;
+    selection-background-color: #007bff;
+}
+QTableView[role="list"][accent="info"] {
+    selection-background-color: #17a2b8;
+}
+QTableView[role="list"]::item {
+    padding: 8px;
+    border-bottom: 1px solid #dee2e6;
+}
+QTableView[role="list"] QHeaderView::section {
+    background-color: #e9ecef;
+    padding: 8px;
+    border: none;
+    border-right: 1px solid #dee2e6;
+    font-weight: bold;
+}
+"""
+
+
+def build_stylesheet():
+    """Таблица стилей приложения (правила кнопок генерируются по BUTTON_COLORS)"""
+    rules = [BASE_STYLESHEET]
+    for role, (background, hover, color) in BUTTON_COLORS.items():
+        rules.append(f'QPushButton[role="{role}"] {{ background-color: {background}; color: {color}; }}\n'
+                     f'QPushButton[role="{role}"]:hover {{ background-color: {hover}; }}\n')
+    return "\n".join(rules)
+
+
+STYLESHEET = build_stylesheet()
+
+
+def light_palette():
+    """Светлая цветовая палитра"""
+    palette = QPalette()
+    palette.setColor(QPalette.ColorRole.Window, QColor(255, 255, 255))
+    palette.setColor(QPalette.ColorRole.WindowText, QColor(0, 0, 0))
+    palette.setColor(QPalette.ColorRole.Base, QColor(255, 255, 255))
+    palette.setColor(QPalette.ColorRole.AlternateBase, QColor(245, 245, 245))
+    palette.setColor(QPalette.ColorRole.ToolTipBase, QColor(255, 255, 255))
+    palette.setColor(QPalette.ColorRole.ToolTipText, QColor(0, 0, 0))
+    palette.setColor(QPalette.ColorRole.Text, QColor(0, 0, 0))
+    palette.setColor(QPalette.ColorRole.Button, QColor(240, 240, 240))
+    palette.setColor(QPalette.ColorRole.ButtonText, QColor(0, 0, 0))
+    palette.setColor(QPalette.ColorRole.BrightText, QColor(255, 0, 0))
+    palette.setColor(QPalette.ColorRole.Link, QColor(0, 120, 215))
+    palette.setColor(QPalette.ColorRole.Highlight, QColor(0, 120, 215))
+    palette.setColor(QPalette.ColorRole.HighlightedText, QColor(255, 255, 255))
+    return palette
+
+
+def apply_theme(app):
+    """Установка темы для всего приложения (один раз при запуске)"""
+    app.setPalette(light_palette())
+    # Стиль, который хорошо работает на всех платформах
+    app.setStyle('Fusion')
+    app.setStyleSheet(STYLESHEET)
+
+
+def styled(widget, role, **properties):
+    """Назначить виджету роль (и другие свойства стиля) до его показа"""
+    widget.setProperty("role", role)
+    for name, value in properties.items():
+        widget.setProperty(name, value)
+    return widget
+
+
+def set_style_property(widget, name, value):
+    """Изменить свойство стиля у показанного виджета"""
+    if widget.property(name) == value:
+        return
+    widget.setProperty(name, value)
+    repolish(widget)
+
+
+def repolish(widget):
+    """Пересчет стиля одного виджета после изменения его свойств"""
+    style = widget.style()
+    style.unpolish(widget)
+    style.polish(widget)
@@ -0,0 +1,83 @@
+"""История изменений данных для отмены и повтора операций.
+
+Шаг истории - список дельт, сделанных одной операцией DatabaseManager
+или одной транзакцией. Дельта описывает только само изменение, а не
+копию данных:
+    ("field", id товара, поле, прежнее значение, новое значение)
+    ("insert", коллекция, позиция, запись)  - запись добавлена
+    ("remove", коллекция, позиция, запись)  - запись удалена
+    ("lots", товар, очередь партий до изменения)
+Записи в дельтах хранятся ссылками на те же словари, что и в данных.
+
+Откат шага применяет обратные дельты в обратном порядке и дает шаг для
+повтора - повтор выполняется тем же откатом. Глубина истории
+ограничена числом шагов и общим числом дельт в них.
+"""
+from collections import deque
+
+UNDO_DEPTH = 50  # Шагов отмены
+MAX_DELTAS = 20000  # Дельт во всех шагах отмены
+
+MISSING = object()  # Поля не было в записи
+
+
+class UndoHistory:
+    def __init__(self, depth=UNDO_DEPTH, max_deltas=MAX_DELTAS):
+        self.depth = depth  # 0 - история не ведется
+        self.max_deltas = max_deltas
+        self._undo = deque()  # (название, дельты), последний шаг - справа
+        self._redo = []
+        self._size = 0  # Дельт в шагах отмены
+
+    def push(self, label, deltas):
+        """Шаг новой операции (очищает повтор); False - шаг не записан"""
+        if not deltas or self.depth <= 0:
+            return False
+        self._redo.clear()
+        self._push_undo(label, deltas)
+        return True
+
+    def _push_undo(self, label, deltas):
+        self._undo.append((label, deltas))
+        self._size += len(deltas)
+        self._trim()
+
+    def _trim(self):
+        """Старые шаги отбрасываются сверх глубины истории"""
+        while self._undo and (len(self._undo) > self.depth or self._size > self.max_deltas):
+            _, dropped = self._undo.popleft()
+            self._size -= len(dropped)
+        if self.depth <= 0:
+            self._redo.clear()
+
+    def pop(self, redo=False):
+        """Последний шаг отмены (или повтора): (название, дельты) или None"""
+        if redo:
+            return self._redo.pop() if self._redo else None
+        if not self._undo:
+            return None
+        label, deltas = self._undo.pop()
+        self._size -= len(deltas)
+        return label, deltas
+
+    def put(self, label, deltas, redo=False):
+        """Положить откаченный шаг в повтор (или повторенный - в отмену)"""
+        if redo:
+            self._redo.append((label, deltas))
+        else:
+            self._push_undo(label, deltas)
+
+    def label(self, redo=False):
+        """Название шага, который будет отменен (повторен), или None"""
+        steps = self._redo if redo else self._undo
+        return steps[-1][0] if steps else None
+
+    def set_depth(self, depth):
+        """Изменить глубину истории (лишние старые шаги отбрасываются)"""
+        self.depth = max(depth, 0)
+        self._trim()
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self._size = 0